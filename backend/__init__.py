@@ -0,0 +1,15 @@
+from .log_store import LogStore
+from .broadcaster import Broadcaster
+from .node_registry import NodeRecord, NodeRegistry
+from .liveness import LivenessTracker
+from .metrics_store import MetricsStore
+from .mac_table import MacTable
+from .ingest import IngestPipeline
+from .render_cache import RenderCache
+from .pacing import IntervalAdvisor
+from .log_archive import LogArchive
+from .commands import Command, CommandTracker
+from .shared_state import LeaderLock, SharedState, SharedMacTable, SharedWriter, StateMirror
+from .tts import TtsService
+
+__all__ = ["LogStore", "Broadcaster", "NodeRecord", "NodeRegistry", "LivenessTracker", "MetricsStore", "MacTable", "IngestPipeline", "RenderCache", "IntervalAdvisor", "LogArchive", "Command", "CommandTracker", "LeaderLock", "SharedState", "SharedMacTable", "SharedWriter", "StateMirror", "TtsService"]
\ No newline at end of file
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Callable
+
+from .log_store import LEVEL_ORDER
+
+KEEPALIVE_INTERVAL = 15  # seconds between SSE comments on an idle stream
+
+
+class Subscriber:
+    """Pending updates for one streaming client.
+
+    Status updates are coalesced per node (only the newest one is kept), log
+    lines queue up to `max_pending`. A client that falls further behind than
+    that is dropped rather than buffered without limit.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, min_level: str = "D", max_pending: int = 1000) -> None:
+        self.loop = loop
+        self.min_level = LEVEL_ORDER.get(min_level, 0)
+        self.max_pending = max_pending
+        self.statuses: dict[str, dict[str, Any]] = {}
+        self.removed: set[str] = set()
+        self.logs: deque[dict[str, Any]] = deque()
+        self.dropped = False
+        self.wakeup = asyncio.Event()
+        self._signalled = False
+        self._lock = threading.Lock()
+
+    def _signal(self) -> None:
+        # Caller holds the lock. Only wake the loop once per batch of updates.
+        if self._signalled:
+            return
+        self._signalled = True
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            # Event loop already closed
+            self.dropped = True
+
+    def push_status(self, node: dict[str, Any]) -> None:
+        with self._lock:
+            if self.dropped:
+                return
+            uid = node["uid"]
+            self.removed.discard(uid)
+            self.statuses[uid] = node
+            self._signal()
+
+    def push_removed(self, uid: str) -> None:
+        with self._lock:
+            if self.dropped:
+                return
+            self.statuses.pop(uid, None)
+            self.removed.add(uid)
+            self._signal()
+
+    def push_log(self, entry: dict[str, Any]) -> None:
+        if LEVEL_ORDER.get(entry.get("level"), 1) < self.min_level:
+            return
+        with self._lock:
+            if self.dropped:
+                return
+            if len(self.logs) >= self.max_pending:
+                # Slow consumer, give up on it instead of growing without bound
+                self.dropped = True
+                self.logs.clear()
+                self.statuses.clear()
+            else:
+                self.logs.append(entry)
+            self._signal()
+
+    def take(self) -> tuple[list[dict[str, Any]], list[str], list[dict[str, Any]]]:
+        with self._lock:
+            statuses = list(self.statuses.values())
+            removed = list(self.removed)
+            logs = list(self.logs)
+            self.statuses.clear()
+            self.removed.clear()
+            self.logs.clear()
+            self._signalled = False
+            self.wakeup.clear()
+        return statuses, removed, logs
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Broadcaster:
+    """Fans out node status changes and log lines to streaming clients.
+
+    The publish methods are called from the MQTT network thread and never block
+    on a client: they only touch that client's pending buffers.
+    """
+
+    def __init__(self, max_pending: int = 1000) -> None:
+        self.max_pending = max_pending
+        self._subscribers: tuple[Subscriber, ...] = ()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def pending(self) -> int:
+        """Updates queued across all clients and not yet sent."""
+        return sum(len(s.statuses) + len(s.removed) + len(s.logs) for s in self._subscribers)
+
+    def subscribe(self, min_level: str = "D") -> Subscriber:
+        subscriber = Subscriber(asyncio.get_running_loop(), min_level=min_level, max_pending=self.max_pending)
+        with self._lock:
+            self._subscribers = self._subscribers + (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscriber)
+
+    # The subscriber tuple is replaced, never mutated, so publishers can iterate it without locking
+    def publish_status(self, node: dict[str, Any]) -> None:
+        for subscriber in self._subscribers:
+            subscriber.push_status(node)
+
+    def publish_removed(self, uid: str) -> None:
+        for subscriber in self._subscribers:
+            subscriber.push_removed(uid)
+
+    def publish_log(self, entry: dict[str, Any]) -> None:
+        for subscriber in self._subscribers:
+            subscriber.push_log(entry)
+
+    async def stream(self, snapshot: Callable[[], dict[str, Any]], min_level: str = "D") -> AsyncIterator[str]:
+        """Yields SSE frames: one `snapshot` event, then `nodes`, `removed` and `logs` events."""
+        # Subscribe before taking the snapshot so nothing falls in between
+        subscriber = self.subscribe(min_level=min_level)
+        try:
+            yield sse_event("snapshot", snapshot())
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscriber.dropped:
+                    yield sse_event("dropped", {"reason": "client too slow"})
+                    return
+                statuses, removed, logs = subscriber.take()
+                if statuses:
+                    yield sse_event("nodes", statuses)
+                if removed:
+                    yield sse_event("removed", removed)
+                if logs:
+                    yield sse_event("logs", logs)
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+PENDING = "pending"
+DONE = "done"          # every target acknowledged successfully
+PARTIAL = "partial"    # finished, some targets failed or never answered
+FAILED = "failed"      # finished, no target succeeded
+
+
+class Command:
+    """One dispatched command and what each target node answered."""
+
+    def __init__(self, action: str, args: list, targets: set[str], topic: Optional[str], timeout: float, retries: int) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.action = action
+        self.args = args
+        self.topic = topic
+        self.targets = targets
+        self.created = time.time()
+        self.timeout = timeout
+        self.retries_left = retries
+        self.deadline = self.created + timeout
+        self.results: dict[str, dict[str, Any]] = {}
+        self.finished: Optional[float] = None
+
+    def payload(self) -> str:
+        return json.dumps({"id": self.id, "action": self.action, "args": self.args})
+
+    def missing(self) -> set[str]:
+        return self.targets - self.results.keys()
+
+    @property
+    def status(self) -> str:
+        if self.finished is None:
+            return PENDING
+        succeeded = sum(1 for result in self.results.values() if result.get("ok"))
+        if succeeded == len(self.targets):
+            return DONE
+        return PARTIAL if succeeded else FAILED
+
+    def summary(self, details: bool = False) -> dict[str, Any]:
+        # Acks arrive on the MQTT thread, work on a copy (dict() of a dict is atomic)
+        results = dict(self.results)
+        succeeded = [uid for uid, result in results.items() if result.get("ok")]
+        missing = len(self.targets) - len(results)
+        summary = {
+            "id": self.id,
+            "action": self.action,
+            "args": self.args,
+            "topic": self.topic,
+            "status": self.status,
+            "created": self.created,
+            "finished": self.finished,
+            "targets": len(self.targets),
+            "succeeded": len(succeeded),
+            "failed": len(results) - len(succeeded),
+            "pending": missing if self.finished is None else 0,
+            "timed_out": missing if self.finished is not None else 0,
+        }
+        if details:
+            summary["results"] = {
+                uid: results.get(uid, {"ok": False, "error": "timeout" if self.finished else "pending"})
+                for uid in sorted(self.targets)
+            }
+        return summary
+
+
+class CommandTracker:
+    """Publishes commands, collects acks from node/<uid>/ack and retries nodes that stay quiet.
+
+    A command goes out once on its fan-out topic (a group or everyone), or
+    without one on each target's node/<uid>/command topic. Targets that have not answered within `timeout` get it again on
+    their own topic, up to `retries` times; nodes ignore ids they already ran,
+    so a retry never executes twice. Finished commands are kept for
+    inspection, the oldest beyond `history` are forgotten.
+    """
+
+    def __init__(self,
+                 publish: Callable[[str, str], Any],
+                 timeout: float = 5.0,
+                 retries: int = 2,
+                 history: int = 1000) -> None:
+        self.publish = publish
+        self.timeout = timeout
+        self.retries = retries
+        self.history = history
+        self._commands: OrderedDict[str, Command] = OrderedDict()
+        self._pending: dict[str, Command] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def dispatch(self, action: str, args: list, targets: set[str], topic: Optional[str] = None) -> Command:
+        """Sends `action` on `topic` (or every target's own topic) and tracks an ack from every uid in `targets`."""
+        command = Command(action, list(args), set(targets), topic, self.timeout, self.retries)
+        with self._lock:
+            self._commands[command.id] = command
+            while len(self._commands) > self.history:
+                old_id, _ = self._commands.popitem(last=False)
+                self._pending.pop(old_id, None)
+            if targets:
+                self._pending[command.id] = command
+            else:
+                command.finished = command.created
+        payload = command.payload()
+        if topic is not None:
+            self.publish(topic, payload)
+        else:
+            for uid in command.targets:
+                self.publish(f"node/{uid}/command", payload)
+        return command
+
+    def ack(self, uid: str, data: dict[str, Any]) -> Optional[Command]:
+        """Records a node's answer, returns the command when this ack finished it."""
+        with self._lock:
+            command = self._pending.get(data.get("id"))
+            if command is None or uid not in command.targets:
+                return None
+            command.results[uid] = {"ok": bool(data.get("ok")), **({"error": data["error"]} if data.get("error") else {})}
+            if command.missing():
+                return None
+            command.finished = time.time()
+            del self._pending[command.id]
+            return command
+
+    def expire(self, now: float) -> list[Command]:
+        """Retries or gives up on overdue commands, returns the ones that timed out for good."""
+        retries = []
+        timed_out = []
+        with self._lock:
+            for command in list(self._pending.values()):
+                if command.deadline > now:
+                    continue
+                if command.retries_left > 0:
+                    command.retries_left -= 1
+                    command.deadline = now + command.timeout
+                    retries.append((command, command.missing()))
+                else:
+                    command.finished = now
+                    del self._pending[command.id]
+                    timed_out.append(command)
+        for command, missing in retries:
+            payload = command.payload()
+            for uid in missing:
+                self.publish(f"node/{uid}/command", payload)
+        return timed_out
+
+    def get(self, command_id: str) -> Optional[Command]:
+        return self._commands.get(command_id)
+
+    def recent(self, limit: int = 50) -> list[Command]:
+        with self._lock:
+            commands = list(self._commands.values())[-limit:] if limit > 0 else []
+        commands.reverse()
+        return commands
@@ -2,189 +2,790 @@ from contextlib import asynccontextmanager
 from datetime import datetime
 import random
 import string
-from time import time, sleep
-from fastapi import FastAPI, Request
+from time import time, perf_counter
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import asyncio
 import paho.mqtt.client as mqtt
 import json
 from typing import Any
-from common import Log, LogLevel
+from functools import lru_cache, partial
+import uuid
+import sqlite3
+from common import Log, LogLevel, wire
+from .log_store import LogStore
+from .broadcaster import Broadcaster
+from .node_registry import NodeRecord, NodeRegistry
+from .liveness import LivenessTracker, OFFLINE
+from .metrics_store import MetricsStore
+from .mac_table import MacTable
+from .ingest import IngestPipeline
+from .commands import Command, CommandTracker
+from .log_archive import LogArchive
+from .pacing import IntervalAdvisor
+from .shared_state import LeaderLock, SharedMacTable, SharedState, SharedWriter, StateMirror, leader_lock_path
+from .tts import TtsService, load_model, wav_header
+from .render_cache import RenderCache, IDENTITY, dumps, pick_encoding
+from .instrumentation import Registry, RequestTimer, SamplingProfiler, watch_loop_lag
 import os
 
 MAC_TABLE_PATH = "mac_table.json"
+METRICS_DIR = "metrics"
+LOG_ARCHIVE_DIR = "log_archive"
+LOG_ARCHIVE_RETENTION = 30 * 86400  # seconds of logs kept on disk
 BROKER = "localhost"
 SERVER_HEARTBEAT_INTERVAL = 2       # seconds
+MAX_STATUS_INTERVAL = 30            # seconds, upper bound of the interval recommended to nodes
+OFFLINE_INTERVAL_FACTOR = 2.5       # a node is offline after missing this many of its advertised intervals
 NODE_OFFLINE_TIMEOUT = 5            # seconds
 NODE_REMOVAL_TIMEOUT = 300          # seconds
 LOGGING_LEVEL = LogLevel.INFO
+LOG_CAPACITY = 1000                 # entries kept in memory
+RENDER_CACHE_ENTRIES = 64           # distinct pre-rendered /api/nodes and /api/logs bodies kept
+INGEST_CAPACITY = 10000             # queued log payloads before the overflow policy kicks in
+INGEST_BATCH_SIZE = 1000            # log payloads applied per batch
+INGEST_STATUS_BACKLOG = 16          # queued status payloads per node before the oldest is dropped
+STREAM_MAX_PENDING = 1000           # queued log lines before a streaming client is dropped
+COMMAND_TIMEOUT = 5                 # seconds before an unacknowledged command is sent again
+COMMAND_RETRIES = 2                 # resends per node before a command counts as timed out
+METRICS_FLUSH_INTERVAL = 10         # seconds between writing buffered metrics to disk
+METRICS_EXPIRE_INTERVAL = 3600      # seconds between retention sweeps
+PROFILER_MAX_HZ = 1000              # highest sampling rate /api/profiler accepts
+# SQLite file shared by several backend processes (uvicorn --workers N), unset for a single process
+SHARED_STATE_PATH = os.environ.get("PINEST_SHARED_STATE")
+SHARED_SYNC_INTERVAL = 0.2          # seconds between syncs with the shared state
+LEADER_RETRY_INTERVAL = 1           # seconds between attempts of a worker to become leader
+# "xtts", "stub" (no downloads, for tests) or "off". Off unless asked for: every worker loads its own
+# model and audio cache, so enable it for a single worker
+TTS_MODEL = os.environ.get("PINEST_TTS", "off")
+TTS_VOICES_DIR = "voices"           # reference recordings, one <speaker>.wav per voice
+TTS_CACHE_BYTES = 64 * 1024 * 1024  # synthesized audio kept for repeated phrases
+TTS_SPEAKER_CACHE = 16              # voices whose conditioning latents are kept
 
-nodes = {}
-logs = []
-
-def on_message(client, userdata, msg):
-    topic = msg.topic
-    payload = msg.payload.decode()
-    if topic.endswith("/status"):
-        data = json.loads(payload)
-        uid = data["uid"]
-        data['last_seen_ts'] = datetime.strptime(data['last_seen'], "%Y-%m-%dT%H:%M:%S").timestamp()
-        nodes[uid] = data
-    elif topic.endswith("/log"):
-        try:
-            log = json.loads(payload)
-            logs.append(log)
-            while len(logs) > 1000:
-                logs.pop(0)
-        except json.JSONDecodeError as e: 
-            print("Error parsing log message:", e)
-
-
-mqtt_client = mqtt.Client()
-mqtt_client.on_message = on_message
-mqtt_client.connect(BROKER, 1883)
-mqtt_client.subscribe("node/+/status")
-mqtt_client.subscribe("node/+/log")
-mqtt_client.loop_start()
-sleep(0.1) # give some time to connect
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    heartbeat_task = asyncio.create_task(server_heartbeat_loop())
+def offline_timeout(status: dict[str, Any]) -> float:
+    # Nodes advertise the longest gap until their next status, older nodes send a status every heartbeat
     try:
-        yield
-    finally:
-        # Clean shutdown
-        heartbeat_task.cancel()
-        try:
-            await heartbeat_task
-        except asyncio.CancelledError:
-            pass
-        print("Shutting down backend...")
-        mqtt_client.loop_stop()
-        mqtt_client.disconnect()
-    
-
-app = FastAPI(lifespan=lifespan)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-if os.path.exists(MAC_TABLE_PATH):
+        interval = float(status.get("interval", SERVER_HEARTBEAT_INTERVAL))
+    except (TypeError, ValueError):
+        interval = SERVER_HEARTBEAT_INTERVAL
+    return max(NODE_OFFLINE_TIMEOUT, interval * OFFLINE_INTERVAL_FACTOR)
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value: str) -> float:
+    # Most nodes report the same few seconds, so this is nearly always a cache hit
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S").timestamp()
+
+def log_timestamp(entry: dict[str, Any]) -> float:
     try:
-        with open(MAC_TABLE_PATH, "r") as f:
-            mac_table = json.load(f)
-            if not isinstance(mac_table, dict):
-                print(f"Warning: {MAC_TABLE_PATH} is not a dict. Resetting table.")
-                log = Log(origin="backend", message=f"{MAC_TABLE_PATH} is not a dict, resetting table", level=LogLevel.WARNING)
-                mqtt_client.publish("node/backend/log", log.to_json())
-                mac_table = {}
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"Warning: Failed to load {MAC_TABLE_PATH} ({e}). Starting with empty table.")
-        log = Log(origin="backend", message=f"Failed to load {MAC_TABLE_PATH} ({e}), starting with empty table", level=LogLevel.WARNING)
-        mqtt_client.publish("node/backend/log", log.to_json())
-        mac_table = {}
-else:
-    print(f"{MAC_TABLE_PATH} not found, starting with empty table.")
-    log = Log(origin="backend", message=f"{MAC_TABLE_PATH} not found, starting with empty table", level=LogLevel.INFO)
-    mqtt_client.publish("node/backend/log", log.to_json())
-    mac_table = {}
+        return parse_timestamp(entry["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return time()
 
 def generate_name() -> str:
     return "Node-" + "".join(random.choices(string.ascii_uppercase, k=3))
 
-def mark_offline_nodes():
-    current_time = time()
-    to_update, to_remove = [], []
-    for uid, data in nodes.items():
-        if current_time - data.get('last_seen_ts', 0) > NODE_REMOVAL_TIMEOUT:
-            to_remove.append(uid)
-        elif current_time - data.get('last_seen_ts', 0) > NODE_OFFLINE_TIMEOUT:
-            to_update.append(uid)
-    for uid in to_update:
-        if nodes[uid]['status'] != 'offline':
-            print(f"[Backend] Marking node {uid} as offline")
-            log = Log(origin="backend", message=f"Marking node {uid} as offline", level=LogLevel.DEBUG)
-            mqtt_client.publish("node/backend/log", log.to_json())
-            nodes[uid]['status'] = 'offline'
-    for uid in to_remove:
-        print(f"[Backend] Removing node {uid} due to inactivity")
-        log = Log(origin="backend", message=f"Removing node {uid} due to inactivity", level=LogLevel.WARNING)
-        mqtt_client.publish("node/backend/log", log.to_json())
-        del nodes[uid]
+def not_modified(request: Request, etag: str) -> Response | None:
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
 
-async def server_heartbeat_loop():
-    while True:
-        print("[Backend] Sending server heartbeat")
-        log = Log(origin="backend", message="Sending server heartbeat", level=LogLevel.DEBUG)
-        mqtt_client.publish("node/backend/log", log.to_json())
-        mqtt_client.publish("server/heartbeat", json.dumps({"timestamp": time()}))
-        mark_offline_nodes()
-        await asyncio.sleep(SERVER_HEARTBEAT_INTERVAL)
-
-@app.get("/api/nodes")
-async def get_nodes() -> list[dict[str, Any]]:
-    return list(nodes.values())
-
-@app.get("/api/logs")
-async def get_logs() -> list[dict[str, Any]]:
-    level_order = {"D": 0, "I": 1, "W": 2, "E": 3}
-    min_level_value = level_order[LOGGING_LEVEL.value]
-    
-    filtered_logs = [log for log in logs if level_order[log["level"]] >= min_level_value]
-    return filtered_logs[-100:]
-
-
-@app.post("/api/register")
-async def register_node(request: Request) -> dict[str, str]:
-    data = await request.json()
-    mac = data.get("uid")
-    log = Log(origin="backend", message=f"Register request from {mac}", level=LogLevel.INFO)
-    mqtt_client.publish("node/backend/log", log.to_json())
-
-    if mac in mac_table:
-        name = mac_table[mac]
-        print(f"[Backend] Recognised {mac}, returning existing name {name}")
-        log = Log(origin="backend", message=f"Found {mac} in table, returning {name}", level=LogLevel.INFO)
-        mqtt_client.publish("node/backend/log", log.to_json())
-    else:
-        name = generate_name()
-        mac_table[mac] = name
-
-        with open(MAC_TABLE_PATH, "w") as f:
-            json.dump(mac_table, f, indent=2)
-        print(f"[Backend] New node registered: {mac} -> {name}")
-        log = Log(origin="backend", message=f"Did not find {mac} in table, registered {mac} -> {name}", level=LogLevel.INFO)
+def json_response(content: Any, status_code: int = 200) -> Response:
+    return Response(dumps(content), status_code=status_code, media_type="application/json")
+
+
+class Backend:
+    """Everything one backend process owns: its stores, the MQTT client and the background loops.
+
+    Built by the app's lifespan, so importing this module or creating an app
+    touches neither the disk nor the network. `start` connects to the broker
+    in the background; the API serves from the moment it returns.
+    """
+
+    def __init__(self) -> None:
+        self.boot_id = uuid.uuid4().hex[:8]  # keeps ETags and delta cursors from matching across restarts
+        self.nodes = NodeRegistry()
+        self.liveness = LivenessTracker(offline_timeout=NODE_OFFLINE_TIMEOUT, removal_timeout=NODE_REMOVAL_TIMEOUT)
+        self.logs = LogStore(capacity=LOG_CAPACITY)
+        self.archive = LogArchive(LOG_ARCHIVE_DIR, retention=LOG_ARCHIVE_RETENTION)
+        self.broadcaster = Broadcaster(max_pending=STREAM_MAX_PENDING)
+        self.metrics = MetricsStore(METRICS_DIR)
+        self.rendered = RenderCache(max_entries=RENDER_CACHE_ENTRIES)
+        self.advisor = IntervalAdvisor(min_interval=SERVER_HEARTBEAT_INTERVAL, max_interval=MAX_STATUS_INTERVAL)
+        self.ingest = IngestPipeline(self.apply_batch, capacity=INGEST_CAPACITY, batch_size=INGEST_BATCH_SIZE,
+                                     status_backlog=INGEST_STATUS_BACKLOG)
+
+        # With shared state, one worker (the leader) ingests MQTT and runs the heartbeat, the others serve
+        # the API from a mirror of its state. The leader lock is released by the kernel when its holder dies.
+        if SHARED_STATE_PATH:
+            self.shared = SharedState(SHARED_STATE_PATH, log_capacity=LOG_CAPACITY)
+            self.boot_id = self.shared.boot_id(self.boot_id)
+            self.mirror = StateMirror(self.shared, self.nodes, self.logs)
+            self.leader_lock = LeaderLock(leader_lock_path(SHARED_STATE_PATH))
+            # MAC table and command writes of this worker, committed off the event loop
+            self.shared_writer = SharedWriter(SHARED_STATE_PATH, log_capacity=LOG_CAPACITY)
+        else:
+            self.shared = self.mirror = self.leader_lock = self.shared_writer = None
+
+        # Published once the broker connection is up
+        self._startup_logs: list[Log] = []
+        self.mqtt_client = mqtt.Client()
+        self.mqtt_client.on_connect = self.on_connect
+        self.mqtt_client.on_message = self.on_message
+        self.commands = CommandTracker(self.mqtt_client.publish, timeout=COMMAND_TIMEOUT, retries=COMMAND_RETRIES)
+        self.mac_table = self.load_mac_table()
+        # The model loads on the TTS worker thread, the API does not wait for it
+        self.tts = None if TTS_MODEL == "off" else TtsService(partial(load_model, TTS_MODEL),
+                                                              cache_bytes=TTS_CACHE_BYTES, speakers=TTS_SPEAKER_CACHE)
+        self.tasks: list[asyncio.Task] = []
+
+        # Instrumentation served on /api/metrics
+        self.stats = stats = Registry()
+        self.profiler = SamplingProfiler()
+        self.mqtt_messages = stats.counter("pinest_mqtt_messages_total", "MQTT messages received", ("kind",))
+        self.mqtt_errors = stats.counter("pinest_mqtt_errors_total", "MQTT messages that failed to decode", ("kind",))
+        self.ingest_batch_seconds = stats.histogram("pinest_ingest_batch_seconds", "Time spent applying one ingest batch")
+        self.ingest_batch_messages = stats.histogram("pinest_ingest_batch_size", "Messages per ingest batch",
+                                                     buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+        self.ingest_stage_seconds = stats.histogram("pinest_ingest_stage_seconds", "Time per ingest stage and batch", ("stage",))
+        self.loop_lag_seconds = stats.histogram("pinest_event_loop_lag_seconds", "How late the event loop wakes up from a sleep")
+        self.heartbeat_seconds = stats.histogram("pinest_heartbeat_tick_seconds", "Time spent in one server heartbeat tick")
+        stats.gauge("pinest_nodes", "Nodes in the registry", lambda: len(self.nodes))
+        stats.gauge("pinest_node_version", "Node registry change counter", lambda: self.nodes.version)
+        stats.gauge("pinest_logs", "Log entries held in memory", lambda: len(self.logs))
+        stats.gauge("pinest_log_seq", "Sequence number of the newest log entry", lambda: self.logs.last_seq)
+        stats.gauge("pinest_log_archive_pending", "Log entries buffered for the on-disk archive", lambda: len(self.archive))
+        stats.gauge("pinest_liveness_heap", "Deadline heap entries, including stale ones", lambda: self.liveness.pending)
+        stats.gauge("pinest_stream_clients", "Connected /api/stream clients", lambda: len(self.broadcaster))
+        stats.gauge("pinest_stream_pending", "Updates queued for stream clients", self.broadcaster.pending)
+        stats.gauge("pinest_recommended_interval", "Status interval recommended to nodes, seconds", lambda: self.advisor.interval)
+        stats.gauge("pinest_ingest_busy", "Fraction of the last heartbeat the ingest worker was busy", lambda: self.advisor.busy)
+        stats.gauge("pinest_ingest_queue", "Payloads waiting for the ingest worker", lambda: len(self.ingest))
+        stats.gauge("pinest_ingest_coalesced", "Status payloads merged into one queued for the same node", lambda: self.ingest.coalesced)
+        stats.gauge("pinest_ingest_dropped_debug", "DEBUG log payloads dropped on overflow", lambda: self.ingest.dropped["debug"])
+        stats.gauge("pinest_ingest_dropped_log", "Non-DEBUG log payloads dropped on overflow", lambda: self.ingest.dropped["log"])
+        stats.gauge("pinest_ingest_dropped_status", "Status payloads dropped on overflow", lambda: self.ingest.dropped["status"])
+        stats.gauge("pinest_render_cache_hits", "Responses served from a pre-rendered body", lambda: self.rendered.hits)
+        stats.gauge("pinest_render_cache_misses", "Responses that had to be rendered", lambda: self.rendered.misses)
+        stats.gauge("pinest_metrics_series", "Nodes with a metrics time series", lambda: len(self.metrics))
+        stats.gauge("pinest_mac_table_entries", "Entries in the MAC table", lambda: len(self.mac_table))
+        stats.gauge("pinest_mac_table_pending", "MAC table updates not yet written to disk", lambda: self.mac_table.pending)
+        stats.gauge("pinest_commands_pending", "Commands waiting for acknowledgements", lambda: len(self.commands))
+        stats.gauge("pinest_mqtt_connected", "1 while connected to the MQTT broker", lambda: int(self.mqtt_client.is_connected()))
+        stats.gauge("pinest_leader", "1 while this process ingests MQTT and runs the heartbeat", lambda: int(self.is_leader()))
+        stats.gauge("pinest_profiler_running", "1 while the sampling profiler is running", lambda: int(self.profiler.running))
+        if self.tts is not None:
+            stats.gauge("pinest_tts_ready", "1 once the TTS model is loaded", lambda: int(self.tts.ready))
+            stats.gauge("pinest_tts_queue", "TTS jobs waiting for the worker", lambda: len(self.tts))
+            stats.gauge("pinest_tts_cache_hits", "TTS requests answered from the audio cache", lambda: self.tts.hits)
+            stats.gauge("pinest_tts_cache_misses", "TTS requests that had to be synthesized", lambda: self.tts.misses)
+            stats.gauge("pinest_tts_cache_bytes", "Synthesized audio held in the cache", lambda: self.tts.cached_bytes)
+
+    def load_mac_table(self) -> MacTable | SharedMacTable:
+        # Writes go to a journal on a background thread, see MacTable
+        mac_table = MacTable(MAC_TABLE_PATH)
+        if not os.path.exists(MAC_TABLE_PATH) and not os.path.exists(mac_table.journal_path):
+            print(f"{MAC_TABLE_PATH} not found, starting with empty table.")
+            self._startup_logs.append(Log(origin="backend", message=f"{MAC_TABLE_PATH} not found, starting with empty table", level=LogLevel.INFO))
+        for warning in mac_table.load():
+            print(f"Warning: {warning}")
+            self._startup_logs.append(Log(origin="backend", message=warning, level=LogLevel.WARNING))
+        if self.shared is not None:
+            # Workers share one table, seeded from the JSON table the first time. The JSON table is not
+            # written in this mode, it goes stale
+            if not self.shared.mac_count():
+                self.shared.mac_update(dict(mac_table.items()))
+            return SharedMacTable(self.shared, self.shared_writer)
+        return mac_table
+
+    def is_leader(self) -> bool:
+        return self.leader_lock is None or self.leader_lock.held
+
+    async def start(self) -> None:
+        if self.shared is not None:
+            self.shared_writer.start()
+            if self.leader_lock.try_acquire():
+                await asyncio.to_thread(self.take_over)
+            else:
+                await asyncio.to_thread(self.mirror.pull)
+        # Connects (and reconnects) on the network thread, requests are served meanwhile
+        self.mqtt_client.connect_async(BROKER, 1883)
+        self.mqtt_client.loop_start()
+        self.mac_table.start()
+        self.ingest.start()
+        if self.tts is not None:
+            self.tts.start()
+        self.tasks = [
+            asyncio.create_task(self.server_heartbeat_loop()),
+            asyncio.create_task(self.metrics_flush_loop()),
+            asyncio.create_task(watch_loop_lag(self.loop_lag_seconds)),
+        ]
+        if self.shared is not None:
+            self.tasks.append(asyncio.create_task(self.shared_state_loop()))
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        print("Shutting down backend...")
+        self.mqtt_client.loop_stop()
+        self.mqtt_client.disconnect()
+        # Apply whatever arrived before the client stopped, then persist
+        self.ingest.stop()
+        self.metrics.close()
+        self.archive.flush()
+        self.mac_table.close()
+        if self.tts is not None:
+            await asyncio.to_thread(self.tts.stop)
+        if self.shared is not None:
+            self.shared_writer.close()
+            if self.is_leader():
+                self.mirror.push()
+            self.leader_lock.release()
+            self.shared.close()
+        self.profiler.stop()
+
+    def apply_batch(self, statuses: list[tuple[str, bytes]], log_payloads: list[tuple[str, bytes]]) -> None:
+        """Ingest worker: parses a batch of raw MQTT payloads and applies them to state in one pass."""
+        start = perf_counter()
+        merged: dict[str, dict[str, Any]] = {}
+        for topic, payload in statuses:
+            try:
+                data = wire.decode_status(payload)
+                data['last_seen_ts'] = parse_timestamp(data['last_seen'])
+                # Check the payload on its own, a bad field would otherwise fail the whole batch in update_many
+                NodeRecord.from_status(data)
+            except (ValueError, TypeError, KeyError) as e:
+                self.mqtt_errors.inc("status")
+                print("Error parsing status message:", e)
+                continue
+            # Statuses queued for one node carry only what changed, so merge them oldest first
+            previous = merged.get(topic)
+            merged[topic] = data if previous is None else {**previous, **data}
+        updates = list(merged.values())
+        entries = []
+        history: dict[str, list[tuple[float, dict[str, Any]]]] = {}
+        for topic, payload in log_payloads:
+            if topic.endswith("/history"):
+                # Statuses a node recorded while offline, they only feed the metrics history
+                try:
+                    for data in wire.decode_history(payload):
+                        history.setdefault(str(data['uid']), []).append((parse_timestamp(data['last_seen']), data))
+                except (ValueError, TypeError, KeyError) as e:
+                    self.mqtt_errors.inc("history")
+                    print("Error parsing history message:", e)
+                continue
+            try:
+                # Nodes may batch several records into one payload
+                records = wire.decode_logs(payload)
+                if not all(isinstance(record, dict) for record in records):
+                    raise ValueError("log records must be objects")
+                entries.extend(records)
+            except (ValueError, TypeError) as e:
+                self.mqtt_errors.inc("log")
+                print("Error parsing log message:", e)
+        decoded = perf_counter()
+
+        # Statuses may be partial, the merged record is what gets broadcast and recorded
+        for data, stored in zip(updates, self.nodes.update_many(updates)):
+            self.broadcaster.publish_status(stored)
+            self.liveness.touch(stored['uid'], stored['last_seen_ts'], offline_timeout(data))
+            self.metrics.append(stored['uid'], stored['last_seen_ts'], stored)
+        for entry in self.logs.extend(entries):
+            self.broadcaster.publish_log(entry)
+        self.archive.append([(log_timestamp(entry), entry) for entry in entries])
+        for uid, samples in history.items():
+            self.metrics.backfill(uid, samples)
+
+        end = perf_counter()
+        self.ingest_stage_seconds.observe(decoded - start, "decode")
+        self.ingest_stage_seconds.observe(end - decoded, "apply")
+        self.ingest_batch_seconds.observe(end - start)
+        self.ingest_batch_messages.observe(len(statuses) + len(log_payloads))
+
+    def record_command(self, command: Command) -> None:
+        # Other workers answer /api/commands from the shared copy, written in the background
+        if self.shared is not None:
+            self.shared_writer.put_command(command.id, command.created, command.summary(details=True))
+
+    async def mac_name(self, uid: str) -> str | None:
+        if self.shared is not None:
+            # Read from SQLite, which can wait for the leader's transaction
+            return await asyncio.to_thread(self.mac_table.get, uid)
+        return self.mac_table.get(uid)
+
+    def dispatch_command(self, action: str, args: list, targets: set[str], topic: str | None = None) -> Command:
+        command = self.commands.dispatch(action, args, targets, topic)
+        self.record_command(command)
+        return command
+
+    def command_targets(self, data: dict[str, Any]) -> tuple[str | None, set[str]] | None:
+        """Fan-out topic (None for per-node topics) and the uids expected to answer, None if no target is named."""
+        if data.get("all"):
+            return "all/command", {record.uid for record in self.nodes.records() if record.status == "online"}
+        group = data.get("group")
+        if group:
+            return f"group/{group}/command", {record.uid for record in self.nodes.records()
+                                              if record.status == "online" and group in record.groups}
+        uids = data.get("uids")
+        if isinstance(uids, list) and uids:
+            return None, {str(uid) for uid in uids}
+        return None
+
+    def on_ack(self, topic: str, payload: bytes) -> None:
+        uid = topic.split("/")[1]
+        try:
+            data = json.loads(payload)
+            if not isinstance(data, dict) or not isinstance(data.get("id"), str):
+                raise ValueError("ack must be an object with a string id")
+        except ValueError as e:
+            # Runs on paho's network thread, an exception here would stop all MQTT ingest
+            self.mqtt_errors.inc("ack")
+            print("Error parsing ack message:", e)
+            return
+        command = self.commands.ack(uid, data)
+        if command is not None:
+            print(f"[Backend] Command {command.id} ({command.action}) finished: {command.status}")
+            self.record_command(command)
+
+    def on_message(self, client, userdata, msg):
+        # Runs on the paho network thread: queue and return, the ingest worker does the rest
+        topic = msg.topic
+        if topic.endswith("/ack"):
+            # Low volume and latency sensitive, handled right here
+            self.mqtt_messages.inc("ack")
+            self.on_ack(topic, msg.payload)
+            return
+        kind = topic.rsplit("/", 1)[-1]
+        self.mqtt_messages.inc(kind if kind in ("status", "log", "history") else "other")
+        self.ingest.submit(topic, msg.payload)
+
+    def on_connect(self, client, userdata, flags, rc):
+        # Every worker collects acks for the commands it sent, only the leader ingests
+        client.subscribe("node/+/ack")
+        if self.is_leader():
+            client.subscribe("node/+/status")
+            client.subscribe("node/+/log")
+            client.subscribe("node/+/history")
+        startup_logs, self._startup_logs = self._startup_logs, []
+        for log in startup_logs:
+            client.publish("node/backend/log", log.to_json())
+
+    def take_over(self) -> None:
+        """Makes this process the leader: catches up on the shared state, then ingests from here on."""
+        self.mirror.pull()
+        self.mirror.lead()
+        # The previous leader's deadlines are gone, give every node the longest interval it could be on
+        for record in self.nodes.records():
+            self.liveness.touch(record.uid, record.last_seen_ts, offline_timeout({"interval": MAX_STATUS_INTERVAL}))
+        print(f"[Backend] Process {os.getpid()} is now the leader")
+
+    def mark_offline_nodes(self):
+        # Only nodes whose deadline has passed come out of the tracker, the rest are never looked at
+        for uid, last_seen_ts, stage in self.liveness.expire(time()):
+            if stage == OFFLINE:
+                # The registry skips nodes that are already offline or reported in meanwhile
+                data = self.nodes.mark_offline(uid, last_seen_ts)
+                if data is not None:
+                    print(f"[Backend] Marking node {uid} as offline")
+                    log = Log(origin="backend", message=f"Marking node {uid} as offline", level=LogLevel.DEBUG)
+                    self.mqtt_client.publish("node/backend/log", log.to_json())
+                    self.broadcaster.publish_status(data)
+            elif self.nodes.remove(uid, last_seen_ts):
+                print(f"[Backend] Removing node {uid} due to inactivity")
+                log = Log(origin="backend", message=f"Removing node {uid} due to inactivity", level=LogLevel.WARNING)
+                self.mqtt_client.publish("node/backend/log", log.to_json())
+                self.broadcaster.publish_removed(uid)
+
+    def expire_commands(self):
+        for command in self.commands.expire(time()):
+            summary = command.summary()
+            print(f"[Backend] Command {command.id} ({command.action}) gave up: {summary['timed_out']} of {summary['targets']} nodes never answered")
+            self.record_command(command)
+            log = Log(origin="backend", message=f"Command {command.action} timed out on {summary['timed_out']} of {summary['targets']} nodes", level=LogLevel.WARNING)
+            self.mqtt_client.publish("node/backend/log", log.to_json())
+
+    async def server_heartbeat_loop(self):
+        last_busy, last_tick = self.ingest.busy, perf_counter()
+        while True:
+            tick_start = perf_counter()
+            # Followers only look after the commands they sent
+            if self.is_leader():
+                print("[Backend] Sending server heartbeat")
+                log = Log(origin="backend", message="Sending server heartbeat", level=LogLevel.DEBUG)
+                self.mqtt_client.publish("node/backend/log", log.to_json())
+                # Nodes slow down when the ingest worker gets busy and speed up again when it idles
+                busy = self.ingest.busy
+                interval = self.advisor.update(busy - last_busy, tick_start - last_tick, len(self.ingest))
+                last_busy, last_tick = busy, tick_start
+                # "wire" tells nodes the newest payload format we can decode
+                self.mqtt_client.publish("server/heartbeat", json.dumps({
+                    "timestamp": time(),
+                    "wire": wire.WIRE_VERSION,
+                    "recommended_interval": round(interval, 1),
+                }))
+                self.mark_offline_nodes()
+            self.expire_commands()
+            self.heartbeat_seconds.observe(perf_counter() - tick_start)
+            await asyncio.sleep(SERVER_HEARTBEAT_INTERVAL)
+
+    async def metrics_flush_loop(self):
+        last_expire = time()
+        while True:
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+            if not self.is_leader():
+                # The leader writes metrics and the archive, followers only pick up new series
+                await asyncio.to_thread(self.metrics.refresh)
+                continue
+            # Disk I/O stays off the event loop
+            await asyncio.to_thread(self.metrics.flush)
+            await asyncio.to_thread(self.archive.flush)
+            if time() - last_expire > METRICS_EXPIRE_INTERVAL:
+                last_expire = time()
+                await asyncio.to_thread(self.metrics.expire, last_expire)
+                await asyncio.to_thread(self.archive.expire, last_expire)
+
+    def sync_shared_state(self) -> None:
+        if self.is_leader():
+            self.mirror.push()
+            return
+        changed, removed, entries = self.mirror.pull()
+        for data in changed:
+            self.broadcaster.publish_status(data)
+        for uid in removed:
+            self.broadcaster.publish_removed(uid)
+        for entry in entries:
+            self.broadcaster.publish_log(entry)
+
+    async def shared_state_loop(self):
+        last_attempt = time()
+        while True:
+            await asyncio.sleep(SHARED_SYNC_INTERVAL)
+            if not self.is_leader() and time() - last_attempt > LEADER_RETRY_INTERVAL:
+                last_attempt = time()
+                if self.leader_lock.try_acquire():
+                    await asyncio.to_thread(self.take_over)
+                    self.on_connect(self.mqtt_client, None, {}, 0)
+                    log = Log(origin="backend", message=f"Backend process {os.getpid()} took over as leader", level=LogLevel.WARNING)
+                    self.mqtt_client.publish("node/backend/log", log.to_json())
+            try:
+                await asyncio.to_thread(self.sync_shared_state)
+            except sqlite3.Error as e:
+                print(f"[Backend] Failed to sync shared state: {e}")
+
+    def cached_json(self, request: Request, key: tuple, version: int, etag: str, render) -> Response:
+        """Serves a pre-rendered body for `key` at `version`, compressed if the client accepts it."""
+        encoding = pick_encoding(request.headers.get("accept-encoding"))
+        body, encoding = self.rendered.get(key, version, render, encoding)
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+        if encoding != IDENTITY:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type="application/json", headers=headers)
+
+
+def create_app() -> FastAPI:
+    """Builds the API. The Backend behind it is created when the app starts and closed when it stops."""
+    stats = Registry()
+    http_seconds = stats.histogram("pinest_http_request_seconds", "HTTP request latency", ("method", "path", "status"))
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        backend = app.state.backend = Backend()
+        await backend.start()
+        try:
+            yield
+        finally:
+            # Clean shutdown
+            await backend.stop()
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(RequestTimer, histogram=http_seconds)
+
+    @app.get("/api/nodes")
+    async def get_nodes(request: Request, since: int | None = None) -> Response:
+        """Full node list, or with `since` only the nodes changed/removed after that version."""
+        backend: Backend = app.state.backend
+        nodes = backend.nodes
+        if since is None:
+            version, snapshot = nodes.snapshot()
+            etag = f'"nodes-{backend.boot_id}-{version}"'
+            return not_modified(request, etag) or backend.cached_json(request, ("nodes",), version, etag, lambda: snapshot)
+
+        # A cursor from the future means the backend restarted, one older than the kept tombstones may miss
+        # removals. Either way send everything again
+        reset = since > nodes.version or since < nodes.horizon
+        if reset:
+            since = 0
+        version, changed, removed = nodes.changes_since(since)
+        return json_response({
+            "boot": backend.boot_id,
+            "version": version,
+            "reset": reset,
+            "nodes": changed,
+            "removed": [] if reset else removed,
+        })
+
+    @app.get("/api/nodes/{uid}/metrics")
+    async def get_node_metrics(uid: str,
+                               start: float | None = Query(None, alias="from"),
+                               end: float | None = Query(None, alias="to"),
+                               step: float | None = None) -> dict[str, Any]:
+        """cpu/temp history of a node between two epoch timestamps (default: the last hour)."""
+        backend: Backend = app.state.backend
+        end = end if end is not None else time()
+        start = start if start is not None else end - 3600
+        return await asyncio.to_thread(backend.metrics.query, uid, start, end, step)
+
+    @app.get("/api/logs")
+    async def get_logs(request: Request,
+                       limit: int = 100,
+                       level: str | None = None,
+                       origin: str | None = None,
+                       since: int | None = None) -> Response:
+        """Newest logs at or above `level`, or with `since` only logs newer than that sequence number."""
+        backend: Backend = app.state.backend
+        logs = backend.logs
+        min_level = level.upper() if level else LOGGING_LEVEL.value
+        last_seq = logs.last_seq
+        if since is None:
+            etag = f'"logs-{backend.boot_id}-{last_seq}"'
+            return not_modified(request, etag) or backend.cached_json(
+                request, ("logs", limit, min_level, origin), last_seq, etag,
+                lambda: logs.query(limit=limit, min_level=min_level, origin=origin))
+
+        reset = since > last_seq
+        if reset:
+            since = 0
+        entries = logs.query(limit=limit + 1, min_level=min_level, origin=origin, since=since)
+        if len(entries) > limit:
+            # More arrived than fit in one answer, the client starts over from the newest instead of missing some
+            entries = entries[len(entries) - limit:]
+            reset = True
+        return json_response({
+            "boot": backend.boot_id,
+            "seq": max(last_seq, entries[-1]["seq"]) if entries else last_seq,
+            "reset": reset,
+            "logs": entries,
+        })
+
+
+    @app.get("/api/logs/search")
+    async def search_logs(q: str = "",
+                          origin: str | None = None,
+                          level: str | None = None,
+                          start: float | None = Query(None, alias="from"),
+                          end: float | None = Query(None, alias="to"),
+                          limit: int | None = None) -> StreamingResponse:
+        """Archived logs matching every word of `q`, streamed as NDJSON (one log per line)."""
+        backend: Backend = app.state.backend
+        min_level = level.upper() if level else "D"
+
+        def lines():
+            # Runs in the threadpool, one block of matches in memory at a time
+            sent = 0
+            for found in backend.archive.search(q, origin=origin, min_level=min_level, start=start, end=end):
+                if limit is not None:
+                    found = found[:limit - sent]
+                sent += len(found)
+                yield b"".join(dumps(record) + b"\n" for record in found)
+                if limit is not None and sent >= limit:
+                    return
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+    @app.get("/api/stream")
+    async def stream(level: str | None = None) -> StreamingResponse:
+        """Server-Sent Events push of node status changes and new logs at or above `level`."""
+        backend: Backend = app.state.backend
+        min_level = level.upper() if level else LOGGING_LEVEL.value
+
+        def snapshot() -> dict[str, Any]:
+            return {
+                "boot": backend.boot_id,
+                "nodes": backend.nodes.snapshot()[1],
+                "logs": backend.logs.query(limit=100, min_level=min_level),
+            }
+
+        return StreamingResponse(
+            backend.broadcaster.stream(snapshot, min_level=min_level),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+
+    @app.get("/api/metrics")
+    async def get_metrics() -> Response:
+        """Backend instrumentation in the Prometheus text format."""
+        backend: Backend = app.state.backend
+        return Response(stats.render() + backend.stats.render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/api/profiler")
+    async def get_profiler(limit: int = 20) -> dict[str, Any]:
+        """Most frequently sampled stacks since the profiler was last started."""
+        backend: Backend = app.state.backend
+        return backend.profiler.report(limit)
+
+    @app.post("/api/profiler")
+    async def set_profiler(request: Request) -> Any:
+        backend: Backend = app.state.backend
+        data = await request.json()
+        if data.get("enabled"):
+            hz = data.get("hz")
+            # A bad rate would kill the sampler thread and leave the profiler marked as running
+            if hz is not None and (isinstance(hz, bool) or not isinstance(hz, (int, float))
+                                   or not 0 < hz <= PROFILER_MAX_HZ):
+                return json_response({"error": f"'hz' must be a number in (0, {PROFILER_MAX_HZ}]"}, status_code=400)
+            backend.profiler.start(hz=hz)
+        else:
+            # Joining the sampler thread takes at most one sample interval
+            await asyncio.to_thread(backend.profiler.stop)
+        return backend.profiler.report(limit=0)
+
+
+    @app.post("/api/register")
+    async def register_node(request: Request) -> dict[str, str]:
+        backend: Backend = app.state.backend
+        mac_table, mqtt_client = backend.mac_table, backend.mqtt_client
+        data = await request.json()
+        mac = data.get("uid")
+        log = Log(origin="backend", message=f"Register request from {mac}", level=LogLevel.INFO)
         mqtt_client.publish("node/backend/log", log.to_json())
 
-    return {"name": name}
+        name = await backend.mac_name(mac)
+        if name is not None:
+            print(f"[Backend] Recognised {mac}, returning existing name {name}")
+            log = Log(origin="backend", message=f"Found {mac} in table, returning {name}", level=LogLevel.INFO)
+            mqtt_client.publish("node/backend/log", log.to_json())
+        else:
+            name = generate_name()
+            mac_table[mac] = name
+            print(f"[Backend] New node registered: {mac} -> {name}")
+            log = Log(origin="backend", message=f"Did not find {mac} in table, registered {mac} -> {name}", level=LogLevel.INFO)
+            mqtt_client.publish("node/backend/log", log.to_json())
+
+        return {"name": name}
+
+    @app.post("/api/commands")
+    async def send_command(request: Request) -> dict[str, Any]:
+        """Sends one command to a list of nodes (`uids`), a `group` or `all` nodes, returns its aggregate status."""
+        backend: Backend = app.state.backend
+        data = await request.json()
+        action = data.get("action")
+        args = data.get("args", [])
+        fan_out = backend.command_targets(data)
+        if not action or fan_out is None:
+            return {"error": "'action' and one of 'uids', 'group' or 'all' are required"}
+        topic, targets = fan_out
+
+        print(f"[Backend] Sending {action} to {len(targets)} nodes via {topic or 'node topics'}")
+        log = Log(origin="backend", message=f"Sending {action} {args} to {len(targets)} nodes", level=LogLevel.INFO)
+        backend.mqtt_client.publish("node/backend/log", log.to_json())
+        command = backend.dispatch_command(action, args, targets, topic)
+        return command.summary()
+
+    @app.get("/api/commands")
+    async def list_commands(limit: int = 50) -> list[dict[str, Any]]:
+        backend: Backend = app.state.backend
+        if backend.shared is not None:
+            return await asyncio.to_thread(backend.shared.recent_commands, limit)
+        return [command.summary() for command in backend.commands.recent(limit)]
+
+    @app.get("/api/commands/{command_id}")
+    async def get_command(command_id: str) -> dict[str, Any]:
+        """Aggregate status of a command plus what every target node answered."""
+        backend: Backend = app.state.backend
+        command = backend.commands.get(command_id)
+        if command is not None:
+            return command.summary(details=True)
+        # Sent by another worker: its last recorded state (dispatch, completion or timeout)
+        summary = await asyncio.to_thread(backend.shared.get_command, command_id) if backend.shared is not None else None
+        if summary is None:
+            return {"error": f"Unknown command {command_id}"}
+        return summary
+
+    @app.post("/api/rename")
+    async def rename_node(request: Request) -> dict[str, Any]:
+        backend: Backend = app.state.backend
+        data = await request.json()
+        uid = data.get("uid")
+        new_name = data.get("name")
+
+        if not uid or not new_name:
+            return {"error": "Both 'uid' and 'name' are required"}
+
+        # Update the mac_table
+        old_name = await backend.mac_name(uid)
+        backend.mac_table[uid] = new_name
+
+        # Log and publish the rename command to the node
+        print(f"[Backend] Renaming node {uid} from {old_name} to {new_name}")
+        log = Log(origin="backend", message=f"Renaming node {uid} from {old_name} to {new_name}", level=LogLevel.INFO)
+        backend.mqtt_client.publish("node/backend/log", log.to_json())
+
+        # Send MQTT command to node to rename itself, the node acknowledges it
+        command = backend.dispatch_command("rename", [new_name], {uid})
+
+        return {"uid": uid, "old_name": old_name, "new_name": new_name, "command_id": command.id}
+
+    @app.post("/api/log_level")
+    async def set_node_log_level(request: Request) -> dict[str, str]:
+        backend: Backend = app.state.backend
+        data = await request.json()
+        uid = data.get("uid")
+        level = data.get("level")
+
+        if not uid or not level:
+            return {"error": "Both 'uid' and 'level' are required"}
+
+        print(f"[Backend] Setting remote log level of node {uid} to {level}")
+        log = Log(origin="backend", message=f"Setting remote log level of node {uid} to {level}", level=LogLevel.INFO)
+        backend.mqtt_client.publish("node/backend/log", log.to_json())
+
+        # The node only publishes logs at or above this level from now on
+        command = backend.dispatch_command("set_log_level", [level], {uid})
+
+        return {"uid": uid, "level": level, "command_id": command.id}
+
+    @app.post("/api/tts")
+    async def text_to_speech(request: Request) -> Response:
+        """Speaks `text` in the voice of voices/<speaker>.wav, streamed as WAV while it is synthesized."""
+        backend: Backend = app.state.backend
+        tts = backend.tts
+        data = await request.json()
+        text = data.get("text")
+        speaker = os.path.basename(str(data.get("speaker", "default")))
+        language = data.get("language", "en")
 
-@app.post("/api/rename")
-async def rename_node(request: Request) -> dict[str, str]:
-    data = await request.json()
-    uid = data.get("uid")
-    new_name = data.get("name")
+        if not text:
+            return json_response({"error": "'text' is required"})
+        if tts is None:
+            return json_response({"error": "TTS is disabled, set PINEST_TTS to xtts or stub"})
+        if not tts.ready:
+            return json_response({"error": tts.error or "TTS model is still loading"})
+        voice = os.path.join(TTS_VOICES_DIR, f"{speaker}.wav")
+        if not os.path.isfile(voice):
+            return json_response({"error": f"Unknown speaker {speaker}"})
 
-    if not uid or not new_name:
-        return {"error": "Both 'uid' and 'name' are required"}
+        def audio():
+            # Runs in the threadpool, each chunk goes out as soon as the worker produced it
+            yield wav_header(tts.model.sample_rate)
+            yield from tts.synthesize(text, voice, language)
 
-    # Update the mac_table
-    old_name = mac_table.get(uid)
-    mac_table[uid] = new_name
-    with open(MAC_TABLE_PATH, "w") as f:
-        json.dump(mac_table, f, indent=2)
+        return StreamingResponse(audio(), media_type="audio/wav")
 
-    # Log and publish the rename command to the node
-    print(f"[Backend] Renaming node {uid} from {old_name} to {new_name}")
-    log = Log(origin="backend", message=f"Renaming node {uid} from {old_name} to {new_name}", level=LogLevel.INFO)
-    mqtt_client.publish("node/backend/log", log.to_json())
+    return app
 
-    # Send MQTT command to node to rename itself
-    command_topic = f"node/{uid}/command"
-    command_payload = {"action": "rename", "args": [new_name]}
-    mqtt_client.publish(command_topic, json.dumps(command_payload))
 
-    return {"uid": uid, "old_name": old_name, "new_name": new_name}
+# `uvicorn backend.dashboard_backend:app`, or `--factory backend.dashboard_backend:create_app`
+app = create_app()
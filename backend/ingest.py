@@ -0,0 +1,159 @@
+import heapq
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+# Finds the level field of JSON log records without parsing the payload
+_JSON_LEVEL = re.compile(rb'"level"\s*:\s*"([DIWE])"')
+
+Batch = list[tuple[str, bytes]]
+
+
+def is_debug_only(payload: bytes) -> bool:
+    """True when every record in a log payload is DEBUG. Compact payloads are never classed as debug."""
+    levels = set(_JSON_LEVEL.findall(payload))
+    return levels == {b"D"}
+
+
+class IngestPipeline:
+    """Bounded hand-off from the MQTT network thread to a worker that applies messages in batches.
+
+    `submit` only queues the raw (topic, payload), so the paho callback never
+    waits on parsing or state updates. Overflow policies:
+      - status: payloads queued for the same topic are handed over together, in
+        order, for the handler to merge (statuses may carry only changed
+        fields). `capacity` bounds the topics and `status_backlog` the payloads
+        per topic. Past that the oldest is dropped, whatever it changed is
+        resent with the node's next full status.
+      - logs: bounded to `capacity`. When full, DEBUG-only payloads are evicted
+        first, then the oldest of the rest. Any other topic (e.g. a node's
+        replayed history) shares this queue and is handed over with the logs.
+    The worker hands `handler(statuses, logs)` everything queued, at most
+    `batch_size` logs at a time, oldest first.
+    """
+
+    def __init__(self,
+                 handler: Callable[[Batch, Batch], None],
+                 capacity: int = 10000,
+                 batch_size: int = 1000,
+                 status_backlog: int = 16) -> None:
+        self.handler = handler
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.status_backlog = status_backlog
+        self._statuses: dict[str, deque[bytes]] = {}
+        self._queued_statuses = 0
+        # Log queues hold (arrival number, topic, payload) so the two can be merged back in order
+        self._debug: deque[tuple[int, str, bytes]] = deque()
+        self._other: deque[tuple[int, str, bytes]] = deque()
+        self._arrivals = 0
+        self.dropped = {"debug": 0, "log": 0, "status": 0}
+        self.coalesced = 0
+        self.busy = 0.0  # seconds spent in the handler, for load estimates
+        self._cond = threading.Condition()
+        self._running = False
+        self._worker: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return self._queued_statuses + len(self._debug) + len(self._other)
+
+    def submit(self, topic: str, payload: bytes) -> None:
+        if topic.endswith("/status"):
+            with self._cond:
+                queued = self._statuses.get(topic)
+                if queued is not None:
+                    self.coalesced += 1
+                    if len(queued) >= self.status_backlog:
+                        queued.popleft()
+                        self.dropped["status"] += 1
+                        self._queued_statuses -= 1
+                    queued.append(payload)
+                elif len(self._statuses) >= self.capacity:
+                    self.dropped["status"] += 1
+                    return
+                else:
+                    self._statuses[topic] = deque([payload])
+                self._queued_statuses += 1
+                self._cond.notify()
+            return
+
+        debug = is_debug_only(payload)
+        with self._cond:
+            if len(self._debug) + len(self._other) >= self.capacity:
+                if debug:
+                    self.dropped["debug"] += 1
+                    return
+                if self._debug:
+                    self._debug.popleft()
+                    self.dropped["debug"] += 1
+                else:
+                    self._other.popleft()
+                    self.dropped["log"] += 1
+            self._arrivals += 1
+            (self._debug if debug else self._other).append((self._arrivals, topic, payload))
+            self._cond.notify()
+
+    def _take(self) -> tuple[Batch, Batch]:
+        # Caller holds the lock
+        statuses = [(topic, payload) for topic, payloads in self._statuses.items() for payload in payloads]
+        self._statuses.clear()
+        self._queued_statuses = 0
+        logs = []
+        for _, topic, payload in heapq.merge(self._debug, self._other):
+            if len(logs) >= self.batch_size:
+                break
+            logs.append((topic, payload))
+        # Remove what was taken from the front of both queues
+        taken = len(logs)
+        while taken:
+            if self._debug and (not self._other or self._debug[0][0] < self._other[0][0]):
+                self._debug.popleft()
+            else:
+                self._other.popleft()
+            taken -= 1
+        return statuses, logs
+
+    def drain(self) -> None:
+        """Applies everything queued on the calling thread."""
+        while True:
+            with self._cond:
+                statuses, logs = self._take()
+            if not statuses and not logs:
+                return
+            self.handler(statuses, logs)
+
+    def start(self) -> None:
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._worker = threading.Thread(target=self._work_loop, name="ingest-worker", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        """Stops the worker, then applies whatever is still queued."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self.drain()
+
+    def _work_loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not len(self):
+                    self._cond.wait()
+                if not self._running:
+                    return
+                statuses, logs = self._take()
+            start = time.perf_counter()
+            try:
+                self.handler(statuses, logs)
+            except Exception as e:
+                # Never let one bad batch stop ingest
+                print(f"[Backend] Ingest batch failed: {e}")
+            self.busy += time.perf_counter() - start
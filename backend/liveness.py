@@ -0,0 +1,56 @@
+import heapq
+import threading
+
+OFFLINE = "offline"
+REMOVED = "removed"
+
+
+class LivenessTracker:
+    """Min-heap of node deadlines, so expiring nodes costs O(log n) per event instead of a full scan.
+
+    Every `touch` pushes a new offline deadline. Older entries for the same node
+    are not searched for, they are recognised as stale (their `last_seen_ts`
+    no longer matches) and skipped when they reach the top of the heap.
+    """
+
+    def __init__(self, offline_timeout: float, removal_timeout: float) -> None:
+        self.offline_timeout = offline_timeout
+        self.removal_timeout = removal_timeout
+        self._heap: list[tuple[float, str, float, str]] = []
+        self._last_seen: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._last_seen)
+
+    @property
+    def pending(self) -> int:
+        """Heap entries including stale ones."""
+        return len(self._heap)
+
+    def touch(self, uid: str, last_seen_ts: float, offline_timeout: float | None = None) -> None:
+        """Records a status. `offline_timeout` overrides the default for this deadline only."""
+        if offline_timeout is None:
+            offline_timeout = self.offline_timeout
+        with self._lock:
+            previous = self._last_seen.get(uid)
+            if previous is not None and previous >= last_seen_ts:
+                return
+            self._last_seen[uid] = last_seen_ts
+            heapq.heappush(self._heap, (last_seen_ts + offline_timeout, uid, last_seen_ts, OFFLINE))
+
+    def expire(self, now: float) -> list[tuple[str, float, str]]:
+        """Pops every deadline up to `now`, returns (uid, last_seen_ts, OFFLINE or REMOVED) transitions."""
+        transitions = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                _, uid, last_seen_ts, stage = heapq.heappop(heap)
+                if self._last_seen.get(uid) != last_seen_ts:
+                    continue  # node reported in since this deadline was set
+                transitions.append((uid, last_seen_ts, stage))
+                if stage == OFFLINE:
+                    heapq.heappush(heap, (last_seen_ts + self.removal_timeout, uid, last_seen_ts, REMOVED))
+                else:
+                    del self._last_seen[uid]
+        return transitions
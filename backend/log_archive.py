@@ -0,0 +1,311 @@
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Iterator, Optional
+
+from .log_store import LEVEL_ORDER
+
+SEGMENT_SECONDS = 3600   # one segment per hour of log time
+BLOCK_RECORDS = 256      # records per compressed block
+
+# Sparse index entry per block: first ts, last ts, offset in .seg, compressed length, level bitmask
+_INDEX = struct.Struct("<ddQIB")
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> set[str]:
+    return {token.lower() for token in _TOKEN.findall(text)}
+
+
+def _origin_token(origin: str) -> str:
+    # Cannot collide with message tokens, those never contain '@'
+    return "@" + origin
+
+
+def _level_mask(min_level: str) -> int:
+    mask = 0
+    for level, order in LEVEL_ORDER.items():
+        if order >= LEVEL_ORDER.get(min_level, 0):
+            mask |= 1 << order
+    return mask
+
+
+class Segment:
+    """One hour of archived logs, stored as three append-only files.
+
+    - `<start>.seg`: zlib-compressed blocks of newline-separated JSON records
+    - `<start>.tok`: one JSON line per block with its number and its message
+      and origin tokens
+    - `<start>.idx`: fixed-size sparse index records, one per block
+
+    Blocks are written in that order, so a reader that only trusts blocks in
+    the .idx never sees a block without its data or tokens. A crash mid-write
+    leaves trailing bytes that are not referenced by the index; token lines
+    name their block, so such a line is skipped rather than shifting the
+    blocks after it, and the writer cuts these tails off before it appends.
+    """
+
+    def __init__(self, root: str, start: int) -> None:
+        self.start = start
+        base = os.path.join(root, str(start))
+        self.seg_path = base + ".seg"
+        self.tok_path = base + ".tok"
+        self.idx_path = base + ".idx"
+        # Inverted index token -> block numbers, extended as new blocks are indexed
+        self.postings: dict[str, list[int]] = {}
+        self._tok_offset = 0
+        self._tok_blocks = 0
+        self._repaired = False
+        self._lock = threading.Lock()
+
+    def _repair(self) -> None:
+        # Cut off what a crash left behind the last indexed block, new blocks must not land after it
+        self._repaired = True
+        blocks = self.blocks()
+        try:
+            if os.path.getsize(self.idx_path) != len(blocks) * _INDEX.size:
+                os.truncate(self.idx_path, len(blocks) * _INDEX.size)
+        except FileNotFoundError:
+            pass
+        seg_end = blocks[-1][2] + blocks[-1][3] if blocks else 0
+        if os.path.exists(self.seg_path) and os.path.getsize(self.seg_path) != seg_end:
+            os.truncate(self.seg_path, seg_end)
+        if not os.path.exists(self.tok_path):
+            return
+        tok_end = 0
+        with open(self.tok_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    number, _ = self._parse_tokens(line)
+                except (ValueError, KeyError, TypeError):
+                    break
+                if number >= len(blocks):
+                    break
+                tok_end += len(line)
+        if os.path.getsize(self.tok_path) != tok_end:
+            os.truncate(self.tok_path, tok_end)
+
+    @staticmethod
+    def _parse_tokens(line: bytes) -> tuple[int, list[str]]:
+        data = json.loads(line)
+        return int(data["block"]), data["tokens"]
+
+    def write_block(self, records: list[dict[str, Any]], tokens: set[str]) -> None:
+        if not self._repaired:
+            self._repair()
+        number = os.path.getsize(self.idx_path) // _INDEX.size if os.path.exists(self.idx_path) else 0
+        data = zlib.compress(b"\n".join(json.dumps(r, separators=(",", ":")).encode() for r in records), 6)
+        mask = 0
+        for record in records:
+            mask |= 1 << LEVEL_ORDER.get(record.get("level"), 1)
+        try:
+            with open(self.seg_path, "ab") as f:
+                offset = f.tell()
+                f.write(data)
+            with open(self.tok_path, "a") as f:
+                f.write(json.dumps({"block": number, "tokens": sorted(tokens)}) + "\n")
+            with open(self.idx_path, "ab") as f:
+                f.write(_INDEX.pack(records[0]["ts"], records[-1]["ts"], offset, len(data), mask))
+        except OSError:
+            self._repaired = False  # e.g. disk full, cut off the partial block before the next one
+            raise
+
+    def blocks(self) -> list[tuple[float, float, int, int, int]]:
+        try:
+            with open(self.idx_path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return []
+        usable = len(raw) - len(raw) % _INDEX.size
+        # Index records for blocks whose data is missing (torn write) are ignored too
+        seg_size = os.path.getsize(self.seg_path) if os.path.exists(self.seg_path) else 0
+        return [entry for entry in _INDEX.iter_unpack(raw[:usable]) if entry[2] + entry[3] <= seg_size]
+
+    def index_tokens(self, block_count: int) -> None:
+        """Reads token lines for blocks not yet in `postings`."""
+        with self._lock:
+            if self._tok_blocks >= block_count:
+                return
+            with open(self.tok_path, "rb") as f:
+                f.seek(self._tok_offset)
+                while self._tok_blocks < block_count:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break  # block still being written
+                    try:
+                        number, tokens = self._parse_tokens(line)
+                    except (ValueError, KeyError, TypeError):
+                        number, tokens = -1, ()  # torn by a crash, the writer cuts it off
+                    if number >= block_count:
+                        break  # its block is not indexed (yet)
+                    self._tok_offset += len(line)
+                    if number < self._tok_blocks:
+                        continue  # left behind by a crash, a later line took its number
+                    for token in tokens:
+                        self.postings.setdefault(token, []).append(number)
+                    self._tok_blocks = number + 1
+
+    def blocks_with(self, tokens: set[str], block_count: int) -> list[int]:
+        """Numbers of the blocks (below `block_count`) that contain every token."""
+        self.index_tokens(block_count)
+        with self._lock:
+            lists = [self.postings.get(token, ()) for token in tokens]
+        common = set(lists[0]).intersection(*lists[1:])
+        return sorted(number for number in common if number < block_count)
+
+    def read_block(self, offset: int, length: int) -> list[dict[str, Any]]:
+        with open(self.seg_path, "rb") as f:
+            f.seek(offset)
+            data = zlib.decompress(f.read(length))
+        return [json.loads(line) for line in data.split(b"\n")]
+
+    def remove(self) -> None:
+        for path in (self.idx_path, self.tok_path, self.seg_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class LogArchive:
+    """On-disk, time-partitioned log history with full-text search.
+
+    `append` only buffers; records reach disk a block at a time, either when a
+    segment has BLOCK_RECORDS pending or on `flush`. `search` streams matches
+    block by block and never holds more than one decompressed block.
+    """
+
+    def __init__(self, root: str, retention: Optional[float] = 30 * 86400, cached_segments: int = 32) -> None:
+        self.root = root
+        self.retention = retention
+        self.cached_segments = cached_segments
+        os.makedirs(root, exist_ok=True)
+        self._pending: dict[int, list[dict[str, Any]]] = {}
+        self._segments: OrderedDict[int, Segment] = OrderedDict()
+        self._lock = threading.Lock()        # pending buffers and segment cache
+        self._write_lock = threading.Lock()  # block writes
+
+    def __len__(self) -> int:
+        """Records buffered and not yet on disk."""
+        return sum(len(records) for records in self._pending.values())
+
+    def _segment(self, start: int) -> Segment:
+        # Caller holds _lock
+        segment = self._segments.get(start)
+        if segment is None:
+            segment = self._segments[start] = Segment(self.root, start)
+            while len(self._segments) > self.cached_segments:
+                self._segments.popitem(last=False)
+        self._segments.move_to_end(start)
+        return segment
+
+    def segment_starts(self) -> list[int]:
+        starts = set()
+        for name in os.listdir(self.root):
+            stem, _, ext = name.partition(".")
+            if ext == "idx" and stem.isdigit():
+                starts.add(int(stem))
+        return sorted(starts)
+
+    def append(self, records: list[tuple[float, dict[str, Any]]]) -> None:
+        """Buffers (timestamp, log entry) pairs. Per-boot fields such as `seq` are not archived."""
+        full = []
+        with self._lock:
+            for ts, entry in records:
+                record = {key: value for key, value in entry.items() if key != "seq"}
+                record["ts"] = ts
+                start = int(ts // SEGMENT_SECONDS * SEGMENT_SECONDS)
+                pending = self._pending.setdefault(start, [])
+                pending.append(record)
+                if len(pending) >= BLOCK_RECORDS:
+                    full.append((start, self._pending.pop(start)))
+        for start, block in full:
+            self._write(start, block)
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for start, block in sorted(pending.items()):
+            self._write(start, block)
+
+    def _write(self, start: int, records: list[dict[str, Any]]) -> None:
+        records.sort(key=lambda record: record["ts"])
+        tokens = {_origin_token(str(record.get("origin", ""))) for record in records}
+        for record in records:
+            tokens |= tokenize(str(record.get("message", "")))
+        with self._lock:
+            segment = self._segment(start)
+        with self._write_lock:
+            try:
+                segment.write_block(records, tokens)
+            except OSError as e:
+                print(f"[Backend] Failed to archive {len(records)} logs: {e}")
+
+    def expire(self, now: float) -> int:
+        """Deletes segments that ended before the retention window, returns how many."""
+        if self.retention is None:
+            return 0
+        removed = 0
+        for start in self.segment_starts():
+            if start + SEGMENT_SECONDS < now - self.retention:
+                with self._lock:
+                    segment = self._segments.pop(start, None) or Segment(self.root, start)
+                with self._write_lock:
+                    segment.remove()
+                removed += 1
+        return removed
+
+    def search(self,
+               query: str = "",
+               origin: Optional[str] = None,
+               min_level: str = "D",
+               start: Optional[float] = None,
+               end: Optional[float] = None) -> Iterator[list[dict[str, Any]]]:
+        """Yields lists of matching records, one list per block.
+
+        Segments come oldest first and blocks in the order they were written,
+        which is time order except for late arrivals. Every word of `query`
+        must appear in the message (case-insensitive, whole tokens). Records
+        still buffered in memory come last.
+        """
+        words = tokenize(query)
+        required = set(words)
+        if origin is not None:
+            required.add(_origin_token(origin))
+        mask = _level_mask(min_level)
+        lo = float("-inf") if start is None else start
+        hi = float("inf") if end is None else end
+
+        def matches(record: dict[str, Any]) -> bool:
+            return (lo <= record["ts"] <= hi
+                    and (1 << LEVEL_ORDER.get(record.get("level"), 1)) & mask
+                    and (origin is None or record.get("origin") == origin)
+                    and words <= tokenize(str(record.get("message", ""))))
+
+        for seg_start in self.segment_starts():
+            if seg_start + SEGMENT_SECONDS <= lo or seg_start > hi:
+                continue
+            with self._lock:
+                segment = self._segment(seg_start)
+            blocks = segment.blocks()
+            # The inverted index narrows the blocks to decompress, the sparse index the time range
+            candidates = segment.blocks_with(required, len(blocks)) if required else range(len(blocks))
+            for number in candidates:
+                first_ts, last_ts, offset, length, levels = blocks[number]
+                if last_ts < lo or first_ts > hi or not levels & mask:
+                    continue
+                found = [record for record in segment.read_block(offset, length) if matches(record)]
+                if found:
+                    yield found
+
+        with self._lock:
+            pending = [record for records in self._pending.values() for record in records]
+        found = sorted((record for record in pending if matches(record)), key=lambda record: record["ts"])
+        if found:
+            yield found
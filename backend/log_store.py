@@ -0,0 +1,125 @@
+import heapq
+import threading
+from collections import deque
+from itertools import islice
+from typing import Any, Iterable, Optional
+
+# Level characters as sent on the wire (see common.LogLevel), lowest first
+LEVELS = ("D", "I", "W", "E")
+LEVEL_ORDER = {level: i for i, level in enumerate(LEVELS)}
+
+
+class LogStore:
+    """Fixed-capacity ring buffer of log entries.
+
+    Every entry gets a monotonically increasing sequence number. Per-level and
+    per-origin indexes hold the live sequence numbers in order, so evicting the
+    oldest entry is O(1) and "last N at level >= X for origin Y" only touches
+    entries that can match.
+    """
+
+    def __init__(self, capacity: int = 1000) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._entries: list[Optional[dict[str, Any]]] = [None] * capacity
+        self._next_seq = 1
+        self._by_level: dict[str, deque[int]] = {level: deque() for level in LEVELS}
+        self._by_origin: dict[str, deque[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self._next_seq - 1, self.capacity)
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the newest entry (0 when empty)."""
+        return self._next_seq - 1
+
+    def extend(self, logs: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Append several entries under one lock, returns the stored entries (with their seq)."""
+        with self._lock:
+            return [self._get(self._append(log)) for log in logs]
+
+    def replicate(self, entries: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Appends entries from another store keeping their seq, returns the ones that were new.
+
+        Entries already held are skipped. If the first new one does not follow
+        `last_seq` (this store fell behind by more than its capacity) the store
+        is emptied and continues from there.
+        """
+        stored = []
+        with self._lock:
+            for entry in entries:
+                seq = entry["seq"]
+                if seq < self._next_seq:
+                    continue
+                if seq > self._next_seq:
+                    self._entries = [None] * self.capacity
+                    self._by_level = {level: deque() for level in LEVELS}
+                    self._by_origin = {}
+                    self._next_seq = seq
+                stored.append(self._get(self._append(entry)))
+        return stored
+
+    def _append(self, log: dict[str, Any]) -> int:
+        level = log.get("level")
+        if level not in LEVEL_ORDER:
+            level = "I"
+        origin = str(log.get("origin", "Unknown"))
+        seq = self._next_seq
+        self._next_seq += 1
+
+        slot = seq % self.capacity
+        old = self._entries[slot]
+        if old is not None:
+            self._evict(old)
+
+        entry = dict(log, level=level, origin=origin, seq=seq)
+        self._entries[slot] = entry
+        self._by_level[level].append(seq)
+        origin_index = self._by_origin.get(origin)
+        if origin_index is None:
+            origin_index = self._by_origin[origin] = deque()
+        origin_index.append(seq)
+        return seq
+
+    def _evict(self, entry: dict[str, Any]) -> None:
+        # The evicted entry is always the oldest one, so it sits at the head of its indexes
+        self._by_level[entry["level"]].popleft()
+        origin_index = self._by_origin[entry["origin"]]
+        origin_index.popleft()
+        if not origin_index:
+            del self._by_origin[entry["origin"]]
+
+    def _get(self, seq: int) -> dict[str, Any]:
+        return self._entries[seq % self.capacity]
+
+    def query(self,
+              limit: int = 100,
+              min_level: str = "D",
+              origin: Optional[str] = None,
+              since: int = 0) -> list[dict[str, Any]]:
+        """Returns up to `limit` newest entries matching the filters, oldest first.
+
+        Only entries with a sequence number greater than `since` are returned.
+        """
+        if limit <= 0:
+            return []
+        min_value = LEVEL_ORDER.get(min_level, 0)
+        with self._lock:
+            if origin is not None:
+                seqs = self._by_origin.get(origin, ())
+                matches = (seq for seq in reversed(seqs)
+                           if LEVEL_ORDER[self._get(seq)["level"]] >= min_value)
+            else:
+                # Merge the newest-first streams of every level at or above min_level
+                streams = [reversed(self._by_level[level]) for level in LEVELS[min_value:]]
+                matches = heapq.merge(*streams, reverse=True)
+            result = []
+            for seq in islice(matches, limit):
+                if seq <= since:
+                    break
+                result.append(self._get(seq))
+        result.reverse()
+        return result
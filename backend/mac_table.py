@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+from typing import Optional
+
+COALESCE_DELAY = 0.05  # seconds to wait for more updates before writing a batch
+
+
+class MacTable:
+    """MAC -> name table persisted as a JSON snapshot plus an append-only journal.
+
+    Updates are applied in memory immediately and written by a background
+    thread, which batches everything that queued up into one journal append and
+    fsync. Once the journal grows past `compact_after` records it is folded into
+    a new snapshot that atomically replaces the old one.
+    """
+
+    def __init__(self, path: str, compact_after: int = 1000) -> None:
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.compact_after = compact_after
+        self._table: dict[str, str] = {}
+        self._pending: list[tuple[str, str]] = []
+        self._journal_records = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._writer: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __contains__(self, mac: str) -> bool:
+        return mac in self._table
+
+    def __getitem__(self, mac: str) -> str:
+        return self._table[mac]
+
+    def __setitem__(self, mac: str, name: str) -> None:
+        with self._cond:
+            self._table[mac] = name
+            self._pending.append((mac, name))
+            self._cond.notify()
+
+    def get(self, mac: str, default: Optional[str] = None) -> Optional[str]:
+        return self._table.get(mac, default)
+
+    def items(self) -> list[tuple[str, str]]:
+        with self._cond:
+            return list(self._table.items())
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def load(self) -> list[str]:
+        """Reads the snapshot and replays the journal. Returns warnings about anything that was skipped."""
+        warnings = []
+        table = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    table = json.load(f)
+                if not isinstance(table, dict):
+                    warnings.append(f"{self.path} is not a dict, resetting table")
+                    table = {}
+            except (json.JSONDecodeError, ValueError) as e:
+                warnings.append(f"Failed to load {self.path} ({e}), starting with empty table")
+                table = {}
+
+        records = 0
+        corrupt = False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        mac, name = json.loads(line)
+                    except (json.JSONDecodeError, ValueError, TypeError):
+                        # Torn write from a crash, everything before it is still good
+                        warnings.append(f"Skipped a corrupt record in {self.journal_path}")
+                        corrupt = True
+                        continue
+                    table[mac] = name
+                    records += 1
+
+        with self._cond:
+            self._table = table
+            self._journal_records = records
+        if corrupt:
+            # New records must not be appended after a torn line
+            self.compact()
+        return warnings
+
+    def start(self) -> None:
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._writer = threading.Thread(target=self._write_loop, name="mac-table-writer", daemon=True)
+        self._writer.start()
+
+    def close(self) -> None:
+        """Stops the writer after it has written everything still queued."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self._write_pending()
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                # Let a registration storm pile up so it becomes one write
+                self._cond.wait(COALESCE_DELAY)
+            self._write_pending()
+
+    def _write_pending(self) -> None:
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        lines = "".join(json.dumps([mac, name]) + "\n" for mac, name in batch)
+        with open(self.journal_path, "a") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_records += len(batch)
+        if self._journal_records >= self.compact_after:
+            self.compact()
+
+    def compact(self) -> None:
+        """Writes the whole table to a fresh snapshot and empties the journal."""
+        with self._cond:
+            table = dict(self._table)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(table, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # Replaying journal records already in the snapshot is harmless, so a crash here loses nothing
+        with open(self.journal_path, "w") as f:
+            os.fsync(f.fileno())
+        self._journal_records = 0
@@ -0,0 +1,447 @@
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Optional
+
+FIELDS = ("cpu", "temp")
+
+# (seconds per point, seconds per partition directory, seconds kept on disk or None for forever)
+DEFAULT_TIERS = (
+    (1, 86400, 7 * 86400),
+    (60, 30 * 86400, 180 * 86400),
+    (3600, 365 * 86400, None),
+)
+
+
+BACKFILL_DIR = "backfill"  # per tier, rows a node recorded while it was offline
+ROLLUP_FILE = "rollup.json"  # per node, the buckets still open when the store was closed
+BACKFILL_IDLE = 60  # seconds without replayed history before a node's last backfill buckets are closed
+
+
+def _safe_name(uid: str) -> str:
+    return uid.replace(os.sep, "_").replace("..", "_")
+
+
+class Partition:
+    """Append-only columnar segment: one file per column, row i is element i of every file.
+
+    Rows are buffered in memory and appended to disk on `flush`. Reads mmap the
+    column files, binary search the timestamp column and slice the others.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.pending = self._empty()
+        self.flushing = self._empty()
+        self._repaired = False
+
+    @staticmethod
+    def _empty() -> dict[str, array]:
+        return {"ts": array("d"), **{field: array("f") for field in FIELDS}}
+
+    def _path(self, column: str) -> str:
+        return os.path.join(self.directory, f"{column}.{'f64' if column == 'ts' else 'f32'}")
+
+    def _repair(self) -> None:
+        # A crash between column writes leaves columns of different lengths, cut them back to the shortest
+        self._repaired = True
+        paths = [self._path(column) for column in self.pending]
+        if not all(os.path.exists(path) for path in paths):
+            return
+        rows = min(os.path.getsize(path) // self.pending[column].itemsize
+                   for column, path in zip(self.pending, paths))
+        for column, path in zip(self.pending, paths):
+            size = rows * self.pending[column].itemsize
+            if os.path.getsize(path) != size:
+                os.truncate(path, size)
+
+    def append(self, ts: float, values: dict[str, float]) -> None:
+        self.pending["ts"].append(ts)
+        for field in FIELDS:
+            self.pending[field].append(values.get(field, 0.0))
+
+    def detach(self) -> bool:
+        """Moves buffered rows aside for `write`, returns False when there is nothing to write."""
+        if not self.pending["ts"]:
+            return False
+        self.flushing, self.pending = self.pending, self._empty()
+        return True
+
+    def write(self) -> None:
+        """Appends the detached rows to disk. Safe to call without the store lock held."""
+        os.makedirs(self.directory, exist_ok=True)
+        if not self._repaired:
+            self._repair()
+        # Timestamp column last, so a row is only visible once all its values are on disk
+        for column in (*FIELDS, "ts"):
+            with open(self._path(column), "ab") as f:
+                self.flushing[column].tofile(f)
+
+    def written(self) -> None:
+        self.flushing = self._empty()
+
+    def last_ts(self) -> float:
+        """Timestamp of the newest row on disk or buffered, -inf when there is none."""
+        if self.pending["ts"]:
+            return self.pending["ts"][-1]
+        if self.flushing["ts"]:
+            return self.flushing["ts"][-1]
+        path = self._path("ts")
+        # A torn append leaves a partial row at the end, it does not count
+        rows = os.path.getsize(path) // 8 if os.path.exists(path) else 0
+        if not rows:
+            return float("-inf")
+        with open(path, "rb") as f:
+            f.seek((rows - 1) * 8)
+            return array("d", f.read(8))[0]
+
+    def buffered(self, start: float, end: float) -> list[tuple[float, ...]]:
+        """Rows between `start` and `end` not on disk yet. Caller holds the store lock."""
+        rows = []
+        for buffered in (self.flushing, self.pending):
+            stamps = buffered["ts"]
+            for i in range(bisect_left(stamps, start), bisect_right(stamps, end)):
+                rows.append((stamps[i], *(buffered[field][i] for field in FIELDS)))
+        return rows
+
+    def read(self, start: float, end: float, buffered: list[tuple[float, ...]]) -> list[tuple[float, ...]]:
+        """Rows on disk between `start` and `end`, followed by the `buffered` ones that did not land there yet."""
+        rows = []
+        last_on_disk = float("-inf")
+        ts_path = self._path("ts")
+        if os.path.exists(ts_path) and os.path.getsize(ts_path) > 0:
+            with open(ts_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                ts = memoryview(m).cast("d")
+                try:
+                    lo, hi = bisect_left(ts, start), bisect_right(ts, end)
+                    stamps = ts[lo:hi].tolist()
+                    last_on_disk = ts[-1]
+                finally:
+                    ts.release()
+            if stamps:
+                columns = [stamps]
+                for field in FIELDS:
+                    with open(self._path(field), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                        values = memoryview(m).cast("f")
+                        try:
+                            columns.append(values[lo:hi].tolist())
+                        finally:
+                            values.release()
+                rows.extend(zip(*columns))
+        rows.extend(row for row in buffered if row[0] > last_on_disk)
+        return rows
+
+
+class Tier:
+    """One resolution of one node's series, split into time partitions.
+
+    Live rows and backfilled rows (recorded by a node while it was offline,
+    delivered later) are kept in separate partitions, each sorted on its own,
+    and merged when read.
+    """
+
+    def __init__(self, directory: str, step: int, span: int, retention: Optional[int]) -> None:
+        self.directory = directory
+        self.backfill_directory = os.path.join(directory, BACKFILL_DIR)
+        self.step = step
+        self.span = span
+        self.retention = retention
+        self.partitions: dict[int, Partition] = {}
+        self.backfill: dict[int, Partition] = {}
+        self.rescan()
+        # Continue after the newest row on disk, the timestamp column must stay sorted across restarts
+        self.last_ts = self.partitions[max(self.partitions)].last_ts() if self.partitions else float("-inf")
+        self.backfill_last_ts = self.backfill[max(self.backfill)].last_ts() if self.backfill else float("-inf")
+
+    def rescan(self) -> None:
+        """Picks up partition directories created since the tier was loaded (e.g. by another process)."""
+        for directory, partitions in ((self.directory, self.partitions), (self.backfill_directory, self.backfill)):
+            if os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    if name.isdigit() and int(name) not in partitions:
+                        partitions[int(name)] = Partition(os.path.join(directory, name))
+
+    def _append(self, partitions: dict[int, Partition], directory: str, ts: float, values: dict[str, float]) -> None:
+        key = int(ts - ts % self.span)
+        partition = partitions.get(key)
+        if partition is None:
+            partition = partitions[key] = Partition(os.path.join(directory, str(key)))
+        partition.append(ts, values)
+
+    def append(self, ts: float, values: dict[str, float]) -> None:
+        if ts <= self.last_ts:
+            return  # keep the timestamp column sorted
+        self.last_ts = ts
+        self._append(self.partitions, self.directory, ts, values)
+
+    def append_backfill(self, ts: float, values: dict[str, float]) -> None:
+        # Nodes replay their history oldest first, anything older was already delivered
+        if ts <= self.backfill_last_ts:
+            return
+        self.backfill_last_ts = ts
+        self._append(self.backfill, self.backfill_directory, ts, values)
+
+    def detach(self) -> list[Partition]:
+        return [partition for partitions in (self.partitions, self.backfill)
+                for partition in partitions.values() if partition.detach()]
+
+    def select(self, start: float, end: float) -> list[tuple[Partition, list[tuple[float, ...]]]]:
+        """Partitions overlapping the range, with their rows not on disk yet. Caller holds the store lock."""
+        selected = []
+        for partitions in (self.partitions, self.backfill):
+            for key in sorted(partitions):
+                if key + self.span < start or key > end:
+                    continue
+                selected.append((partitions[key], partitions[key].buffered(start, end)))
+        return selected
+
+    def expire(self, now: float) -> None:
+        if self.retention is None:
+            return
+        for partitions in (self.partitions, self.backfill):
+            for key in [key for key in partitions if key + self.span < now - self.retention]:
+                shutil.rmtree(partitions.pop(key).directory, ignore_errors=True)
+
+
+class Rollup:
+    """Running average of the current bucket of a coarser tier."""
+    __slots__ = ("bucket", "count", "sums")
+
+    def __init__(self) -> None:
+        self.bucket = None
+        self.count = 0
+        self.sums = {field: 0.0 for field in FIELDS}
+
+    def state(self) -> Optional[list[Any]]:
+        return [self.bucket, self.count, dict(self.sums)] if self.count else None
+
+    def restore(self, state: Optional[list[Any]]) -> None:
+        if state:
+            bucket, count, sums = state
+            self.bucket, self.count = float(bucket), int(count)
+            self.sums = {field: float(sums.get(field, 0.0)) for field in FIELDS}
+
+
+class MetricsStore:
+    """Embedded per-node time series of status metrics with automatic roll-ups.
+
+    Each sample is written to the finest tier and folded into a running average
+    for every coarser one, which is appended when its bucket closes. `close`
+    saves the buckets still open, so a restart continues them. Queries are
+    answered from the coarsest tier that still has the requested resolution, so
+    weeks of history never require loading raw samples.
+    """
+
+    def __init__(self, root: str, tiers=DEFAULT_TIERS) -> None:
+        self.root = root
+        self.tier_specs = tuple(tiers)
+        self._series: dict[str, tuple[list[Tier], list[Rollup]]] = {}
+        self._backfills: dict[str, list[Rollup]] = {}  # open buckets of replayed history, per node
+        self._backfill_touched: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        if os.path.isdir(root):
+            for name in os.listdir(root):
+                self._load(name)
+
+    def _load(self, uid: str) -> tuple[list[Tier], list[Rollup]]:
+        series = self._series.get(uid)
+        if series is None:
+            base = os.path.join(self.root, _safe_name(uid))
+            tiers = [Tier(os.path.join(base, str(step)), step, span, retention)
+                     for step, span, retention in self.tier_specs]
+            series = self._series[uid] = (tiers, [Rollup() for _ in tiers])
+            self._restore(base, tiers, series[1])
+        return series
+
+    @staticmethod
+    def _restore(base: str, tiers: list[Tier], rollups: list[Rollup]) -> None:
+        # Taken over once, a crash later must not bring back buckets that were closed meanwhile
+        path = os.path.join(base, ROLLUP_FILE)
+        try:
+            with open(path) as f:
+                states = json.load(f)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[Backend] Ignoring unreadable {path}: {e}")
+            return
+        try:
+            for tier, rollup in zip(tiers, rollups):
+                rollup.restore(states.get(str(tier.step)))
+        except (AttributeError, TypeError, ValueError) as e:
+            print(f"[Backend] Ignoring unreadable {path}: {e}")
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def append(self, uid: str, ts: float, values: dict[str, Any]) -> None:
+        sample = {field: float(values.get(field) or 0.0) for field in FIELDS}
+        with self._lock:
+            tiers, rollups = self._load(uid)
+            for tier, rollup in zip(tiers, rollups):
+                bucket = ts - ts % tier.step
+                if rollup.bucket is not None and bucket != rollup.bucket:
+                    tier.append(float(rollup.bucket), {field: total / rollup.count for field, total in rollup.sums.items()})
+                    rollup.count = 0
+                    rollup.sums = dict.fromkeys(FIELDS, 0.0)
+                rollup.bucket = bucket
+                rollup.count += 1
+                for field in FIELDS:
+                    rollup.sums[field] += sample[field]
+
+    def backfill(self, uid: str, samples: list[tuple[float, dict[str, Any]]]) -> None:
+        """Adds (timestamp, values) a node recorded while it was offline, oldest first.
+
+        The samples are averaged into every tier's buckets by a running
+        roll-up of their own, kept apart from the live series, so late history
+        never disturbs the live roll-ups or the order of the live partitions.
+        A node replays in batches, so a bucket is only closed once a later one
+        starts, the replay has been idle for BACKFILL_IDLE or the store is
+        closed, never at the end of a batch.
+        """
+        samples = sorted(samples, key=lambda sample: sample[0])
+        with self._lock:
+            tiers, _ = self._load(uid)
+            rollups = self._backfill_rollups(uid, tiers)
+            self._backfill_touched[uid] = time.monotonic()
+            for tier, rollup in zip(tiers, rollups):
+                for ts, values in samples:
+                    bucket = ts - ts % tier.step
+                    if rollup.bucket is not None and bucket < rollup.bucket:
+                        continue  # older than what was already rolled up, e.g. a batch sent twice
+                    if rollup.bucket is not None and bucket != rollup.bucket:
+                        self._close_backfill(tier, rollup)
+                    rollup.bucket = bucket
+                    rollup.count += 1
+                    for field in FIELDS:
+                        rollup.sums[field] += float(values.get(field) or 0.0)
+
+    def _backfill_rollups(self, uid: str, tiers: list[Tier]) -> list[Rollup]:
+        # Caller holds the lock
+        rollups = self._backfills.get(uid)
+        if rollups is None:
+            rollups = self._backfills[uid] = [Rollup() for _ in tiers]
+        return rollups
+
+    def _close_backfills(self, idle_since: float) -> None:
+        # Caller holds the lock
+        for uid, touched in list(self._backfill_touched.items()):
+            if touched <= idle_since:
+                for tier, rollup in zip(self._series[uid][0], self._backfills.pop(uid)):
+                    self._close_backfill(tier, rollup)
+                del self._backfill_touched[uid]
+
+    @staticmethod
+    def _close_backfill(tier: Tier, rollup: Rollup) -> None:
+        if rollup.count:
+            tier.append_backfill(float(rollup.bucket), {field: total / rollup.count for field, total in rollup.sums.items()})
+        rollup.count = 0
+        rollup.sums = dict.fromkeys(FIELDS, 0.0)
+
+    def flush(self) -> None:
+        """Writes buffered rows to disk. Call periodically off the event loop.
+
+        Buffers are swapped out under the lock but written without it, so
+        appends from the MQTT thread don't wait on disk I/O.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._close_backfills(time.monotonic() - BACKFILL_IDLE)
+                partitions = [partition for tiers, _ in self._series.values()
+                              for tier in tiers for partition in tier.detach()]
+            for partition in partitions:
+                partition.write()
+            with self._lock:
+                for partition in partitions:
+                    partition.written()
+
+    def close(self) -> None:
+        """Writes buffered rows and saves the open roll-up buckets for the next start."""
+        with self._lock:
+            self._close_backfills(float("inf"))
+        self.flush()
+        with self._lock:
+            states = {uid: {str(tier.step): rollup.state() for tier, rollup in zip(tiers, rollups) if rollup.count}
+                      for uid, (tiers, rollups) in self._series.items()}
+        for uid, state in states.items():
+            if not state:
+                continue
+            base = os.path.join(self.root, _safe_name(uid))
+            os.makedirs(base, exist_ok=True)
+            tmp_path = os.path.join(base, ROLLUP_FILE + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, os.path.join(base, ROLLUP_FILE))
+
+    def refresh(self) -> None:
+        """Loads series and partitions another process created under `root`.
+
+        Queries read rows from disk every time, so this is all a read-only
+        store needs to follow the process that writes.
+        """
+        if not os.path.isdir(self.root):
+            return
+        names = os.listdir(self.root)
+        with self._lock:
+            for name in names:
+                if name in self._series:
+                    for tier in self._series[name][0]:
+                        tier.rescan()
+                else:
+                    self._load(name)
+
+    def expire(self, now: float) -> None:
+        """Deletes partitions that fell out of their tier's retention."""
+        with self._flush_lock, self._lock:
+            for tiers, _ in self._series.values():
+                for tier in tiers:
+                    tier.expire(now)
+
+    def query(self, uid: str, start: float, end: float, step: Optional[float] = None) -> dict[str, Any]:
+        """Returns points between `start` and `end` averaged into `step`-second buckets."""
+        if step is None or step <= 0:
+            step = max((end - start) / 1000, 1)
+        # The flush lock keeps buffered rows from landing on disk while they are read, the store lock is
+        # only held to pick partitions and copy buffers, so appends never wait on a long read
+        with self._flush_lock:
+            with self._lock:
+                if uid not in self._series:
+                    return {"uid": uid, "step": step, "tier": None, "points": []}
+                tiers, rollups = self._series[uid]
+                # Coarsest tier that still resolves the requested step
+                index = max((i for i, tier in enumerate(tiers) if tier.step <= step), default=0)
+                tier, rollup = tiers[index], rollups[index]
+                selected = tier.select(start, end)
+                merge = bool(tier.backfill)
+                open_row = None
+                if rollup.count and start <= rollup.bucket <= end:
+                    open_row = (float(rollup.bucket), *(rollup.sums[field] / rollup.count for field in FIELDS))
+            rows = []
+            for partition, buffered in selected:
+                rows.extend(partition.read(start, end, buffered))
+        if merge:
+            rows.sort()
+        if open_row is not None:
+            rows.append(open_row)
+
+        points = []
+        bucket, count, sums = None, 0, [0.0] * len(FIELDS)
+        for ts, *values in rows:
+            b = ts - (ts - start) % step
+            if b != bucket and count:
+                points.append([bucket, *(round(total / count, 2) for total in sums)])
+                count, sums = 0, [0.0] * len(FIELDS)
+            bucket = b
+            count += 1
+            for i, value in enumerate(values):
+                sums[i] += value
+        if count:
+            points.append([bucket, *(round(total / count, 2) for total in sums)])
+        return {"uid": uid, "step": step, "tier": tier.step, "fields": ["ts", *FIELDS], "points": points}
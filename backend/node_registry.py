@@ -0,0 +1,236 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Optional
+
+
+@dataclass(frozen=True, slots=True)
+class NodeRecord:
+    """Latest known state of one node. Records are immutable, updates replace them."""
+    uid: str
+    name: str
+    ip: str
+    cpu: float
+    temp: float
+    status: str
+    last_seen: str
+    last_seen_ts: float
+    mem: float = 0.0
+    net_rx: float = 0.0
+    net_tx: float = 0.0
+    disk_read: float = 0.0
+    disk_write: float = 0.0
+    groups: tuple[str, ...] = ()
+    version: int = 0
+
+    @classmethod
+    def from_status(cls,
+                    data: dict[str, Any],
+                    version: int = 0,
+                    previous: Optional["NodeRecord"] = None) -> "NodeRecord":
+        """Builds a record from a status message. Fields the message leaves out keep their `previous` value."""
+        if previous is None:
+            previous = _EMPTY
+        return cls(
+            uid=str(data["uid"]),
+            name=str(data.get("name", previous.name)),
+            ip=str(data.get("ip", previous.ip)),
+            cpu=float(data.get("cpu", previous.cpu)),
+            temp=float(data.get("temp", previous.temp)),
+            status=str(data.get("status", "online")),
+            last_seen=str(data.get("last_seen", "")),
+            last_seen_ts=float(data.get("last_seen_ts", 0.0)),
+            mem=float(data.get("mem", previous.mem)),
+            net_rx=float(data.get("net_rx", previous.net_rx)),
+            net_tx=float(data.get("net_tx", previous.net_tx)),
+            disk_read=float(data.get("disk_read", previous.disk_read)),
+            disk_write=float(data.get("disk_write", previous.disk_write)),
+            groups=_groups(data["groups"]) if "groups" in data else previous.groups,
+            version=version,
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "uid": self.uid,
+            "name": self.name,
+            "ip": self.ip,
+            "cpu": self.cpu,
+            "temp": self.temp,
+            "status": self.status,
+            "last_seen": self.last_seen,
+            "last_seen_ts": self.last_seen_ts,
+            "mem": self.mem,
+            "net_rx": self.net_rx,
+            "net_tx": self.net_tx,
+            "disk_read": self.disk_read,
+            "disk_write": self.disk_write,
+            "groups": list(self.groups),
+        }
+
+
+def _groups(value: Any) -> tuple[str, ...]:
+    # Nodes send their command groups comma separated
+    if isinstance(value, str):
+        value = value.split(",")
+    return tuple(sorted(str(group) for group in value if group))
+
+
+# Defaults for fields a node has never reported
+_EMPTY = NodeRecord(uid="", name="Unknown", ip="0.0.0.0", cpu=0.0, temp=0.0,
+                    status="online", last_seen="", last_seen_ts=0.0)
+
+
+class NodeRegistry:
+    """Thread-safe store of node records with a global change counter.
+
+    Writers (the MQTT thread) and readers (the event loop) only hold the lock
+    for a dict operation or a pointer copy. Each record's dict form is built
+    once when the record changes and never mutated afterwards, so snapshots can
+    be serialized outside the lock.
+
+    Removed nodes leave a tombstone for delta queries, kept for
+    `tombstone_ttl` seconds. Cursors older than `horizon` (the newest pruned
+    tombstone) may miss removals and have to start over.
+    """
+
+    def __init__(self, tombstone_ttl: float = 3600) -> None:
+        self.tombstone_ttl = tombstone_ttl
+        self._records: dict[str, NodeRecord] = {}
+        self._dicts: dict[str, dict[str, Any]] = {}
+        # uid -> version, kept in version order (most recently changed last)
+        self._changed: OrderedDict[str, int] = OrderedDict()
+        self._removed: OrderedDict[str, int] = OrderedDict()
+        self._removed_at: dict[str, float] = {}
+        self._horizon = 0
+        self._version = 0
+        self._snapshot: list[dict[str, Any]] = []
+        self._snapshot_version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._records
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def horizon(self) -> int:
+        """Version of the newest pruned tombstone, cursors older than this must reset."""
+        return self._horizon
+
+    def get(self, uid: str) -> Optional[NodeRecord]:
+        return self._records.get(uid)
+
+    def _store(self, record: NodeRecord) -> dict[str, Any]:
+        # Caller holds the lock and has already bumped the version
+        as_dict = record.to_dict()
+        self._records[record.uid] = record
+        self._dicts[record.uid] = as_dict
+        self._changed[record.uid] = record.version
+        self._changed.move_to_end(record.uid)
+        if self._removed.pop(record.uid, None) is not None:
+            del self._removed_at[record.uid]
+        return as_dict
+
+    def _tombstone(self, uid: str, version: int) -> None:
+        # Caller holds the lock. Tombstones stay in version order, the oldest are pruned from the front.
+        self._removed[uid] = version
+        self._removed.move_to_end(uid)
+        now = time.monotonic()
+        self._removed_at[uid] = now
+        while self._removed:
+            oldest = next(iter(self._removed))
+            if self._removed_at[oldest] > now - self.tombstone_ttl:
+                break
+            self._horizon = max(self._horizon, self._removed.pop(oldest))
+            del self._removed_at[oldest]
+
+    def _merge(self, data: dict[str, Any]) -> NodeRecord:
+        # Caller holds the lock. Nodes only send values that changed, the rest carry over.
+        self._version += 1
+        return NodeRecord.from_status(data, self._version, self._records.get(str(data["uid"])))
+
+    def update_many(self, statuses: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Applies a batch of status messages under one lock acquisition."""
+        with self._lock:
+            return [self._store(self._merge(data)) for data in statuses]
+
+    def replicate(self, rows: list[tuple[int, str, Optional[dict[str, Any]]]], version: int) -> tuple[list[dict[str, Any]], list[str]]:
+        """Applies changes made by another process's registry, keeping its versions.
+
+        `rows` are (version, uid, dict or None if removed) in version order.
+        Returns (changed dicts, removed uids).
+        """
+        changed = []
+        removed = []
+        with self._lock:
+            for row_version, uid, data in rows:
+                if data is None:
+                    if self._records.pop(uid, None) is not None:
+                        del self._dicts[uid]
+                        self._changed.pop(uid, None)
+                        removed.append(uid)
+                    self._tombstone(uid, row_version)
+                else:
+                    changed.append(self._store(NodeRecord.from_status(data, row_version)))
+            self._version = max(self._version, version)
+        return changed, removed
+
+    def mark_offline(self, uid: str, last_seen_ts: float) -> Optional[dict[str, Any]]:
+        """Marks a node offline unless it was seen again after `last_seen_ts` or is already offline."""
+        with self._lock:
+            record = self._records.get(uid)
+            if record is None or record.status == "offline" or record.last_seen_ts > last_seen_ts:
+                return None
+            self._version += 1
+            return self._store(replace(record, status="offline", version=self._version))
+
+    def remove(self, uid: str, last_seen_ts: Optional[float] = None) -> bool:
+        """Removes a node, only if it was not seen after `last_seen_ts` when that is given."""
+        with self._lock:
+            record = self._records.get(uid)
+            if record is None:
+                return False
+            if last_seen_ts is not None and record.last_seen_ts > last_seen_ts:
+                return False
+            self._version += 1
+            del self._records[uid]
+            del self._dicts[uid]
+            self._changed.pop(uid, None)
+            self._tombstone(uid, self._version)
+            return True
+
+    def records(self) -> list[NodeRecord]:
+        with self._lock:
+            return list(self._records.values())
+
+    def snapshot(self) -> tuple[int, list[dict[str, Any]]]:
+        """Returns (version, node dicts). The list is shared between callers, don't mutate it."""
+        with self._lock:
+            if self._snapshot_version != self._version:
+                self._snapshot = list(self._dicts.values())
+                self._snapshot_version = self._version
+            return self._version, self._snapshot
+
+    def changes_since(self, since: int) -> tuple[int, list[dict[str, Any]], list[str]]:
+        """Returns (version, nodes changed after `since`, uids removed after `since`)."""
+        with self._lock:
+            changed = []
+            for uid in reversed(self._changed):
+                if self._changed[uid] <= since:
+                    break
+                changed.append(self._dicts[uid])
+            removed = []
+            for uid in reversed(self._removed):
+                if self._removed[uid] <= since:
+                    break
+                removed.append(uid)
+            version = self._version
+        changed.reverse()
+        removed.reverse()
+        return version, changed, removed
@@ -0,0 +1,32 @@
+class IntervalAdvisor:
+    """Recommends how often nodes should send status, from how busy the ingest worker is.
+
+    Called once per server heartbeat with the worker's busy time and queue
+    depth since the last call. Above `target_busy` (or with a backlog) the
+    interval grows by `step`, below half of it the interval shrinks back
+    towards `min_interval`.
+    """
+
+    def __init__(self,
+                 min_interval: float = 2.0,
+                 max_interval: float = 30.0,
+                 target_busy: float = 0.5,
+                 backlog: int = 1000,
+                 step: float = 1.5) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_busy = target_busy
+        self.backlog = backlog
+        self.step = step
+        self.interval = min_interval
+        self.busy = 0.0  # fraction of the last period the worker spent applying batches
+
+    def update(self, busy_seconds: float, elapsed: float, queued: int) -> float:
+        if elapsed <= 0:
+            return self.interval
+        self.busy = min(1.0, busy_seconds / elapsed)
+        if self.busy > self.target_busy or queued > self.backlog:
+            self.interval = min(self.max_interval, self.interval * self.step)
+        elif self.busy < self.target_busy / 2:
+            self.interval = max(self.min_interval, self.interval / self.step)
+        return self.interval
@@ -0,0 +1,112 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+try:
+    import orjson
+except ImportError:  # stdlib json works, just slower
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip is always available, brotli only when installed
+    brotli = None
+
+IDENTITY = "identity"
+GZIP = "gzip"
+BROTLI = "br"
+
+MIN_COMPRESS_SIZE = 1024  # bytes, smaller bodies are sent as they are
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def pick_encoding(accept_encoding: Optional[str]) -> str:
+    """Best encoding we can produce that the client accepts (q-values are ignored except q=0)."""
+    if not accept_encoding:
+        return IDENTITY
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and BROTLI in accepted:
+        return BROTLI
+    if GZIP in accepted or "*" in accepted:
+        return GZIP
+    return IDENTITY
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class RenderCache:
+    """Pre-rendered JSON response bodies, each valid for one version of the store it came from.
+
+    The JSON is rendered once per (key, version) and each compressed variant
+    once per (key, version, encoding), no matter how many clients ask. Keys
+    are whatever identifies a response (e.g. the query parameters) and the
+    least recently used ones are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 64) -> None:
+        self.max_entries = max_entries
+        # key -> (version, {encoding: body})
+        self._entries: OrderedDict[Hashable, tuple[int, dict[str, bytes]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self,
+            key: Hashable,
+            version: int,
+            render: Callable[[], Any],
+            encoding: str = IDENTITY) -> tuple[bytes, str]:
+        """Returns (body, encoding actually used) for `key` at `version`, rendering only on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                variants = entry[1]
+            else:
+                variants = None
+
+        if variants is None:
+            self.misses += 1
+            variants = {IDENTITY: dumps(render())}
+            self._store(key, version, variants)
+        else:
+            self.hits += 1
+
+        body = variants[IDENTITY]
+        if encoding == IDENTITY or len(body) < MIN_COMPRESS_SIZE:
+            return body, IDENTITY
+        compressed = variants.get(encoding)
+        if compressed is None:
+            # Two requests may both compress on a race, both results are identical
+            compressed = variants[encoding] = _compress(body, encoding)
+        return compressed, encoding
+
+    def _store(self, key: Hashable, version: int, variants: dict[str, bytes]) -> None:
+        with self._lock:
+            current = self._entries.get(key)
+            # Never replace a newer render with an older one
+            if current is not None and current[0] > version:
+                return
+            self._entries[key] = (version, variants)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
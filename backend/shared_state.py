@@ -0,0 +1,361 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, shared-state mode is Linux only
+    fcntl = None
+
+from .log_store import LogStore
+from .mac_table import COALESCE_DELAY
+from .node_registry import NodeRegistry
+
+MAC_COUNT_REFRESH = 10  # seconds between recounts of the shared MAC table while idle
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS nodes (
+    uid TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data TEXT             -- NULL once the node was removed
+);
+CREATE INDEX IF NOT EXISTS nodes_version ON nodes (version);
+CREATE TABLE IF NOT EXISTS logs (seq INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS mac_table (uid TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS commands (id TEXT PRIMARY KEY, created REAL NOT NULL, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS commands_created ON commands (created);
+"""
+
+
+class LeaderLock:
+    """Exclusive, non-blocking flock on a file. The kernel releases it when the holder dies."""
+
+    def __init__(self, path: str) -> None:
+        if fcntl is None:
+            raise RuntimeError("Leader election needs fcntl (Linux/macOS)")
+        self.path = path
+        self.held = False
+        self._f = None
+
+    def try_acquire(self) -> bool:
+        if self.held:
+            return True
+        f = open(self.path, "a")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._f = f
+        self.held = True
+        return True
+
+    def release(self) -> None:
+        if self._f is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
+        self.held = False
+
+
+class SharedState:
+    """SQLite (WAL) database shared by every backend process on the host.
+
+    The leader writes node and log changes in one transaction per sync, the
+    other workers read them back by version/seq. The MAC table and command
+    summaries are written by whichever worker handles the request, through
+    its SharedWriter. WAL lets readers run while a writer commits. One
+    connection per user, guarded by a lock.
+    """
+
+    def __init__(self, path: str, log_capacity: int = 1000, command_history: int = 1000) -> None:
+        self.path = path
+        self.log_capacity = log_capacity
+        self.command_history = command_history
+        self._db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def boot_id(self, default: str) -> str:
+        """The boot id every worker uses in ETags and cursors, set by whichever process starts first."""
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('boot', ?)", (default,))
+            return self._db.execute("SELECT value FROM meta WHERE key = 'boot'").fetchone()[0]
+
+    def write(self,
+              version: int,
+              changed: list[dict[str, Any]],
+              removed: list[str],
+              logs: list[dict[str, Any]],
+              horizon: int = 0) -> None:
+        """Stores node changes up to registry `version` and new log entries in one transaction.
+
+        Removal rows up to `horizon` (tombstones the registry has pruned) are deleted.
+        """
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany("INSERT OR REPLACE INTO nodes (uid, version, data) VALUES (?, ?, ?)",
+                               [(data["uid"], version, json.dumps(data)) for data in changed])
+                db.executemany("INSERT OR REPLACE INTO nodes (uid, version, data) VALUES (?, ?, NULL)",
+                               [(uid, version) for uid in removed])
+                db.execute("DELETE FROM nodes WHERE data IS NULL AND version <= ?", (horizon,))
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(version),))
+                if logs:
+                    db.executemany("INSERT OR REPLACE INTO logs (seq, data) VALUES (?, ?)",
+                                   [(entry["seq"], json.dumps(entry)) for entry in logs])
+                    db.execute("DELETE FROM logs WHERE seq <= ?", (logs[-1]["seq"] - self.log_capacity,))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def read_nodes(self, since: int) -> tuple[int, list[tuple[int, str, Optional[dict[str, Any]]]]]:
+        """Returns (version, [(version, uid, dict or None if removed)]) for rows changed after `since`."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            rows = self._db.execute("SELECT version, uid, data FROM nodes WHERE version > ? ORDER BY version",
+                                    (since,)).fetchall()
+        version = int(row[0]) if row else 0
+        return version, [(v, uid, json.loads(data) if data is not None else None) for v, uid, data in rows]
+
+    def read_logs(self, since: int) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM logs WHERE seq > ? ORDER BY seq LIMIT ?",
+                                    (since, self.log_capacity)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def mac_get(self, uid: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT name FROM mac_table WHERE uid = ?", (uid,)).fetchone()
+        return row[0] if row else None
+
+    def mac_update(self, entries: dict[str, str]) -> None:
+        self.write_many(entries, [])
+
+    def mac_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM mac_table").fetchone()[0]
+
+    def write_many(self, names: dict[str, str], commands: list[tuple[str, float, dict[str, Any]]]) -> None:
+        """Stores MAC table entries and (id, created, summary) of commands in one transaction."""
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany("INSERT OR REPLACE INTO mac_table (uid, name) VALUES (?, ?)", names.items())
+                if commands:
+                    db.executemany("INSERT OR REPLACE INTO commands (id, created, data) VALUES (?, ?, ?)",
+                                   [(command_id, created, json.dumps(summary)) for command_id, created, summary in commands])
+                    db.execute("DELETE FROM commands WHERE created < "
+                               "(SELECT created FROM commands ORDER BY created DESC LIMIT 1 OFFSET ?)",
+                               (self.command_history - 1,))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def get_command(self, command_id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM commands WHERE id = ?", (command_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def recent_commands(self, limit: int = 50) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM commands ORDER BY created DESC LIMIT ?", (max(limit, 0),)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+
+class SharedWriter:
+    """Write-behind for what any worker writes to the shared database: MAC table entries and command summaries.
+
+    Callers only queue, so neither the event loop nor paho's network thread
+    waits for the database lock, which the leader may hold. A background
+    thread with its own connection lets updates pile up for COALESCE_DELAY
+    and commits all of them in one transaction, newest value per key. It also
+    keeps `mac_count` current (recounted after every write, and every
+    MAC_COUNT_REFRESH seconds for other workers' writes), so the metrics gauge
+    never queries the database from the event loop.
+    """
+
+    def __init__(self, path: str, log_capacity: int = 1000, command_history: int = 1000) -> None:
+        self.path = path
+        self.log_capacity = log_capacity
+        self.command_history = command_history
+        self.names: dict[str, str] = {}
+        self._commands: dict[str, tuple[float, dict[str, Any]]] = {}
+        self.mac_count = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._writer: Optional[threading.Thread] = None
+        self._state: Optional[SharedState] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self.names) + len(self._commands)
+
+    def put_name(self, uid: str, name: str) -> None:
+        with self._cond:
+            self.names[uid] = name
+            self._cond.notify()
+
+    def put_command(self, command_id: str, created: float, summary: dict[str, Any]) -> None:
+        with self._cond:
+            self._commands[command_id] = (created, summary)
+            self._cond.notify()
+
+    def start(self) -> None:
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._state = SharedState(self.path, log_capacity=self.log_capacity, command_history=self.command_history)
+        self.mac_count = self._state.mac_count()
+        self._writer = threading.Thread(target=self._write_loop, name="shared-state-writer", daemon=True)
+        self._writer.start()
+
+    def close(self) -> None:
+        """Stops the writer after it has written everything still queued."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._state is not None:
+            self._write_pending()
+            self.mac_count = self._state.mac_count()
+            self._state.close()
+            self._state = None
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._cond:
+                if self._running and not self.pending:
+                    self._cond.wait(MAC_COUNT_REFRESH)
+                if not self._running:
+                    return
+                if self.pending:
+                    # Let a registration storm pile up so it becomes one transaction
+                    self._cond.wait(COALESCE_DELAY)
+            try:
+                self._write_pending()
+                self.mac_count = self._state.mac_count()
+            except sqlite3.Error as e:
+                print(f"[Backend] Failed to write shared state, retrying: {e}")
+
+    def _write_pending(self) -> None:
+        with self._cond:
+            names, commands = dict(self.names), dict(self._commands)
+        if not names and not commands:
+            return
+        self._state.write_many(names, [(command_id, created, summary) for command_id, (created, summary) in commands.items()])
+        with self._cond:
+            # Keep what was queued again meanwhile for the next round
+            for uid, name in names.items():
+                if self.names.get(uid) == name:
+                    del self.names[uid]
+            for command_id, entry in commands.items():
+                if self._commands.get(command_id) is entry:
+                    del self._commands[command_id]
+
+
+class SharedMacTable:
+    """MacTable stand-in backed by the shared database, so every worker can register nodes.
+
+    Reads go to the database (after this worker's own queued updates), writes
+    are queued on the SharedWriter. The JSON table only seeds the database
+    the first time and is not updated in this mode, it goes stale.
+    """
+
+    def __init__(self, shared: SharedState, writer: SharedWriter) -> None:
+        self.shared = shared
+        self.writer = writer
+
+    @property
+    def pending(self) -> int:
+        return len(self.writer.names)
+
+    def __contains__(self, uid: str) -> bool:
+        return self.get(uid) is not None
+
+    def __getitem__(self, uid: str) -> str:
+        name = self.get(uid)
+        if name is None:
+            raise KeyError(uid)
+        return name
+
+    def __setitem__(self, uid: str, name: str) -> None:
+        self.writer.put_name(uid, name)
+
+    def __len__(self) -> int:
+        # Cached by the writer, this backs a metrics gauge on the event loop
+        return self.writer.mac_count
+
+    def get(self, uid: str, default: Optional[str] = None) -> Optional[str]:
+        name = self.writer.names.get(uid)
+        if name is None:
+            name = self.shared.mac_get(uid)
+        return default if name is None else name
+
+    def start(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class StateMirror:
+    """Moves node and log changes between a process's local stores and the shared database.
+
+    The leader `push`es what changed in its registry and log store since the
+    last push. Followers `pull` those changes into their own stores, keeping
+    the leader's version and sequence numbers so cursors and ETags mean the
+    same thing on every worker.
+    """
+
+    def __init__(self, shared: SharedState, nodes: NodeRegistry, logs: LogStore) -> None:
+        self.shared = shared
+        self.nodes = nodes
+        self.logs = logs
+        self.version = 0  # registry version synced so far, in either direction
+        self.seq = 0      # log sequence number synced so far
+
+    def lead(self) -> None:
+        """Called on becoming leader: everything already in the local stores came from the database."""
+        self.version = self.nodes.version
+        self.seq = self.logs.last_seq
+
+    def push(self) -> None:
+        version, changed, removed = self.nodes.changes_since(self.version)
+        entries = self.logs.query(limit=self.logs.capacity, since=self.seq)
+        if version == self.version and not entries:
+            return
+        self.shared.write(version, changed, removed, entries, horizon=self.nodes.horizon)
+        self.version = version
+        if entries:
+            self.seq = entries[-1]["seq"]
+
+    def pull(self) -> tuple[list[dict[str, Any]], list[str], list[dict[str, Any]]]:
+        """Applies the leader's changes locally, returns (changed nodes, removed uids, new logs)."""
+        version, rows = self.shared.read_nodes(self.version)
+        changed, removed = self.nodes.replicate(rows, version)
+        self.version = max(self.version, version)
+        entries = self.logs.replicate(self.shared.read_logs(self.seq))
+        if entries:
+            self.seq = entries[-1]["seq"]
+        return changed, removed, entries
+
+
+def leader_lock_path(path: str) -> str:
+    return os.path.abspath(path) + ".leader"
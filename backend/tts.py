@@ -0,0 +1,272 @@
+import hashlib
+import math
+import os
+import queue
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Iterator, Optional
+
+XTTS_MODEL = "tts_models/multilingual/multi-dataset/xtts_v2"
+
+
+def wav_header(sample_rate: int, data_bytes: Optional[int] = None) -> bytes:
+    """RIFF header for 16-bit mono PCM. Without a length (streaming) the sizes are set to the maximum."""
+    size = 0xFFFFFFFF if data_bytes is None else data_bytes
+    riff_size = 0xFFFFFFFF if data_bytes is None else 36 + data_bytes
+    return (b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+            + b"data" + struct.pack("<I", size))
+
+
+class XttsModel:
+    """coqui-tts XTTS v2, streaming 16-bit PCM chunks while it synthesizes."""
+    sample_rate = 24000
+
+    def __init__(self, model_name: str = XTTS_MODEL, device: str = "cpu") -> None:
+        # Imported here, on the TTS worker thread: coqui-tts pulls in torch, which would slow every backend import
+        try:
+            from TTS.api import TTS
+        except ImportError:
+            raise RuntimeError("coqui-tts is not installed, use the stub model or install serverRequirements.txt")
+        self.name = model_name
+        self._model = TTS(model_name, progress_bar=False).to(device).synthesizer.tts_model
+
+    def speaker(self, wav_path: str) -> Any:
+        """Conditioning latents of a reference recording, the expensive part of voice cloning."""
+        return self._model.get_conditioning_latents(audio_path=[wav_path])
+
+    def stream(self, text: str, language: str, speaker: Any) -> Iterator[bytes]:
+        gpt_cond_latent, speaker_embedding = speaker
+        for chunk in self._model.inference_stream(text, language, gpt_cond_latent, speaker_embedding):
+            yield (chunk.squeeze().clamp(-1, 1) * 32767).short().cpu().numpy().tobytes()
+
+
+class StubModel:
+    """Stand-in for tests and development: one short tone per word, no downloads, no torch."""
+    sample_rate = 16000
+    name = "stub"
+
+    def speaker(self, wav_path: str) -> Any:
+        with open(wav_path, "rb") as f:
+            return hashlib.sha256(f.read()).digest()[0]
+
+    def stream(self, text: str, language: str, speaker: Any) -> Iterator[bytes]:
+        for word in text.split():
+            pitch = 200 + (sum(word.encode()) + speaker) % 400
+            samples = array("h", (int(8000 * math.sin(2 * math.pi * pitch * i / self.sample_rate))
+                                  for i in range(self.sample_rate // 10)))
+            yield samples.tobytes()
+
+
+def load_model(kind: str):
+    """Builds the model selected by name: xtts (coqui-tts XTTS v2) or stub."""
+    if kind == "stub":
+        return StubModel()
+    if kind == "xtts":
+        return XttsModel()
+    raise ValueError(f"Unknown TTS model {kind!r}")
+
+
+class _Job:
+    __slots__ = ("text", "language", "speaker_wav", "key", "chunks", "cancelled")
+
+    def __init__(self, text: str, language: str, speaker_wav: str, key: str) -> None:
+        self.text = text
+        self.language = language
+        self.speaker_wav = speaker_wav
+        self.key = key
+        self.chunks: queue.Queue = queue.Queue()
+        self.cancelled = False
+
+
+class TtsService:
+    """Long-lived text-to-speech worker shared by every request.
+
+    The model is loaded once, on the worker thread, so startup does not wait
+    for it; requests before it is ready get an error. Jobs run one at a time
+    (the model is neither thread-safe nor faster in parallel on a CPU) and
+    their PCM chunks are handed to the caller as they are produced.
+
+    Speaker latents (and the hashes of the recordings they are keyed by) are
+    cached per reference recording, by content, `speakers` of each. Finished
+    audio is cached by a hash of model, voice, language and text, least
+    recently used first out once `cache_bytes` is exceeded, so a repeated
+    phrase costs no synthesis at all.
+    """
+
+    def __init__(self, model_factory, cache_bytes: int = 64 * 1024 * 1024, speakers: int = 16) -> None:
+        self.model_factory = model_factory
+        self.model = None
+        self.error: Optional[str] = None
+        self.cache_bytes = cache_bytes
+        self.max_speakers = speakers
+        self.hits = 0
+        self.misses = 0
+        self._audio: OrderedDict[str, bytes] = OrderedDict()
+        self._audio_bytes = 0
+        self._speakers: OrderedDict[bytes, Any] = OrderedDict()
+        self._digests: OrderedDict[tuple[str, int, int], bytes] = OrderedDict()
+        self._jobs: queue.Queue = queue.Queue()
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        """Jobs waiting for the worker."""
+        return self._jobs.qsize()
+
+    @property
+    def ready(self) -> bool:
+        return self.model is not None
+
+    @property
+    def cached_bytes(self) -> int:
+        return self._audio_bytes
+
+    def start(self) -> None:
+        if self._worker is not None:
+            return
+        self._stopping = False
+        self._worker = threading.Thread(target=self._work_loop, name="tts-worker", daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Lets the current job finish and fails the queued ones. A model still loading is abandoned."""
+        if self._worker is None:
+            return
+        self._stopping = True
+        self._fail_queued()
+        self._jobs.put(None)
+        self._worker.join(timeout)
+        self._worker = None
+
+    def _fail_queued(self) -> None:
+        # Their callers are waiting on the chunk queue, end each stream with an error
+        with self._jobs.mutex:
+            jobs = list(self._jobs.queue)
+            self._jobs.queue.clear()
+        for job in jobs:
+            if job is not None:
+                job.chunks.put(RuntimeError("TTS service stopped"))
+
+    def _digest(self, path: str) -> bytes:
+        # Hash the recording once per version of the file
+        stat = os.stat(path)
+        file_key = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(file_key)
+            if digest is not None:
+                self._digests.move_to_end(file_key)
+                return digest
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).digest()
+        with self._lock:
+            self._digests[file_key] = digest
+            while len(self._digests) > self.max_speakers:
+                self._digests.popitem(last=False)
+        return digest
+
+    def cache_key(self, text: str, language: str, speaker_wav: str) -> str:
+        h = hashlib.sha256()
+        for part in (self.model.name.encode(), self._digest(speaker_wav), language.encode(), text.encode()):
+            h.update(len(part).to_bytes(4, "little") + part)
+        return h.hexdigest()
+
+    def cached(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._audio.get(key)
+            if audio is not None:
+                self._audio.move_to_end(key)
+            return audio
+
+    def _store(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.cache_bytes:
+            return
+        with self._lock:
+            if key in self._audio:
+                return
+            self._audio[key] = audio
+            self._audio_bytes += len(audio)
+            while self._audio_bytes > self.cache_bytes:
+                _, old = self._audio.popitem(last=False)
+                self._audio_bytes -= len(old)
+
+    def synthesize(self, text: str, speaker_wav: str, language: str = "en") -> Iterator[bytes]:
+        """Yields 16-bit mono PCM at `model.sample_rate`, chunk by chunk as it is synthesized.
+
+        Closing the iterator early cancels the job. Raises RuntimeError when
+        the model is not loaded.
+        """
+        if self.model is None:
+            raise RuntimeError(self.error or "TTS model is still loading")
+        if self._stopping:
+            raise RuntimeError("TTS service stopped")
+        text = " ".join(text.split())
+        key = self.cache_key(text, language, speaker_wav)
+        audio = self.cached(key)
+        if audio is not None:
+            self.hits += 1
+            yield audio
+            return
+        job = _Job(text, language, speaker_wav, key)
+        self._jobs.put(job)
+        try:
+            while True:
+                chunk = job.chunks.get()
+                if isinstance(chunk, Exception):
+                    raise RuntimeError(f"Synthesis failed: {chunk}")
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            job.cancelled = True
+
+    def _speaker(self, wav_path: str) -> Any:
+        # Worker thread only
+        digest = self._digest(wav_path)
+        speaker = self._speakers.get(digest)
+        if speaker is None:
+            speaker = self._speakers[digest] = self.model.speaker(wav_path)
+            while len(self._speakers) > self.max_speakers:
+                self._speakers.popitem(last=False)
+        self._speakers.move_to_end(digest)
+        return speaker
+
+    def _work_loop(self) -> None:
+        try:
+            self.model = self.model_factory()
+            print(f"[Backend] TTS model {self.model.name} loaded")
+        except Exception as e:
+            self.error = f"TTS model failed to load: {e}"
+            print(f"[Backend] {self.error}")
+            return
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                self._fail_queued()  # queued while stop() was running
+                return
+            if job.cancelled:
+                continue
+            # An identical job queued earlier may have produced it meanwhile
+            audio = self.cached(job.key)
+            if audio is not None:
+                self.hits += 1
+                job.chunks.put(audio)
+                job.chunks.put(None)
+                continue
+            self.misses += 1
+            chunks = []
+            try:
+                for chunk in self.model.stream(job.text, job.language, self._speaker(job.speaker_wav)):
+                    if job.cancelled:
+                        break
+                    chunks.append(chunk)
+                    job.chunks.put(chunk)
+                else:
+                    self._store(job.key, b"".join(chunks))
+            except Exception as e:
+                job.chunks.put(e)
+                continue
+            job.chunks.put(None)
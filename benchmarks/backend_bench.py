@@ -0,0 +1,401 @@
+# backend_bench.py
+# End-to-end load and latency benchmark for the dashboard backend.
+#
+#   python -m benchmarks.backend_bench --nodes 2000 --output run.json
+#   python -m benchmarks.backend_bench --broker localhost --nodes 2000 --compare run.json
+#
+# Without --broker the backend runs in this process against an in-process MQTT
+# stand-in. With --broker it runs under uvicorn in a subprocess against a real
+# broker (e.g. a local mosquitto).
+import argparse
+import json
+import os
+import platform
+import queue
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+import paho.mqtt.client as mqtt
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from common import Log, LogLevel, wire  # noqa: E402
+
+
+class LoopbackBroker:
+    """Routes publishes between LoopbackClients on one delivery thread, like a broker plus paho's network thread."""
+
+    def __init__(self) -> None:
+        self.clients: list["LoopbackClient"] = []
+        self.queue: queue.Queue = queue.Queue()
+        self.delivered = 0
+        self.callback_time = 0.0
+        threading.Thread(target=self._deliver_loop, name="loopback-broker", daemon=True).start()
+
+    def _deliver_loop(self) -> None:
+        while True:
+            topic, payload = self.queue.get()
+            msg = mqtt.MQTTMessage(topic=topic.encode())
+            msg.payload = payload
+            for client in self.clients:
+                if any(mqtt.topic_matches_sub(sub, topic) for sub in client.subscriptions):
+                    start = time.perf_counter()
+                    client.deliver(msg)
+                    self.callback_time += time.perf_counter() - start
+            self.delivered += 1
+
+
+_broker: Optional[LoopbackBroker] = None
+
+
+def loopback_broker() -> LoopbackBroker:
+    """The shared in-process broker, created on first use so importing this module starts no thread."""
+    global _broker
+    if _broker is None:
+        _broker = LoopbackBroker()
+    return _broker
+
+
+class LoopbackClient:
+    """The subset of paho's Client the backend and this benchmark use."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.subscriptions: set[str] = set()
+        self.callbacks: dict[str, Callable] = {}
+        self.on_message: Optional[Callable] = None
+        self.on_connect: Optional[Callable] = None
+        self.on_disconnect: Optional[Callable] = None
+        loopback_broker().clients.append(self)
+
+    def connect(self, *args, **kwargs) -> int:
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+        return 0
+
+    connect_async = connect
+
+    def reconnect_delay_set(self, *args, **kwargs) -> None:
+        pass
+
+    def subscribe(self, topic: str, *args, **kwargs) -> tuple[int, int]:
+        self.subscriptions.add(topic)
+        return 0, 0
+
+    def message_callback_add(self, sub: str, callback: Callable) -> None:
+        self.callbacks[sub] = callback
+
+    def publish(self, topic: str, payload: Any = None, *args, **kwargs) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode()
+        loopback_broker().queue.put((topic, payload))
+
+    def deliver(self, msg: mqtt.MQTTMessage) -> None:
+        for sub, callback in self.callbacks.items():
+            if mqtt.topic_matches_sub(sub, msg.topic):
+                callback(self, None, msg)
+                return
+        if self.on_message is not None:
+            self.on_message(self, None, msg)
+
+    def loop_start(self) -> None:
+        pass
+
+    def loop_stop(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+    def is_connected(self) -> bool:
+        return True
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentiles(samples: list[float]) -> dict[str, Optional[float]]:
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p99_ms": pick(0.99), "max_ms": round(ordered[-1] * 1000, 3),
+            "mean_ms": round(statistics.fmean(ordered) * 1000, 3)}
+
+
+class Backend:
+    """Starts the backend in-process (loopback MQTT) or as a uvicorn subprocess (real broker)."""
+
+    def __init__(self, broker: Optional[str], workdir: str) -> None:
+        self.broker = broker
+        self.workdir = workdir
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.pid = os.getpid()
+        self._server = None
+        self._process = None
+
+    def start(self) -> None:
+        if self.broker is None:
+            # The backend creates its paho client when the app starts, swap in the stand-in first
+            mqtt.Client = LoopbackClient
+            os.chdir(self.workdir)
+            import uvicorn
+            from backend import dashboard_backend
+            config = uvicorn.Config(dashboard_backend.app, host="127.0.0.1", port=self.port, log_level="warning")
+            self._server = uvicorn.Server(config)
+            threading.Thread(target=self._server.run, daemon=True).start()
+        else:
+            env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+            self._process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "backend.dashboard_backend:app",
+                 "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"],
+                cwd=self.workdir, env=env, stdout=subprocess.DEVNULL)
+            self.pid = self._process.pid
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                requests.get(f"{self.url}/api/nodes", timeout=1)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.05)
+        raise RuntimeError("Backend did not start within 30s")
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(timeout=10)
+
+
+class Traffic:
+    """Publishes synthetic status and log messages for a fleet of fake nodes."""
+
+    def __init__(self, client, nodes: int, interval: float, log_rate: float, encoding: str) -> None:
+        self.client = client
+        self.uids = [f"bench-{i:05d}" for i in range(nodes)]
+        self.interval = interval
+        self.log_rate = log_rate
+        self.encoding = encoding
+        self.published = 0
+        self.running = False
+
+    def status(self, uid: str, **fields: Any) -> Any:
+        status = {
+            "uid": uid,
+            "name": uid,
+            "ip": "10.0.0.1",
+            "cpu": 12.5,
+            "temp": 48.0,
+            "status": "online",
+            "last_seen": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **fields,
+        }
+        return wire.encode_status(status, self.encoding)
+
+    def burst(self) -> None:
+        for uid in self.uids:
+            self.client.publish(f"node/{uid}/status", self.status(uid))
+        self.published += len(self.uids)
+
+    def _run(self) -> None:
+        # One pass over the fleet per interval, logs spread in between
+        levels = [LogLevel.DEBUG, LogLevel.INFO, LogLevel.INFO, LogLevel.WARNING]
+        logs_per_status = self.log_rate * self.interval / max(1, len(self.uids))
+        owed = 0.0
+        while self.running:
+            start = time.perf_counter()
+            for i, uid in enumerate(self.uids):
+                if not self.running:
+                    return
+                self.client.publish(f"node/{uid}/status", self.status(uid))
+                owed += logs_per_status
+                while owed >= 1:
+                    log = Log(origin=uid, message=f"bench message {self.published}", level=levels[self.published % 4])
+                    self.client.publish(f"node/{uid}/log", wire.encode_logs([log], self.encoding))
+                    owed -= 1
+                self.published += 1
+                # Pace to the interval
+                ahead = start + self.interval * (i + 1) / len(self.uids) - time.perf_counter()
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def start(self) -> None:
+        self.running = True
+        threading.Thread(target=self._run, name="traffic", daemon=True).start()
+
+    def stop(self) -> None:
+        self.running = False
+
+
+def measure_ingest(backend: Backend, traffic: Traffic, timeout: float = 120) -> dict[str, Any]:
+    """Publishes one status per node as fast as possible and times until the API shows all of them."""
+    session = requests.Session()
+    start = time.perf_counter()
+    traffic.burst()
+    expected = len(traffic.uids)
+    seen = 0
+    while time.perf_counter() - start < timeout:
+        seen = len(session.get(f"{backend.url}/api/nodes").json())
+        if seen >= expected:
+            break
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    return {"messages": expected, "visible": seen, "seconds": round(elapsed, 3), "msgs_per_s": round(seen / elapsed, 1)}
+
+
+def measure_visibility(backend: Backend, client, probes: int, encoding: str) -> dict[str, Any]:
+    """Time from publishing a status to seeing it through /api/nodes?since=."""
+    session = requests.Session()
+    latencies = []
+    version = session.get(f"{backend.url}/api/nodes", params={"since": 0}).json()["version"]
+    for n in range(probes):
+        marker = float(n)
+        status = {"uid": "bench-probe", "name": "probe", "ip": "10.0.0.2", "cpu": marker, "temp": 0.0,
+                  "status": "online", "last_seen": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        start = time.perf_counter()
+        client.publish("node/bench-probe/status", wire.encode_status(status, encoding))
+        while time.perf_counter() - start < 5:
+            data = session.get(f"{backend.url}/api/nodes", params={"since": version}).json()
+            version = data["version"]
+            if any(node["uid"] == "bench-probe" and node["cpu"] == marker for node in data["nodes"]):
+                latencies.append(time.perf_counter() - start)
+                break
+            time.sleep(0.002)
+        time.sleep(0.02)
+    return percentiles(latencies)
+
+
+def measure_pollers(backend: Backend, pollers: int, duration: float) -> dict[str, Any]:
+    """Concurrent dashboards polling the full endpoints (no cursors, no ETags) as fast as they can."""
+    results: dict[str, list[float]] = {"/api/nodes": [], "/api/logs": []}
+    errors = 0
+    stop = time.perf_counter() + duration
+
+    def poll(path: str) -> None:
+        nonlocal errors
+        session = requests.Session()
+        samples = results[path]
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                session.get(f"{backend.url}{path}", timeout=10).raise_for_status()
+                samples.append(time.perf_counter() - start)
+            except requests.RequestException:
+                errors += 1
+
+    threads = [threading.Thread(target=poll, args=(path,)) for path in results for _ in range(pollers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    out = {path: dict(percentiles(samples), rps=round(len(samples) / duration, 1)) for path, samples in results.items()}
+    out["errors"] = errors
+    return out
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], prefix: str = "") -> None:
+    for key, value in current.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            compare(value, other or {}, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and isinstance(other, (int, float)) and other:
+            change = (value - other) / other * 100
+            print(f"  {prefix}{key}: {other} -> {value} ({change:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backend load and latency benchmark")
+    parser.add_argument("--broker", help="MQTT broker host, runs the backend under uvicorn; default is in-process")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--interval", type=float, default=2, help="seconds between status messages per node")
+    parser.add_argument("--log-rate", type=float, default=200, help="log messages per second across the fleet")
+    parser.add_argument("--pollers", type=int, default=4, help="concurrent pollers per endpoint")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of steady-state polling")
+    parser.add_argument("--probes", type=int, default=100, help="visibility latency samples")
+    parser.add_argument("--encoding", choices=[wire.JSON, wire.MSGPACK], default=wire.JSON)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pinest-bench-")
+    backend = Backend(args.broker, workdir)
+    backend.start()
+    if args.broker is None:
+        client = LoopbackClient()
+    else:
+        client = mqtt.Client(client_id=f"bench-{uuid.uuid4().hex[:6]}", protocol=mqtt.MQTTv311)
+        client.connect(args.broker, 1883, 60)
+        client.loop_start()
+    rss_start = rss_bytes(backend.pid)
+
+    traffic = Traffic(client, args.nodes, args.interval, args.log_rate, args.encoding)
+    try:
+        print(f"[Bench] Ingesting {args.nodes} node statuses...")
+        ingest = measure_ingest(backend, traffic)
+        traffic.start()
+        print(f"[Bench] Measuring visibility latency ({args.probes} probes)...")
+        visibility = measure_visibility(backend, client, args.probes, args.encoding)
+        print(f"[Bench] Polling with {args.pollers} clients per endpoint for {args.duration}s...")
+        polling = measure_pollers(backend, args.pollers, args.duration)
+        traffic.stop()
+        rss_end = rss_bytes(backend.pid)
+    finally:
+        traffic.stop()
+        backend.stop()
+
+    results = {
+        "config": {**vars(args), "mode": "broker" if args.broker else "in-process"},
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+                        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": {
+            "ingest": ingest,
+            "visibility_latency": visibility,
+            "polling": polling,
+            "steady_state_published": traffic.published,
+            "memory": {"rss_start": rss_start, "rss_end": rss_end,
+                       "rss_growth": rss_end - rss_start if rss_start and rss_end else None},
+        },
+    }
+    if args.broker is None:
+        broker = loopback_broker()
+        results["results"]["loopback"] = {"delivered": broker.delivered,
+                                          "callback_seconds": round(broker.callback_time, 3),
+                                          "backlog": broker.queue.qsize()}
+
+    print(json.dumps(results["results"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"[Bench] Compared to {args.compare}:")
+        compare(results["results"], baseline.get("results", {}))
+
+
+if __name__ == "__main__":
+    main()
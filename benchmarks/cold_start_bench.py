@@ -0,0 +1,134 @@
+# cold_start_bench.py
+# Cold-start benchmark for the dashboard backend.
+#
+#   python -m benchmarks.cold_start_bench --runs 5 --output start.json
+#   python -m benchmarks.cold_start_bench --runs 5 --compare start.json
+#
+# Every run starts a fresh interpreter in an empty working directory and
+# measures how long `import backend.dashboard_backend` takes, then how long a
+# uvicorn subprocess takes until /api/nodes answers. Whether a broker is
+# listening on localhost changes the result, so the run records which case was
+# measured.
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Optional
+
+import requests
+
+from benchmarks.backend_bench import REPO_ROOT, compare, free_port
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import backend.dashboard_backend; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def broker_listening(host: str = "localhost", port: int = 1883) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def measure_import(workdir: str) -> Optional[float]:
+    """Seconds spent importing the backend module, None if the import failed."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=workdir, env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_ready(workdir: str, timeout: float = 60) -> Optional[float]:
+    """Seconds from spawning uvicorn until the first successful /api/nodes, None if it never answered."""
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.dashboard_backend:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                return None  # crashed during startup
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/api/nodes", timeout=1).ok:
+                    return time.perf_counter() - start
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.01)
+        return None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def summarize(samples: list[Optional[float]]) -> dict[str, Any]:
+    ok = [sample for sample in samples if sample is not None]
+    if not ok:
+        return {"runs": len(samples), "failed": len(samples), "median_ms": None, "min_ms": None, "max_ms": None}
+    return {
+        "runs": len(samples),
+        "failed": len(samples) - len(ok),
+        "median_ms": round(statistics.median(ok) * 1000, 1),
+        "min_ms": round(min(ok) * 1000, 1),
+        "max_ms": round(max(ok) * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backend cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    imports, ready = [], []
+    for run in range(args.runs):
+        # A fresh directory each run, so no metrics, archive or MAC table is left over
+        workdir = tempfile.mkdtemp(prefix="pinest-start-")
+        try:
+            print(f"[Bench] Run {run + 1}/{args.runs}...")
+            imports.append(measure_import(workdir))
+            ready.append(measure_ready(workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "config": {**vars(args), "broker_listening": broker_listening()},
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+                        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": {
+            "import": summarize(imports),
+            "ready": summarize(ready),
+        },
+    }
+
+    print(json.dumps(results["results"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"[Bench] Compared to {args.compare}:")
+        compare(results["results"], baseline.get("results", {}))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
 from .log import Log, LogLevel
+from . import wire
 
-__all__ = ["Log", "LogLevel"]
\ No newline at end of file
+__all__ = ["Log", "LogLevel", "wire"]
\ No newline at end of file
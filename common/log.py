@@ -13,7 +13,8 @@ class Log:
     def __init__(self, origin: str, message: str, level: LogLevel = LogLevel.INFO):
         self.level = level
         self.message = message
-        self.timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.created = time.time()
+        self.timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.created))
         self.origin = origin
 
     def to_dict(self) -> dict[str, Any]:
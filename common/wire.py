@@ -0,0 +1,105 @@
+import json
+import time
+from typing import Any, Union
+
+try:
+    import msgpack
+except ImportError:  # compact encoding is optional, JSON always works
+    msgpack = None
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # faster decoding when available, same results either way
+    _json_loads = json.loads
+
+from .log import Log
+
+# First byte of a compact payload. JSON payloads always start with '{' or '[',
+# so the byte doubles as the format/version field.
+WIRE_VERSION = 1
+COMPACT_PREFIX = bytes([WIRE_VERSION])
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+_MAX_CREATED = 253402214400  # 9999-12-31, the last day strftime can format
+
+
+def compact_available() -> bool:
+    return msgpack is not None
+
+
+def encode_status(status: dict[str, Any], encoding: str = JSON) -> Union[str, bytes]:
+    if encoding == MSGPACK and msgpack is not None:
+        return COMPACT_PREFIX + msgpack.packb(status)
+    return json.dumps(status)
+
+
+def encode_logs(logs: list[Log], encoding: str = JSON) -> Union[str, bytes]:
+    """Packs one or more logs into a single payload. A single JSON log keeps the original format."""
+    if encoding == MSGPACK and msgpack is not None:
+        # Fixed-order records instead of dicts: [epoch seconds, level, origin, message]
+        records = [[int(log.created), log.level.value, log.origin, log.message] for log in logs]
+        return COMPACT_PREFIX + msgpack.packb(records)
+    if len(logs) == 1:
+        return logs[0].to_json()
+    return json.dumps([log.to_dict() for log in logs])
+
+
+def encode_history(statuses: list[dict[str, Any]], encoding: str = JSON) -> Union[str, bytes]:
+    """Packs full statuses a node recorded while it was offline, oldest first."""
+    if encoding == MSGPACK and msgpack is not None:
+        return COMPACT_PREFIX + msgpack.packb(statuses)
+    return json.dumps(statuses)
+
+
+def is_compact(payload: bytes) -> bool:
+    return payload[:1] == COMPACT_PREFIX
+
+
+def _unpack(payload: bytes) -> Any:
+    if msgpack is None:
+        raise ValueError("Received a compact payload but msgpack is not installed")
+    return msgpack.unpackb(payload[1:])
+
+
+def decode_status(payload: bytes) -> dict[str, Any]:
+    if is_compact(payload):
+        return _unpack(payload)
+    return _json_loads(payload)
+
+
+def decode_logs(payload: bytes) -> list[dict[str, Any]]:
+    """Decodes a log payload in any supported format into a list of log dicts."""
+    if is_compact(payload):
+        records = _unpack(payload)
+        if not isinstance(records, list):
+            raise ValueError("Compact log payload is not a list of records")
+        logs = []
+        for record in records:
+            if not isinstance(record, list) or len(record) != 4:
+                raise ValueError("Compact log records are [created, level, origin, message]")
+            created, level, origin, message = record
+            # localtime raises OverflowError/OSError outside its range, reject those here as bad input
+            if isinstance(created, bool) or not isinstance(created, (int, float)) or not 0 <= created <= _MAX_CREATED:
+                raise ValueError(f"Log timestamp out of range: {created!r}")
+            if not all(isinstance(value, str) for value in (level, origin, message)):
+                raise ValueError("Log level, origin and message must be strings")
+            logs.append({
+                "timestamp": time.strftime(TIMESTAMP_FORMAT, time.localtime(created)),
+                "origin": origin,
+                "level": level,
+                "message": message,
+            })
+        return logs
+    data = _json_loads(payload)
+    return data if isinstance(data, list) else [data]
+
+
+def decode_history(payload: bytes) -> list[dict[str, Any]]:
+    data = _unpack(payload) if is_compact(payload) else _json_loads(payload)
+    if not isinstance(data, list):
+        raise ValueError("History payload is not a list of statuses")
+    return data
@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import paho.mqtt.client as mqtt
+import requests
+
+from common import Log, LogLevel, wire
+from .backoff import Backoff
+from .node import REGISTER_MAX_WAIT, REGISTER_SPREAD
+
+
+class VirtualNode:
+    """A simulated PiNode driven by the engine's event loop instead of its own threads.
+
+    Speaks the same protocol as PiNode: JSON/compact status on node/<uid>/status,
+    logs on node/<uid>/log, commands on node/<uid>/command and /api/register.
+    """
+
+    def __init__(self, engine: "SimulationEngine", index: int) -> None:
+        self.engine = engine
+        self.uid = uuid.uuid4().hex[:8]
+        self.name = "Unknown"
+        self.ip = f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+        self.client = engine.clients[index % len(engine.clients)]
+        self.status_topic = f"node/{self.uid}/status"
+        self.log_topic = f"node/{self.uid}/log"
+        self.ack_topic = f"node/{self.uid}/ack"
+        self.handled_commands: set[str] = set()
+        self.running = False
+        self.registered = False
+        self.remote_log_level = LogLevel.INFO
+        self.wakeup = asyncio.Event()
+
+        self.actions = {
+            "rename": (self.rename, 1),
+            "shutdown": (self.shutdown, 0),
+            "restart": (self.restart, 0),
+            "set_log_level": (self.set_log_level, 1),
+        }
+
+    def log(self, message: str, level: LogLevel = LogLevel.INFO) -> None:
+        log_obj = Log(origin=self.name, message=message, level=level)
+        if log_obj.show(self.remote_log_level):
+            self.client.publish(self.log_topic, wire.encode_logs([log_obj], self.engine.wire_encoding()))
+
+    def publish_status(self) -> None:
+        status = {
+            "uid": self.uid,
+            "name": self.name,
+            "ip": self.ip,
+            "cpu": round(random.uniform(5, 30), 1),
+            "temp": round(random.uniform(40, 60), 1),
+            "status": "online",
+            "interval": self.engine.interval(),
+            "last_seen": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.client.publish(self.status_topic, wire.encode_status(status, self.engine.wire_encoding()))
+        self.engine.published += 1
+
+    def on_command(self, payload: bytes) -> None:
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError as e:
+            self.log(f"Failed to decode command payload: {e}", LogLevel.ERROR)
+            return
+        command_id = data.get("id")
+        action = data.get("action")
+        args = data.get("args", [])
+        if command_id in self.handled_commands:
+            self.ack(command_id, {"ok": True})
+            return
+        if action not in self.actions:
+            self.log(f"Unknown command received: {action}", LogLevel.WARNING)
+            self.ack(command_id, {"ok": False, "error": f"unknown action {action}"})
+            return
+        cmd, reqargs = self.actions[action]
+        if len(args) != reqargs:
+            self.log(f"Invalid number of arguments for {action}. Expected {reqargs}, got {len(args)}", LogLevel.ERROR)
+            self.ack(command_id, {"ok": False, "error": f"expected {reqargs} arguments, got {len(args)}"})
+            return
+        self.log(f"Executing command: {action} with args {args}", LogLevel.INFO)
+        cmd(*args)
+        self.ack(command_id, {"ok": True})
+
+    def ack(self, command_id: str | None, result: dict) -> None:
+        if command_id is None:
+            return
+        self.handled_commands.add(command_id)
+        self.client.publish(self.ack_topic, json.dumps({"id": command_id, "uid": self.uid, **result}))
+
+    def rename(self, new_name: str) -> None:
+        old_name, self.name = self.name, new_name
+        self.log(f"Renamed node from {old_name} to {new_name}", LogLevel.INFO)
+
+    def shutdown(self) -> None:
+        self.log("Shutdown command received, shutting down node", LogLevel.WARNING)
+        self.running = False
+        self.wakeup.set()
+
+    def restart(self) -> None:
+        self.log("Restart command received, restarting node", LogLevel.WARNING)
+        self.running = False
+        self.engine.loop.call_later(2, self.start)
+        self.wakeup.set()
+
+    def set_log_level(self, level: str) -> None:
+        try:
+            self.remote_log_level = LogLevel[level.upper()] if level.upper() in LogLevel.__members__ else LogLevel(level.upper())
+        except ValueError:
+            self.log(f"Unknown log level {level}", LogLevel.ERROR)
+
+    def start(self) -> None:
+        if not self.running:
+            self.running = True
+            self.registered = False
+            self.wakeup.set()
+
+    async def register(self) -> None:
+        """Retries with jittered exponential backoff until registration succeeds, like PiNode.
+
+        The first attempt is delayed by up to REGISTER_SPREAD, so a fleet that
+        sees the server come back at once does not register at once.
+        """
+        backoff = Backoff(base=1, cap=REGISTER_MAX_WAIT)
+        await asyncio.sleep(random.uniform(0, REGISTER_SPREAD))
+        while self.running and self.engine.server_online:
+            try:
+                self.name = await self.engine.register(self.uid, self.name)
+                self.registered = True
+                self.log(f"Successfully registered with backend as {self.name}", LogLevel.INFO)
+                return
+            except Exception as e:
+                wait_time = backoff.next()
+                self.log(f"Backend registration failed: {e}. Retrying in {wait_time:.1f}s...", LogLevel.ERROR)
+                await asyncio.sleep(wait_time)
+
+    async def run(self) -> None:
+        # Spread the first status of every node over one interval
+        await asyncio.sleep(random.uniform(0, self.engine.status_interval))
+        while True:
+            if not self.running:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            if self.engine.server_online:
+                if not self.registered:
+                    await self.register()
+                if not self.running:
+                    continue
+                self.publish_status()
+                self.log("Heartbeat check", LogLevel.DEBUG)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.engine.interval())
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def toggle(self) -> None:
+        """Same churn as NodeThread.simulate_toggling: up 5-15s, down 5-10s."""
+        while True:
+            self.start()
+            await asyncio.sleep(random.randint(5, 15))
+            if self.running:
+                self.log("Node shutting down", LogLevel.WARNING)
+                self.running = False
+                self.wakeup.set()
+            await asyncio.sleep(random.randint(5, 10))
+
+
+class SimulationEngine:
+    """Drives thousands of VirtualNodes from one process and a handful of shared MQTT connections."""
+
+    def __init__(self,
+                 broker: str = "localhost",
+                 backend: str = "http://localhost:8000",
+                 num_nodes: int = 1000,
+                 status_interval: float = 2,
+                 connections: int = 4,
+                 simulate_toggling: bool = True,
+                 encoding: str = wire.JSON,
+                 server_offline_timeout: float = 6,
+                 http_workers: int = 16) -> None:
+        self.broker = broker
+        self.backend = backend
+        self.num_nodes = num_nodes
+        self.status_interval = status_interval
+        self.simulate_toggling = simulate_toggling
+        self.encoding = encoding
+        self.server_offline_timeout = server_offline_timeout
+        self.server_online = False
+        self.server_wire = 0
+        self.server_interval = 0
+        self.last_server_heartbeat = 0
+        self.published = 0
+
+        run_id = uuid.uuid4().hex[:6]
+        self.clients = [mqtt.Client(client_id=f"sim-{run_id}-{i}", protocol=mqtt.MQTTv311) for i in range(max(1, connections))]
+        # Only the first connection subscribes, every node's commands arrive through it
+        self.clients[0].on_connect = self.on_connect
+        self.clients[0].on_message = self.on_message
+
+        self.nodes: dict[str, VirtualNode] = {}
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.http = ThreadPoolExecutor(max_workers=http_workers)
+        self._sessions = threading.local()
+
+    def wire_encoding(self) -> str:
+        if self.encoding == wire.MSGPACK and wire.compact_available() and self.server_wire >= wire.WIRE_VERSION:
+            return wire.MSGPACK
+        return wire.JSON
+
+    def interval(self) -> float:
+        """Seconds between status messages, slowed down when the backend recommends it."""
+        return max(self.status_interval, self.server_interval)
+
+    def on_connect(self, client, userdata, flags, rc) -> None:
+        if rc == 0:
+            client.subscribe("server/heartbeat")
+            client.subscribe("node/+/command")
+            client.subscribe("all/command")
+        else:
+            print(f"[Simulator] Failed to connect to MQTT broker, return code {rc}")
+
+    def on_message(self, client, userdata, msg) -> None:
+        # paho network thread, hand over to the event loop
+        self.loop.call_soon_threadsafe(self._dispatch, msg.topic, msg.payload)
+
+    def _dispatch(self, topic: str, payload: bytes) -> None:
+        if topic == "server/heartbeat":
+            data = json.loads(payload)
+            self.last_server_heartbeat = data["timestamp"]
+            self.server_wire = data.get("wire", 0)
+            self.server_interval = data.get("recommended_interval", 0)
+            if not self.server_online:
+                print("[Simulator] Server heartbeat restored, marking server as online")
+                self.server_online = True
+                for node in self.nodes.values():
+                    node.registered = False
+                    node.wakeup.set()
+            return
+        if topic == "all/command":
+            for node in self.nodes.values():
+                if node.running:
+                    node.on_command(payload)
+            return
+        node = self.nodes.get(topic.split("/")[1])
+        if node is not None:
+            node.on_command(payload)
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._sessions, "session", None)
+        if session is None:
+            session = self._sessions.session = requests.Session()
+        return session
+
+    def _register(self, uid: str, name: str) -> str:
+        res = self._session().post(f"{self.backend}/api/register", json={"uid": uid}, timeout=10)
+        res.raise_for_status()
+        return res.json().get("name", name)
+
+    async def register(self, uid: str, name: str) -> str:
+        return await self.loop.run_in_executor(self.http, self._register, uid, name)
+
+    async def heartbeat_monitor(self) -> None:
+        while True:
+            if self.server_online and time.time() - self.last_server_heartbeat > self.server_offline_timeout:
+                print("[Simulator] Server heartbeat lost, marking server as offline")
+                self.server_online = False
+            await asyncio.sleep(1)
+
+    async def report(self) -> None:
+        last, last_time = 0, time.monotonic()
+        while True:
+            await asyncio.sleep(10)
+            now = time.monotonic()
+            running = sum(1 for node in self.nodes.values() if node.running)
+            rate = (self.published - last) / (now - last_time)
+            print(f"[Simulator] {running}/{len(self.nodes)} nodes running, {rate:.0f} status/s")
+            last, last_time = self.published, now
+
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        for client in self.clients:
+            client.connect(self.broker, 1883, 60)
+            client.loop_start()
+
+        tasks = [asyncio.create_task(self.heartbeat_monitor()), asyncio.create_task(self.report())]
+        for i in range(self.num_nodes):
+            node = VirtualNode(self, i)
+            self.nodes[node.uid] = node
+            tasks.append(asyncio.create_task(node.run()))
+            if self.simulate_toggling:
+                tasks.append(asyncio.create_task(node.toggle()))
+            else:
+                node.start()
+        print(f"[Simulator] Started {self.num_nodes} virtual nodes on {len(self.clients)} connections")
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for client in self.clients:
+                client.loop_stop()
+                client.disconnect()
+            self.http.shutdown(wait=False)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulate many PiNodes from one process")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--interval", type=float, default=2, help="seconds between status messages per node")
+    parser.add_argument("--connections", type=int, default=4, help="MQTT connections shared by all nodes")
+    parser.add_argument("--no-toggling", action="store_true", help="keep every node up instead of simulating churn")
+    parser.add_argument("--encoding", choices=[wire.JSON, wire.MSGPACK], default=wire.JSON)
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--backend", default="http://localhost:8000")
+    args = parser.parse_args()
+
+    engine = SimulationEngine(broker=args.broker,
+                              backend=args.backend,
+                              num_nodes=args.nodes,
+                              status_interval=args.interval,
+                              connections=args.connections,
+                              simulate_toggling=not args.no_toggling,
+                              encoding=args.encoding)
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        print("Simulation interrupted, shutting down...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import random
+
+
+class Backoff:
+    """Exponential backoff with full jitter: each wait is uniform in [0, min(cap, base * 2**attempt)].
+
+    The randomness spreads a fleet that failed at the same moment (e.g. a
+    backend restart) over the whole window instead of retrying in lockstep.
+    """
+
+    def __init__(self, base: float = 1.0, cap: float = 30.0) -> None:
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next(self) -> float:
+        ceiling = min(self.cap, self.base * 2 ** self.attempt)
+        # Stop growing the exponent once the cap is reached
+        if ceiling < self.cap:
+            self.attempt += 1
+        return random.uniform(0, ceiling)
+
+    def reset(self) -> None:
+        self.attempt = 0
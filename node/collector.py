@@ -0,0 +1,271 @@
+import os
+import socket
+import time
+from typing import Any, Callable, Optional
+
+
+class ProcFile:
+    """A /proc or /sys file kept open and re-read from the start, so sampling never re-opens it."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._f = open(path, "rb", buffering=0)
+
+    def read(self) -> bytes:
+        self._f.seek(0)
+        return self._f.read()
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class Sampler:
+    """One source of metrics. `sample` returns field -> value and must be cheap.
+
+    Samplers whose files do not exist on this machine raise OSError from
+    __init__ and are simply left out by the collector.
+    """
+
+    def sample(self) -> dict[str, float]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class CpuSampler(Sampler):
+    """Busy percentage across all cores since the previous sample, from /proc/stat."""
+
+    def __init__(self, path: str = "/proc/stat") -> None:
+        self.file = ProcFile(path)
+        self._last = self._read()
+
+    def _read(self) -> tuple[int, int]:
+        # First line: "cpu  user nice system idle iowait irq softirq steal ..."
+        fields = self.file.read().split(b"\n", 1)[0].split()[1:]
+        values = [int(v) for v in fields[:8]]
+        idle = values[3] + values[4]
+        return sum(values), idle
+
+    def sample(self) -> dict[str, float]:
+        total, idle = self._read()
+        last_total, last_idle = self._last
+        self._last = (total, idle)
+        elapsed = total - last_total
+        if elapsed <= 0:
+            return {}
+        return {"cpu": round(100.0 * (1 - (idle - last_idle) / elapsed), 1)}
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class MemorySampler(Sampler):
+    """Used memory percentage from /proc/meminfo (MemTotal - MemAvailable)."""
+
+    def __init__(self, path: str = "/proc/meminfo") -> None:
+        self.file = ProcFile(path)
+
+    def sample(self) -> dict[str, float]:
+        total = available = None
+        for line in self.file.read().splitlines():
+            if line.startswith(b"MemTotal:"):
+                total = int(line.split()[1])
+            elif line.startswith(b"MemAvailable:"):
+                available = int(line.split()[1])
+                break  # MemAvailable comes after MemTotal
+        if not total or available is None:
+            return {}
+        return {"mem": round(100.0 * (total - available) / total, 1)}
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ThermalSampler(Sampler):
+    """SoC temperature in °C from a thermal zone (millidegrees on disk)."""
+
+    def __init__(self, path: str = "/sys/class/thermal/thermal_zone0/temp") -> None:
+        self.file = ProcFile(path)
+
+    def sample(self) -> dict[str, float]:
+        return {"temp": round(int(self.file.read()) / 1000, 1)}
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _RateSampler(Sampler):
+    """Turns monotonically increasing counters into per-second rates."""
+
+    def __init__(self, path: str) -> None:
+        self.file = ProcFile(path)
+        self._last = self._counters()
+        self._last_time = time.monotonic()
+
+    def _counters(self) -> dict[str, int]:
+        raise NotImplementedError
+
+    def sample(self) -> dict[str, float]:
+        counters = self._counters()
+        now = time.monotonic()
+        elapsed = now - self._last_time
+        last = self._last
+        self._last, self._last_time = counters, now
+        if elapsed <= 0:
+            return {}
+        # Counters reset on wrap-around or interface changes, report 0 rather than a negative rate
+        return {field: round(max(0, value - last.get(field, value)) / elapsed, 1)
+                for field, value in counters.items()}
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class NetworkSampler(_RateSampler):
+    """Received/sent bytes per second over all interfaces except loopback, from /proc/net/dev."""
+
+    def __init__(self, path: str = "/proc/net/dev") -> None:
+        super().__init__(path)
+
+    def _counters(self) -> dict[str, int]:
+        rx = tx = 0
+        for line in self.file.read().splitlines()[2:]:
+            name, _, data = line.partition(b":")
+            if name.strip() == b"lo":
+                continue
+            fields = data.split()
+            rx += int(fields[0])
+            tx += int(fields[8])
+        return {"net_rx": rx, "net_tx": tx}
+
+
+class DiskSampler(_RateSampler):
+    """Read/written bytes per second over physical block devices, from /proc/diskstats."""
+
+    SECTOR_SIZE = 512
+    SKIP_PREFIXES = (b"loop", b"ram", b"zram", b"dm-")
+
+    def __init__(self, path: str = "/proc/diskstats", block_dir: str = "/sys/block") -> None:
+        # Whole disks only (mmcblk0, sda), partitions would be counted twice
+        self.devices = {os.fsencode(name) for name in os.listdir(block_dir)
+                        if not os.fsencode(name).startswith(self.SKIP_PREFIXES)}
+        super().__init__(path)
+
+    def _counters(self) -> dict[str, int]:
+        read = written = 0
+        for line in self.file.read().splitlines():
+            fields = line.split()
+            if fields[2] not in self.devices:
+                continue
+            read += int(fields[5])
+            written += int(fields[9])
+        return {"disk_read": read * self.SECTOR_SIZE, "disk_write": written * self.SECTOR_SIZE}
+
+
+class CachedValue:
+    """Calls `fetch` at most once every `ttl` seconds."""
+
+    def __init__(self, fetch: Callable[[], str], ttl: float) -> None:
+        self.fetch = fetch
+        self.ttl = ttl
+        self._value: Optional[str] = None
+        self._expires = 0.0
+
+    def get(self) -> str:
+        now = time.monotonic()
+        if self._value is None or now >= self._expires:
+            self._value = self.fetch()
+            self._expires = now + self.ttl
+        return self._value
+
+    def invalidate(self) -> None:
+        self._value = None
+
+
+def local_ip() -> str:
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            # No packet is sent, connect only picks the outgoing interface
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+    except OSError:
+        return "0.0.0.0"
+
+
+DEFAULT_SAMPLERS = (CpuSampler, MemorySampler, ThermalSampler, NetworkSampler, DiskSampler)
+
+# Smallest change worth publishing, per field. Fields without an entry (and strings such as
+# the name or IP) are sent whenever they change.
+DEFAULT_DEADBANDS = {
+    "cpu": 2.0,         # percent
+    "mem": 1.0,         # percent
+    "temp": 0.5,        # °C
+    "net_rx": 1024.0,   # bytes/s
+    "net_tx": 1024.0,
+    "disk_read": 4096.0,
+    "disk_write": 4096.0,
+}
+
+
+class MetricsCollector:
+    """Samples every available sampler and decides which values are worth publishing.
+
+    `changes` returns only fields that moved further than their deadband since
+    they were last published. Every `full_every` calls (and after `reset`) all
+    values are returned, so a backend that missed an update converges.
+    """
+
+    def __init__(self,
+                 samplers: Optional[list[Sampler]] = None,
+                 deadbands: Optional[dict[str, float]] = None,
+                 full_every: int = 30) -> None:
+        if samplers is None:
+            samplers = []
+            for sampler_cls in DEFAULT_SAMPLERS:
+                try:
+                    samplers.append(sampler_cls())
+                except (OSError, ValueError, IndexError):
+                    pass  # not available on this machine
+        self.samplers = samplers
+        self.deadbands = DEFAULT_DEADBANDS if deadbands is None else deadbands
+        self.full_every = full_every
+        self._published: dict[str, Any] = {}
+        self._calls = 0
+        self.last_full = False  # whether the last `changes` call returned everything
+
+    def sample(self) -> dict[str, float]:
+        values = {}
+        for sampler in self.samplers:
+            try:
+                values.update(sampler.sample())
+            except (OSError, ValueError, IndexError):
+                pass  # one broken source should not stop the others
+        return values
+
+    def changes(self, values: dict[str, Any]) -> dict[str, Any]:
+        self._calls += 1
+        if self._calls >= self.full_every:
+            self.reset()
+        self.last_full = not self._published
+        changed = {}
+        for field, value in values.items():
+            last = self._published.get(field)
+            if last is None:
+                changed[field] = value
+            elif isinstance(value, str):
+                if value != last:
+                    changed[field] = value
+            elif abs(value - last) >= self.deadbands.get(field, 0):
+                changed[field] = value
+        self._published.update(changed)
+        return changed
+
+    def reset(self) -> None:
+        """Makes the next `changes` call return every value."""
+        self._published.clear()
+        self._calls = 0
+
+    def close(self) -> None:
+        for sampler in self.samplers:
+            sampler.close()
@@ -1,34 +1,112 @@
 # node.py
 import threading
+from collections import OrderedDict
 import paho.mqtt.client as mqtt
 import json
-import time
-import socket
+import os
 import random
+import time
 import uuid
 import requests
-from common import Log, LogLevel
+from common import Log, LogLevel, wire
+from .rate_limit import TokenBucket
+from .backoff import Backoff
+from .collector import MetricsCollector, CachedValue, local_ip
+from .outbox import Outbox, STATUS, LOG
 import logging
 
 TESTING = True # Set to False in production
+IP_CACHE_TTL = 300 # seconds between outgoing interface lookups
+HTTP_TIMEOUT = (3, 10) # seconds to connect, seconds to read
+RECONNECT_MAX_WAIT = 60 # seconds, cap of the jittered MQTT reconnect backoff
+REGISTER_MAX_WAIT = 30 # seconds, cap of the jittered registration backoff
+REGISTER_SPREAD = 5 # seconds, first registration attempt is delayed by up to this much
+IDENTITY_PATH = "~/.pinest/identity.json"
+BROADCAST_COMMAND_TOPIC = "all/command"
+COMMAND_HISTORY = 128 # recent command ids remembered so resends are not executed twice
+ACK_BEFORE_RUNNING = {"shutdown", "restart"} # these take the connection down with them
+OUTBOX_PATH = "~/.pinest/outbox"
+OUTBOX_MAX_BYTES = 8 * 1024 * 1024 # history kept while offline, small next to a Pi Zero's SD card
+OUTBOX_SEGMENT_BYTES = 256 * 1024 # bytes per outbox file, the unit in which old history is dropped
+REPLAY_BATCH = 50 # stored records sent per second after reconnecting
+REPLAY_ACK_TIMEOUT = 5 # seconds to wait for the broker to confirm a replayed batch
 
 class PiNode:
     def __init__(self, 
                  broker: str = "localhost", 
                  backend: str = "http://localhost:8000", 
                  heartbeat_interval: int = 2,
-                 server_offline_timeout: int = 6) -> None:
+                 max_heartbeat_interval: int = 16,
+                 server_offline_timeout: int = 6,
+                 encoding: str = wire.JSON,
+                 log_batch_size: int = 1,
+                 remote_log_level: LogLevel = LogLevel.INFO,
+                 log_rate: float = 5.0,
+                 log_burst: int = 20,
+                 collector: MetricsCollector | None = None,
+                 groups: list[str] | None = None,
+                 identity_path: str | None = None if TESTING else IDENTITY_PATH,
+                 outbox_path: str | None = None if TESTING else OUTBOX_PATH,
+                 replay_batch: int = REPLAY_BATCH) -> None:
         self.uid = self.get_mac() if not TESTING else uuid.uuid4().hex[:8]
         self.broker = broker
         self.backend = backend
         self.heartbeat_interval = heartbeat_interval
+        self.max_heartbeat_interval = max_heartbeat_interval
         self.server_offline_timeout = server_offline_timeout
         self.running = False
         self.server_online = False
         self.last_server_heartbeat = 0
 
+        # Adaptive status rate: metrics are sampled every sample_interval() and a
+        # status goes out on change, otherwise the keepalive interval doubles up to
+        # max_heartbeat_interval. The backend can ask for a slower rate when it is busy.
+        self.server_interval = 0
+        self.status_interval = heartbeat_interval
+        self._last_status = 0.0
+
+        # Payload format and log batching. The compact format is only used once
+        # the server heartbeat says the backend can decode it.
+        self.encoding = encoding
+        self.server_wire = 0
+        self.log_batch_size = max(1, log_batch_size)
+        self._log_batch: list[Log] = []
+        self._log_lock = threading.Lock()
+
+        # Remote log filtering: minimum level, rate limit and duplicate suppression
+        self.remote_log_level = remote_log_level
+        self._log_bucket = TokenBucket(rate=log_rate, burst=log_burst)
+        self._last_log: tuple[LogLevel, str] | None = None
+        self._log_repeats = 0
+        self._log_dropped = 0
+
+        # System metrics. Only values that moved past their deadband are published,
+        # with a full status every `collector.full_every` heartbeats.
+        self.collector = collector if collector is not None else MetricsCollector()
+        self._ip = CachedValue(local_ip, IP_CACHE_TTL)
+
         self.name = "Unknown"
 
+        # Statuses and logs produced while the broker or backend is unreachable go
+        # to disk and are replayed, replay_batch records a second, once it is back.
+        # Without an outbox they are dropped (statuses) or queued in paho (logs).
+        self.outbox = Outbox(os.path.expanduser(outbox_path), OUTBOX_MAX_BYTES, OUTBOX_SEGMENT_BYTES) if outbox_path else None
+        self.replay_batch = replay_batch
+
+        # Connection layer: one keep-alive HTTP session, one network thread that
+        # owns the MQTT socket, and the name cached on disk so a restart does not
+        # need the backend at all.
+        self.session = requests.Session()
+        self.identity_path = os.path.expanduser(identity_path) if identity_path else None
+        self.registered = self._load_identity()
+        self._register_thread: threading.Thread | None = None
+        self._network_thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        # Shutdown and restart commands arrive on the network thread, which can't tear itself
+        # down, so they only set these and run()'s loop does the work
+        self.wakeup = threading.Event()
+        self._restart_requested = False
+
         self.logger = logging.getLogger(f"PiNode-{self.uid}")
         self.logger.setLevel(logging.INFO)
 
@@ -45,11 +123,20 @@ class PiNode:
         self.status_topic = f"node/{self.uid}/status"
         self.log_topic = f"node/{self.uid}/log"
         self.command_topic = f"node/{self.uid}/command"
+        self.ack_topic = f"node/{self.uid}/ack"
+        self.history_topic = f"node/{self.uid}/history"
+
+        # Commands also arrive on all/command and group/<name>/command for every joined group
+        self.groups = set(groups or [])
+        self._handled_commands: OrderedDict[str, dict] = OrderedDict()
 
         self.actions = {
             "rename": (self.rename, 1),
             "shutdown": (self.shutdown, 0),
             "restart": (self.restart, 0),
+            "set_log_level": (self.set_log_level, 1),
+            "join_group": (self.join_group, 1),
+            "leave_group": (self.leave_group, 1),
         }
 
         self.heartbeat_thread = threading.Thread(target=self._heartbeat_monitor, daemon=True)
@@ -66,9 +153,86 @@ class PiNode:
         # Local logging
         self.logger.log(level_map[level], message)
 
-        # Remote logging via MQTT
+        # Remote logging via MQTT, batched into one publish when log_batch_size > 1
         log_obj = Log(origin=self.name, message=message, level=level)
-        self.client.publish(self.log_topic, log_obj.to_json())
+        if not log_obj.show(self.remote_log_level):
+            return
+        with self._log_lock:
+            if (level, message) == self._last_log:
+                self._log_repeats += 1
+                return
+            self._log_batch.extend(self._suppressed_summary())
+            if self._log_bucket.consume():
+                self._last_log = (level, message)
+                self._log_batch.append(log_obj)
+            else:
+                self._log_dropped += 1
+            if len(self._log_batch) < self.log_batch_size:
+                return
+        self.flush_logs()
+
+    def _suppressed_summary(self) -> list[Log]:
+        """Turns the duplicate and rate limit counters into log records. Caller holds _log_lock."""
+        summary = []
+        if self._log_repeats:
+            level, _ = self._last_log
+            summary.append(Log(origin=self.name, message=f"Last message repeated {self._log_repeats} times", level=level))
+            self._log_repeats = 0
+        if self._log_dropped and self._log_bucket.consume():
+            summary.append(Log(origin=self.name, message=f"Log rate limit hit, dropped {self._log_dropped} messages", level=LogLevel.WARNING))
+            self._log_dropped = 0
+        return summary
+
+    def flush_logs(self) -> None:
+        """Publishes pending log records as a single MQTT message."""
+        with self._log_lock:
+            batch, self._log_batch = self._log_batch + self._suppressed_summary(), []
+        if not batch:
+            return
+        if self.outbox is not None and not self.online():
+            for log in batch:
+                self.outbox.append(LOG, log.to_dict())
+            return
+        self.client.publish(self.log_topic, wire.encode_logs(batch, self.wire_encoding()))
+
+    def online(self) -> bool:
+        """Whether the backend is reachable, i.e. we are connected and its heartbeat is current."""
+        return self.server_online and self.client.is_connected()
+
+    def replay_outbox(self) -> int:
+        """Sends one batch of records stored while offline, returns how many were delivered.
+
+        Statuses go to the history topic, so the backend files them as past
+        samples instead of current state. A batch is only removed from the
+        outbox once the broker confirmed it (QoS 1); otherwise it is sent
+        again next time.
+        """
+        if self.outbox is None or not self.online():
+            return 0
+        records = self.outbox.peek(self.replay_batch)
+        if not records:
+            return 0
+        statuses = [record for kind, record in records if kind == STATUS]
+        logs = [record for kind, record in records if kind == LOG]
+        sent = []
+        if statuses:
+            sent.append(self.client.publish(self.history_topic, wire.encode_history(statuses, self.wire_encoding()), qos=1))
+        if logs:
+            sent.append(self.client.publish(self.log_topic, json.dumps(logs), qos=1))
+        try:
+            for info in sent:
+                info.wait_for_publish(REPLAY_ACK_TIMEOUT)
+        except (RuntimeError, ValueError):
+            return 0
+        if not all(info.is_published() for info in sent):
+            return 0
+        self.outbox.commit()
+        return len(records)
+
+    def wire_encoding(self) -> str:
+        if self.encoding == wire.MSGPACK and wire.compact_available() and self.server_wire >= wire.WIRE_VERSION:
+            return wire.MSGPACK
+        return wire.JSON
 
     def on_connect(self, client, userdata, flags, rc) -> None:
         if rc == 0:
@@ -77,17 +241,20 @@ class PiNode:
             self.client.message_callback_add("server/heartbeat", self.on_server_heartbeat)
             self.client.subscribe(self.command_topic)
             self.client.message_callback_add(self.command_topic, self.on_command)
+            self.client.subscribe(BROADCAST_COMMAND_TOPIC)
+            self.client.message_callback_add(BROADCAST_COMMAND_TOPIC, self.on_command)
+            self.client.message_callback_add("group/+/command", self.on_command)
+            for group in self.groups:
+                self.client.subscribe(f"group/{group}/command")
         else:
             self.log(f"Failed to connect to MQTT broker, return code {rc}", LogLevel.ERROR)
 
     def on_disconnect(self, client, userdata, rc):
-        """Called when MQTT disconnects."""
+        """Called when MQTT disconnects. Reconnecting is left to _network_loop."""
         self.server_online = False
         if rc != 0:
             # Unexpected disconnect
             self.log(f"Disconnected from MQTT broker (rc={rc}), will retry...", LogLevel.WARNING)
-            # Optionally, restart connection loop explicitly
-            threading.Thread(target=self._connect_mqtt, daemon=True).start()
         else:
             # Clean disconnect (kill() called)
             self.log("MQTT broker connection closed cleanly", LogLevel.INFO)
@@ -99,33 +266,75 @@ class PiNode:
         payload = msg.payload.decode()
         data = json.loads(payload)
         self.last_server_heartbeat = data["timestamp"]
+        self.server_wire = data.get("wire", 0)
+        self.server_interval = data.get("recommended_interval", 0)
         if not self.server_online:
             self.log("Server heartbeat restored, marking server as online", LogLevel.INFO)
             self.server_online = True
-            threading.Thread(target=self._register_with_backend, daemon=True).start()
+            # The backend may have restarted, send everything with the next status
+            self.collector.reset()
+            self._ip.invalidate()
+            self.status_interval = self.sample_interval()
+            self._start_registration()
+            self._report_outbox_drops()
+
+    def _report_outbox_drops(self) -> None:
+        # The outbox evicts its oldest history when full, tell the backend about the gap once it can hear us
+        if self.outbox is None:
+            return
+        dropped = self.outbox.take_dropped()
+        if dropped:
+            self.log(f"Outbox was full while offline, dropped {dropped} bytes of the oldest history "
+                     f"({self.outbox.pending_bytes} bytes left to replay)", LogLevel.WARNING)
 
     def on_command(self, client, userdata, msg):
-        """Handles commands sent to this node."""
+        """Handles commands sent to this node, its groups or everyone, and acknowledges them."""
         try:
             payload = json.loads(msg.payload.decode())
-            action = payload.get("action")
-            args = payload.get("args", [])
-            if action in self.actions:
-                cmd, reqargs = self.actions.get(action)
-
-                if len(args) != reqargs:
-                    self.log(f"Invalid number of arguments for {action}. Expected {reqargs}, got {len(args)}", LogLevel.ERROR)
-                    return
-                else:
-                    self.log(f"Executing command: {action} with args {args}", LogLevel.INFO)
-                    cmd(*args)
-            else:
-                self.log(f"Unknown command received: {action}", LogLevel.WARNING)
-                return
-            
-
         except json.JSONDecodeError as e:
             self.log(f"Failed to decode command payload: {e}", LogLevel.ERROR)
+            return
+        command_id = payload.get("id")
+        action = payload.get("action")
+        args = payload.get("args", [])
+
+        if command_id in self._handled_commands:
+            # The backend resends until it gets an ack, answer again without running it twice
+            self._ack(command_id, self._handled_commands[command_id])
+            return
+
+        if action not in self.actions:
+            self.log(f"Unknown command received: {action}", LogLevel.WARNING)
+            self._ack(command_id, {"ok": False, "error": f"unknown action {action}"})
+            return
+        cmd, reqargs = self.actions.get(action)
+        if len(args) != reqargs:
+            self.log(f"Invalid number of arguments for {action}. Expected {reqargs}, got {len(args)}", LogLevel.ERROR)
+            self._ack(command_id, {"ok": False, "error": f"expected {reqargs} arguments, got {len(args)}"})
+            return
+
+        self.log(f"Executing command: {action} with args {args}", LogLevel.INFO)
+        if action in ACK_BEFORE_RUNNING:
+            self._ack(command_id, {"ok": True})
+            cmd(*args)
+            return
+        try:
+            cmd(*args)
+        except Exception as e:
+            self.log(f"Command {action} failed: {e}", LogLevel.ERROR)
+            self._ack(command_id, {"ok": False, "error": str(e)})
+            return
+        self._ack(command_id, {"ok": True})
+
+    def _ack(self, command_id: str | None, result: dict) -> None:
+        # Commands without an id come from backends that do not track acks
+        if command_id is None:
+            return
+        self._handled_commands[command_id] = result
+        self._handled_commands.move_to_end(command_id)
+        while len(self._handled_commands) > COMMAND_HISTORY:
+            self._handled_commands.popitem(last=False)
+        self.client.publish(self.ack_topic, json.dumps({"id": command_id, "uid": self.uid, **result}))
 
     def _heartbeat_monitor(self):
         """Thread that checks server heartbeat and updates server_online flag."""
@@ -134,17 +343,12 @@ class PiNode:
                 if self.server_online:
                     self.log("Server heartbeat lost, marking server as offline", LogLevel.WARNING)
                     self.server_online = False
+            self.flush_logs()
+            self.replay_outbox()
             time.sleep(1)
 
     def get_ip(self) -> str:
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "0.0.0.0"
+        return self._ip.get()
         
     def get_mac(self) -> str:
         mac_num = hex(uuid.getnode()).replace('0x', '').upper()
@@ -154,78 +358,199 @@ class PiNode:
     def rename(self, new_name: str) -> None:
         old_name = getattr(self, "name", None)
         self.name = new_name
+        self._save_identity()
         self.log(f"Renamed node from {old_name} to {new_name}", LogLevel.INFO)
 
+    def _load_identity(self) -> bool:
+        """Restores the name from the identity file, returns whether one was found for this uid."""
+        if self.identity_path is None:
+            return False
+        try:
+            with open(self.identity_path) as f:
+                identity = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if identity.get("uid") != self.uid or not identity.get("name"):
+            return False
+        self.name = identity["name"]
+        return True
+
+    def _save_identity(self) -> None:
+        if self.identity_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.identity_path), exist_ok=True)
+            tmp_path = self.identity_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"uid": self.uid, "name": self.name}, f)
+            os.replace(tmp_path, self.identity_path)
+        except OSError as e:
+            self.logger.warning(f"Could not save identity: {e}")
+
+    def join_group(self, group: str) -> None:
+        self.groups.add(group)
+        self.client.subscribe(f"group/{group}/command")
+        self.log(f"Joined command group {group}", LogLevel.INFO)
+
+    def leave_group(self, group: str) -> None:
+        self.groups.discard(group)
+        self.client.unsubscribe(f"group/{group}/command")
+        self.log(f"Left command group {group}", LogLevel.INFO)
+
+    def set_log_level(self, level: str) -> None:
+        """Sets the minimum level published to MQTT, accepts a level name or its letter."""
+        try:
+            new_level = LogLevel[level.upper()] if level.upper() in LogLevel.__members__ else LogLevel(level.upper())
+        except ValueError:
+            self.log(f"Unknown log level {level}", LogLevel.ERROR)
+            return
+        self.remote_log_level = new_level
+        self.log(f"Remote log level set to {new_level.name}", LogLevel.INFO)
+
     def shutdown(self) -> None:
         self.log("Shutdown command received, shutting down node", LogLevel.WARNING)
-        self.kill()
+        self.wakeup.set()
     
     def restart(self) -> None:
         self.log("Restart command received, restarting node", LogLevel.WARNING)
-        self.kill()
-        time.sleep(2)
-        self.run()
+        self._restart_requested = True
+        self.wakeup.set()
+
+    def _start_registration(self) -> None:
+        """Registers in the background unless the name is already known or a registration is running."""
+        if self.registered:
+            self.log(f"Using cached identity {self.name}, skipping registration", LogLevel.DEBUG)
+            return
+        if self._register_thread is not None and self._register_thread.is_alive():
+            return
+        self._register_thread = threading.Thread(target=self._register_with_backend, daemon=True)
+        self._register_thread.start()
 
     def _register_with_backend(self):
-        """Retries with exponential backoff until registration succeeds (max wait 8s)."""
-        wait_time = 1
-        max_wait = 8
+        """Retries with full-jitter backoff until registration succeeds."""
+        backoff = Backoff(base=1, cap=REGISTER_MAX_WAIT)
+        # The whole fleet sees the server come back at the same moment, don't all ask at once
+        if self._stopped.wait(random.uniform(0, REGISTER_SPREAD)):
+            return
         while self.running:
             try:
-                res = requests.post(f"{self.backend}/api/register", json={"uid": self.uid})
+                res = self.session.post(f"{self.backend}/api/register", json={"uid": self.uid}, timeout=HTTP_TIMEOUT)
                 res.raise_for_status()
                 identity = res.json()
                 self.name = identity.get("name", self.name)
+                self.registered = True
+                self._save_identity()
                 self.log(f"Successfully registered with backend as {self.name}", LogLevel.INFO)
                 return
             except Exception as e:
-                self.log(f"Backend registration failed: {e}. Retrying in {wait_time}s...", LogLevel.ERROR)
-                time.sleep(wait_time)
-                wait_time = min(wait_time * 2, max_wait)
+                wait_time = backoff.next()
+                self.log(f"Backend registration failed: {e}. Retrying in {wait_time:.1f}s...", LogLevel.ERROR)
+                if self._stopped.wait(wait_time):
+                    return
 
-    def _connect_mqtt(self):
-        wait_time = 1
-        max_wait = 8
+    def _network_loop(self):
+        """The only thread that touches the MQTT socket: connects, runs paho's loop and reconnects."""
+        backoff = Backoff(base=1, cap=RECONNECT_MAX_WAIT)
+        self.client.connect_async(self.broker, 1883, 60)
         while self.running:
             try:
-                self.client.connect(self.broker, 1883, 60)
-                self.client.loop_start()
-                self.log("Connected to MQTT broker", LogLevel.INFO)
-                return
+                self.client.reconnect()
             except Exception as e:
-                self.log(f"MQTT connection failed: {e}. Retrying in {wait_time}s...", LogLevel.ERROR)
-                time.sleep(wait_time)
-                wait_time = min(wait_time * 2, max_wait)
-
-    def publish_status(self) -> None:
+                wait_time = backoff.next()
+                self.log(f"MQTT connection failed: {e}. Retrying in {wait_time:.1f}s...", LogLevel.ERROR)
+                self._stopped.wait(wait_time)
+                continue
+            rc = mqtt.MQTT_ERR_SUCCESS
+            while self.running and rc == mqtt.MQTT_ERR_SUCCESS:
+                try:
+                    rc = self.client.loop(timeout=1.0)
+                except Exception as e:
+                    # paho re-raises callback errors, one bad message must not end the only network thread
+                    self.log(f"Error while handling MQTT traffic: {e!r}", LogLevel.ERROR)
+                    continue
+                if self.client.is_connected():
+                    backoff.reset()
+            if self.running:
+                wait_time = backoff.next()
+                self.log(f"MQTT connection lost (rc={rc}). Reconnecting in {wait_time:.1f}s...", LogLevel.WARNING)
+                self._stopped.wait(wait_time)
+
+    def sample_interval(self) -> float:
+        """Seconds between metric samples, never faster than the backend recommends."""
+        return max(self.heartbeat_interval, self.server_interval)
+
+    def publish_status(self, force: bool = False) -> bool:
+        """Publishes a status if metrics changed or the keepalive is due, returns whether it did.
+
+        While offline the status is stored in the outbox instead, with every
+        value rather than only the changed ones.
+        """
+        online = self.online()
+        if not online and self.outbox is None:
+            return False
+        values = self.collector.sample()
+        values["name"] = self.name
+        values["ip"] = self.get_ip()
+        values["groups"] = ",".join(sorted(self.groups))
+        changes = self.collector.changes(values)
+        now = time.monotonic()
+        keepalive_due = now - self._last_status >= self.status_interval
+        if not (changes or keepalive_due or force):
+            return False
+
+        fastest = self.sample_interval()
+        if changes and not self.collector.last_full:
+            # Something is happening, report at the full rate again
+            self.status_interval = fastest
+        elif keepalive_due:
+            self.status_interval = min(self.status_interval * 2, max(self.max_heartbeat_interval, fastest))
+        self.status_interval = max(self.status_interval, fastest)
+
+        # uid, status and last_seen always go out, they double as the liveness heartbeat.
+        # "interval" is the longest we will stay quiet, the backend's offline timeout follows it.
         status = {
             "uid": self.uid,
-            "name": self.name,
-            "ip": self.get_ip(),
-            "cpu": round(random.uniform(5, 30), 1), # TODO: replace with real CPU usage
-            "temp": round(random.uniform(40, 60), 1), # TODO: replace with real temperature
+            **changes,
             "status": "online",
+            "interval": self.status_interval,
             "last_seen": time.strftime("%Y-%m-%dT%H:%M:%S")
         }
-        self.client.publish(self.status_topic, json.dumps(status))
+        self._last_status = now
+        if not online:
+            self.outbox.append(STATUS, {"uid": self.uid, **values, "last_seen": status["last_seen"]})
+            return True
+        self.client.publish(self.status_topic, wire.encode_status(status, self.wire_encoding()))
         print(f"[{self.uid}] Status published: {status}")
+        return True
 
     def run(self) -> None:
-        self.running = True
-        self._connect_mqtt()
+        while True:
+            self.running = True
+            self._stopped.clear()
+            self._network_thread = threading.Thread(target=self._network_loop, name=f"mqtt-{self.uid}", daemon=True)
+            self._network_thread.start()
 
-        self.heartbeat_thread = threading.Thread(target=self._heartbeat_monitor, daemon=True)
-        self.heartbeat_thread.start()
+            self.heartbeat_thread = threading.Thread(target=self._heartbeat_monitor, daemon=True)
+            self.heartbeat_thread.start()
 
-        try:
-            while self.running:
-                if self.server_online:
-                    self.publish_status()
-                    self.log("Heartbeat check", LogLevel.DEBUG)
-                time.sleep(self.heartbeat_interval)
-        except KeyboardInterrupt:
-            self.log("Interrupted, shutting down...", LogLevel.WARNING)
+            try:
+                while self.running and not self.wakeup.is_set():
+                    if self.publish_status():
+                        self.log("Heartbeat check", LogLevel.DEBUG)
+                    self.wakeup.wait(self.sample_interval())
+            except KeyboardInterrupt:
+                self.log("Interrupted, shutting down...", LogLevel.WARNING)
+                self.kill()
+                return
+
+            # Shutdown or restart command, or kill() from another thread
+            restart = self._restart_requested
+            self._restart_requested = False
+            self.wakeup.clear()
             self.kill()
+            if not restart:
+                return
+            time.sleep(2)
 
     def kill(self) -> None:
         if not self.running:
@@ -234,14 +559,19 @@ class PiNode:
         self.log("Node shutting down", LogLevel.WARNING)
 
         self.running = False
+        self._stopped.set()
 
         if self.heartbeat_thread.is_alive():
             self.heartbeat_thread.join()
 
         self.server_online = False
         self.last_server_heartbeat = 0
-        self.client.loop_stop()
+        self.flush_logs()
+        if self.outbox is not None:
+            self.outbox.close()
         self.client.disconnect()
+        if self._network_thread is not None:
+            self._network_thread.join()
         self.log("Disconnected from MQTT broker", LogLevel.INFO)
 
 def main() -> None:
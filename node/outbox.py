@@ -0,0 +1,183 @@
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import Any
+
+# Record header: body length, crc32 of the body, kind
+_HEADER = struct.Struct("<IIB")
+
+STATUS = 0
+LOG = 1
+
+
+class Outbox:
+    """Bounded, disk-backed FIFO of statuses and logs recorded while the node is offline.
+
+    Records are appended to numbered segment files (`<n>.seg`) of at most
+    `segment_bytes`. Once the outbox holds more than `max_bytes` the oldest
+    segment is deleted, so a long outage costs the oldest history instead of
+    the SD card. `peek` reads records from the read position and `commit`
+    moves past them once they were delivered; the position is saved in
+    `cursor`, so a reboot neither loses nor repeats delivered records.
+    Only the current segment is open, and a `peek` holds one batch in memory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 8 * 1024 * 1024, segment_bytes: int = 256 * 1024) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.cursor_path = os.path.join(directory, "cursor")
+        self.dropped_bytes = 0  # history deleted unsent because the outbox was full
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._sizes: dict[int, int] = {}
+        for name in os.listdir(directory):
+            stem, _, ext = name.partition(".")
+            if ext == "seg" and stem.isdigit():
+                self._sizes[int(stem)] = os.path.getsize(self._path(int(stem)))
+        self._segments = sorted(self._sizes)
+        if self._segments:
+            self._repair(self._segments[-1])
+        self._read_segment, self._read_offset = self._load_cursor()
+        self._peek_end = (self._read_segment, self._read_offset)
+        # Segments before the cursor were delivered before a crash or reboot
+        for number in [n for n in self._segments if n < self._read_segment]:
+            self._remove(number)
+
+    @property
+    def pending_bytes(self) -> int:
+        """Bytes not yet delivered, including record headers."""
+        with self._lock:
+            return sum(size for number, size in self._sizes.items() if number >= self._read_segment) - (
+                self._read_offset if self._read_segment in self._sizes else 0)
+
+    def take_dropped(self) -> int:
+        """Returns the bytes of history dropped since the last call and resets the count."""
+        with self._lock:
+            dropped, self.dropped_bytes = self.dropped_bytes, 0
+        return dropped
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.directory, f"{number:08d}.seg")
+
+    def _repair(self, number: int) -> None:
+        # A power cut mid-append leaves a partial record at the end, cut it off before appending after it
+        path = self._path(number)
+        valid = 0
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                length, crc, _ = _HEADER.unpack(header)
+                body = f.read(length)
+                if len(body) < length or zlib.crc32(body) != crc:
+                    break
+                valid += _HEADER.size + length
+        if valid != self._sizes[number]:
+            os.truncate(path, valid)
+            self._sizes[number] = valid
+
+    def _load_cursor(self) -> tuple[int, int]:
+        try:
+            with open(self.cursor_path) as f:
+                cursor = json.load(f)
+            return int(cursor["segment"]), int(cursor["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _save_cursor(self) -> None:
+        tmp_path = self.cursor_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": self._read_segment, "offset": self._read_offset}, f)
+        os.replace(tmp_path, self.cursor_path)
+
+    def _remove(self, number: int) -> None:
+        # Caller holds the lock (or is __init__)
+        if self._writer is not None and number == self._segments[-1]:
+            self._writer.close()
+            self._writer = None
+        try:
+            os.remove(self._path(number))
+        except FileNotFoundError:
+            pass
+        self._segments.remove(number)
+        del self._sizes[number]
+
+    def append(self, kind: int, record: dict[str, Any]) -> None:
+        body = json.dumps(record, separators=(",", ":")).encode()
+        data = _HEADER.pack(len(body), zlib.crc32(body), kind) + body
+        with self._lock:
+            if not self._segments or self._sizes[self._segments[-1]] + len(data) > self.segment_bytes:
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                number = max(self._segments[-1] + 1 if self._segments else 0, self._read_segment)
+                self._segments.append(number)
+                self._sizes[number] = 0
+            number = self._segments[-1]
+            if self._writer is None:
+                self._writer = open(self._path(number), "ab")
+            self._writer.write(data)
+            # Flushed to the OS only, an fsync per record would wear out the SD card
+            self._writer.flush()
+            self._sizes[number] += len(data)
+            while sum(self._sizes.values()) > self.max_bytes and len(self._segments) > 1:
+                oldest = self._segments[0]
+                self.dropped_bytes += self._sizes[oldest] - (self._read_offset if oldest == self._read_segment else 0)
+                self._remove(oldest)
+                if oldest >= self._read_segment:
+                    self._read_segment, self._read_offset = self._segments[0], 0
+                    self._peek_end = (self._read_segment, self._read_offset)
+
+    def peek(self, limit: int) -> list[tuple[int, dict[str, Any]]]:
+        """Up to `limit` (kind, record) pairs from the read position, oldest first. Nothing is removed."""
+        records = []
+        with self._lock:
+            segment, offset = self._read_segment, self._read_offset
+            for number in [n for n in self._segments if n >= segment]:
+                if number != segment:
+                    segment, offset = number, 0
+                with open(self._path(number), "rb") as f:
+                    f.seek(offset)
+                    while len(records) < limit:
+                        header = f.read(_HEADER.size)
+                        if len(header) < _HEADER.size:
+                            break
+                        length, crc, kind = _HEADER.unpack(header)
+                        body = f.read(length)
+                        if len(body) < length or zlib.crc32(body) != crc:
+                            # Corrupt on disk, give up on the rest of this segment
+                            offset = self._sizes[number]
+                            break
+                        offset += _HEADER.size + length
+                        records.append((kind, json.loads(body)))
+                if len(records) >= limit:
+                    break
+            self._peek_end = (segment, offset)
+        return records
+
+    def commit(self) -> None:
+        """Marks everything returned by the last `peek` as delivered."""
+        with self._lock:
+            segment, offset = self._peek_end
+            if (segment, offset) == (self._read_segment, self._read_offset):
+                return
+            self._read_segment, self._read_offset = segment, offset
+            for number in [n for n in self._segments if n < segment]:
+                self._remove(number)
+            if self._segments == [segment] and offset >= self._sizes[segment]:
+                # Fully drained, start the next outage on a fresh segment
+                self._remove(segment)
+                self._read_segment, self._read_offset = segment + 1, 0
+                self._peek_end = (self._read_segment, self._read_offset)
+            self._save_cursor()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
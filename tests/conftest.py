@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """A Backend working in an empty directory, never connected to a broker."""
+    from backend.dashboard_backend import Backend
+    monkeypatch.chdir(tmp_path)
+    return Backend()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """TestClient of a fresh app working in an empty directory, no broker needed."""
+    from fastapi.testclient import TestClient
+    from backend.dashboard_backend import create_app
+    monkeypatch.chdir(tmp_path)
+    with TestClient(create_app()) as client:
+        yield client
@@ -0,0 +1,71 @@
+import os
+
+
+def add_logs(client, count):
+    client.app.state.backend.logs.extend({"origin": "a", "level": "I", "message": str(i)} for i in range(count))
+
+
+def test_logs_since_pages_without_gaps(client):
+    add_logs(client, 3)
+    first = client.get("/api/logs", params={"since": 0, "limit": 5}).json()
+    assert [log["message"] for log in first["logs"]] == ["0", "1", "2"] and first["seq"] == 3
+
+    add_logs(client, 2)
+    update = client.get("/api/logs", params={"since": first["seq"], "limit": 5}).json()
+    assert (update["reset"], update["seq"], len(update["logs"])) == (False, 5, 2)
+
+
+def test_logs_since_resets_when_more_arrived_than_limit(client):
+    add_logs(client, 2)
+    add_logs(client, 10)
+    update = client.get("/api/logs", params={"since": 2, "limit": 4}).json()
+    assert update["reset"] is True
+    assert [log["seq"] for log in update["logs"]] == [9, 10, 11, 12]
+
+
+def test_profiler_rejects_bad_rates(client):
+    for hz in (-5, 0, "fast", True, 10 ** 6):
+        response = client.post("/api/profiler", json={"enabled": True, "hz": hz})
+        assert response.status_code == 400 and "error" in response.json()
+    assert not client.app.state.backend.profiler.running
+    assert client.post("/api/profiler", json={"enabled": True, "hz": 50}).json()["running"]
+    assert not client.post("/api/profiler", json={"enabled": False}).json()["running"]
+
+
+class RecordingMqtt:
+    def __init__(self):
+        self.subscribed = []
+        self.published = []
+
+    def subscribe(self, topic):
+        self.subscribed.append(topic)
+
+    def publish(self, topic, payload):
+        self.published.append(topic)
+
+
+def test_creating_the_app_has_no_side_effects(tmp_path, monkeypatch):
+    from backend.dashboard_backend import create_app
+    monkeypatch.chdir(tmp_path)
+    app = create_app()
+    assert not hasattr(app.state, "backend")
+    assert os.listdir(tmp_path) == []
+
+
+def test_api_answers_without_a_broker(client):
+    # Nothing listens on the broker port here, the connection is retried in the background
+    assert not client.app.state.backend.mqtt_client.is_connected()
+    assert client.get("/api/nodes").json() == []
+
+
+def test_startup_logs_are_published_once_connected(backend):
+    assert backend._startup_logs  # the MAC table was missing
+    mqtt = RecordingMqtt()
+    backend.on_connect(mqtt, None, {}, 0)
+    assert mqtt.subscribed == ["node/+/ack", "node/+/status", "node/+/log", "node/+/history"]
+    assert mqtt.published and set(mqtt.published) == {"node/backend/log"}
+
+    # A reconnect subscribes again but does not repeat the startup logs
+    reconnected = RecordingMqtt()
+    backend.on_connect(reconnected, None, {}, 0)
+    assert reconnected.subscribed == mqtt.subscribed and reconnected.published == []
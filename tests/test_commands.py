@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.mark.parametrize("payload", [b'[]', b'"x"', b'5', b'{"id": []}', b'not json'])
+def test_malformed_ack_is_counted_not_raised(backend, payload):
+    backend.on_ack("node/a/ack", payload)
+    assert 'pinest_mqtt_errors_total{kind="ack"} 1' in backend.mqtt_errors.render()
+
+
+def test_ack_finishes_command(backend):
+    command = backend.dispatch_command("reboot", [], {"a"})
+    backend.on_ack("node/a/ack", ('{"id": "%s", "ok": true}' % command.id).encode())
+    assert command.results == {"a": {"ok": True}}
+    assert len(backend.commands) == 0
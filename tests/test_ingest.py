@@ -0,0 +1,58 @@
+from backend.dashboard_backend import NODE_OFFLINE_TIMEOUT, OFFLINE_INTERVAL_FACTOR, offline_timeout
+from backend.ingest import IngestPipeline
+
+
+def test_bad_log_payload_only_drops_itself(backend):
+    backend.apply_batch([], [
+        ("node/a/log", b'{"origin": "a", "message": "first"}'),
+        ("node/b/log", b'[1]'),
+        ("node/c/log", b'{"origin": "c", "message": "last"}'),
+    ])
+    assert [entry["message"] for entry in backend.logs.query(limit=10)] == ["first", "last"]
+    assert len(backend.archive) == 2
+
+
+def test_queued_partial_statuses_are_merged(backend):
+    backend.ingest.submit("node/a/status", b'{"uid": "a", "cpu": 10, "temp": 40, "last_seen": "2024-01-01T00:00:00"}')
+    backend.ingest.drain()
+    backend.ingest.submit("node/a/status", b'{"uid": "a", "cpu": 90, "last_seen": "2024-01-01T00:00:01"}')
+    backend.ingest.submit("node/a/status", b'{"uid": "a", "temp": 70, "last_seen": "2024-01-01T00:00:02"}')
+    backend.ingest.drain()
+    node = backend.nodes.get("a")
+    assert (node.cpu, node.temp, node.last_seen) == (90, 70, "2024-01-01T00:00:02")
+    assert backend.ingest.coalesced == 1
+
+
+def test_bad_status_only_drops_itself(backend):
+    backend.apply_batch([
+        ("node/a/status", b'{"uid": "a", "cpu": 10, "last_seen": "2024-01-01T00:00:00"}'),
+        ("node/b/status", b'{"uid": "b", "cpu": "high", "last_seen": "2024-01-01T00:00:00"}'),
+        ("node/c/status", b'{"cpu": 10, "last_seen": "2024-01-01T00:00:00"}'),
+        ("node/d/status", b'{"uid": "d", "cpu": 20, "last_seen": "2024-01-01T00:00:00"}'),
+    ], [
+        ("node/a/log", b'{"origin": "a", "message": "kept"}'),
+    ])
+    assert sorted(record.uid for record in backend.nodes.records()) == ["a", "d"]
+    assert len(backend.liveness) == 2
+    assert [entry["message"] for entry in backend.logs.query(limit=10)] == ["kept"]
+
+
+def test_status_backlog_per_topic_is_bounded():
+    batches = []
+    pipeline = IngestPipeline(lambda statuses, logs: batches.append(statuses), status_backlog=3)
+    for i in range(5):
+        pipeline.submit("node/a/status", b"%d" % i)
+    pipeline.submit("node/b/status", b"b")
+    assert len(pipeline) == 4
+    assert pipeline.dropped["status"] == 2
+    pipeline.drain()
+    assert batches == [[("node/a/status", b"2"), ("node/a/status", b"3"), ("node/a/status", b"4"), ("node/b/status", b"b")]]
+    assert len(pipeline) == 0
+
+
+def test_offline_timeout_follows_advertised_interval():
+    assert offline_timeout({"interval": 60}) == 60 * OFFLINE_INTERVAL_FACTOR
+    # Never below the default, and nodes that don't advertise (or garble) an interval get the default
+    assert offline_timeout({"interval": 0.5}) == NODE_OFFLINE_TIMEOUT
+    assert offline_timeout({}) == NODE_OFFLINE_TIMEOUT
+    assert offline_timeout({"interval": "soon"}) == NODE_OFFLINE_TIMEOUT
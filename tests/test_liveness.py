@@ -0,0 +1,30 @@
+from backend.liveness import OFFLINE, REMOVED, LivenessTracker
+
+
+def test_offline_then_removed():
+    tracker = LivenessTracker(offline_timeout=5, removal_timeout=60)
+    tracker.touch("a", 100)
+    assert tracker.expire(104) == []
+    assert tracker.expire(105) == [("a", 100, OFFLINE)]
+    assert tracker.expire(159) == []
+    assert tracker.expire(160) == [("a", 100, REMOVED)]
+    assert len(tracker) == 0 and tracker.pending == 0
+
+
+def test_newer_status_makes_old_deadlines_stale():
+    tracker = LivenessTracker(offline_timeout=5, removal_timeout=60)
+    tracker.touch("a", 100)
+    tracker.touch("a", 103)
+    tracker.touch("a", 101)  # older than what was seen, ignored
+    assert tracker.pending == 2
+    assert tracker.expire(107) == []
+    assert tracker.pending == 1
+    assert tracker.expire(108) == [("a", 103, OFFLINE)]
+
+
+def test_per_status_timeout_overrides_default():
+    tracker = LivenessTracker(offline_timeout=5, removal_timeout=600)
+    tracker.touch("slow", 100, offline_timeout=75)
+    tracker.touch("fast", 100)
+    assert tracker.expire(150) == [("fast", 100, OFFLINE)]
+    assert tracker.expire(175) == [("slow", 100, OFFLINE)]
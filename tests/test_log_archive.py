@@ -0,0 +1,43 @@
+import os
+
+from backend.log_archive import LogArchive
+
+
+def log(ts, message):
+    return ts, {"origin": "node", "level": "I", "message": message}
+
+
+def search(archive, query):
+    return [record["message"] for block in archive.search(query) for record in block]
+
+
+def test_torn_block_does_not_shift_later_blocks(tmp_path):
+    archive = LogArchive(str(tmp_path))
+    archive.append([log(10, "alpha")])
+    archive.flush()
+    archive.append([log(20, "beta")])
+    archive.flush()
+    # Crash after the token line of the second block was written, before its index entry
+    idx_path = os.path.join(str(tmp_path), "0.idx")
+    with open(idx_path, "rb+") as f:
+        f.truncate(os.path.getsize(idx_path) // 2)
+
+    archive = LogArchive(str(tmp_path))
+    archive.append([log(30, "gamma")])
+    archive.flush()
+    assert search(archive, "gamma") == ["gamma"]
+    assert search(archive, "alpha") == ["alpha"]
+    assert search(archive, "beta") == []
+
+
+def test_torn_token_line_is_skipped_by_readers(tmp_path):
+    archive = LogArchive(str(tmp_path))
+    archive.append([log(10, "alpha")])
+    archive.flush()
+    with open(os.path.join(str(tmp_path), "0.tok"), "a") as f:
+        f.write('{"block": 1, "tok\n')  # torn line the writer has not cut off yet
+    reader = LogArchive(str(tmp_path))
+    assert search(reader, "alpha") == ["alpha"]
+    archive.append([log(20, "beta")])
+    archive.flush()
+    assert search(LogArchive(str(tmp_path)), "beta") == ["beta"]
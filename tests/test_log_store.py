@@ -0,0 +1,37 @@
+from backend.log_store import LogStore
+
+
+def entry(message, level="I", origin="a"):
+    return {"message": message, "level": level, "origin": origin}
+
+
+def messages(entries):
+    return [e["message"] for e in entries]
+
+
+def test_ring_wraps_and_keeps_sequence_numbers():
+    store = LogStore(capacity=3)
+    stored = store.extend(entry(str(i)) for i in range(5))
+    assert [e["seq"] for e in stored] == [1, 2, 3, 4, 5]
+    assert len(store) == 3 and store.last_seq == 5
+    assert messages(store.query(limit=10)) == ["2", "3", "4"]
+
+
+def test_level_and_origin_filters():
+    store = LogStore(capacity=4)
+    store.extend([entry("d", "D", "a"), entry("w", "W", "b"), entry("e", "E", "a"),
+                  entry("i", "I", "b"), entry("x", "?", "c")])  # evicts "d"; an unknown level counts as INFO
+    assert messages(store.query(min_level="W")) == ["w", "e"]
+    assert messages(store.query(origin="b")) == ["w", "i"]
+    assert messages(store.query(origin="a", min_level="E")) == ["e"]
+    assert messages(store.query(min_level="I", origin="c")) == ["x"]
+    assert store.query(origin="nobody") == []
+
+
+def test_since_and_limit():
+    store = LogStore(capacity=10)
+    store.extend(entry(str(i)) for i in range(6))
+    assert messages(store.query(since=4)) == ["4", "5"]
+    assert messages(store.query(limit=2)) == ["4", "5"]
+    assert store.query(since=6) == []
+    assert store.query(limit=0) == []
@@ -0,0 +1,58 @@
+import json
+import os
+
+from backend.mac_table import MacTable
+
+
+def test_updates_survive_a_restart_through_the_journal(tmp_path):
+    path = os.path.join(str(tmp_path), "mac_table.json")
+    table = MacTable(path)
+    assert table.load() == []
+    table.start()
+    table["aa"] = "Node-A"
+    table["bb"] = "Node-B"
+    table["aa"] = "Kitchen"
+    table.close()
+    assert not os.path.exists(path)  # nothing compacted yet, all of it is in the journal
+
+    restored = MacTable(path)
+    assert restored.load() == []
+    assert dict(restored.items()) == {"aa": "Kitchen", "bb": "Node-B"}
+
+
+def test_torn_journal_record_is_skipped_and_compacted_away(tmp_path):
+    path = os.path.join(str(tmp_path), "mac_table.json")
+    with open(path, "w") as f:
+        json.dump({"aa": "Node-A"}, f)
+    with open(path + ".journal", "w") as f:
+        f.write('["bb", "Node-B"]\n["cc", "No')  # power cut mid-append
+
+    table = MacTable(path)
+    warnings = table.load()
+    assert len(warnings) == 1 and "corrupt" in warnings[0]
+    assert dict(table.items()) == {"aa": "Node-A", "bb": "Node-B"}
+    # Folded into a fresh snapshot, new records are never appended after the torn one
+    assert os.path.getsize(path + ".journal") == 0
+    with open(path) as f:
+        assert json.load(f) == {"aa": "Node-A", "bb": "Node-B"}
+
+
+def test_journal_is_compacted_into_the_snapshot(tmp_path):
+    path = os.path.join(str(tmp_path), "mac_table.json")
+    table = MacTable(path, compact_after=3)
+    table.load()
+    for i in range(4):
+        table[f"m{i}"] = f"Node-{i}"
+    table.close()  # writes one batch of 4 records, past compact_after
+    with open(path) as f:
+        assert len(json.load(f)) == 4
+    assert os.path.getsize(path + ".journal") == 0
+
+
+def test_bad_snapshot_starts_empty_with_a_warning(tmp_path):
+    path = os.path.join(str(tmp_path), "mac_table.json")
+    with open(path, "w") as f:
+        f.write("[1, 2]")
+    table = MacTable(path)
+    assert table.load() == [f"{path} is not a dict, resetting table"]
+    assert len(table) == 0
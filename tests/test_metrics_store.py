@@ -0,0 +1,79 @@
+from backend.metrics_store import MetricsStore
+
+
+def test_restart_keeps_open_buckets(tmp_path):
+    store = MetricsStore(str(tmp_path))
+    for i in range(30):
+        store.append("node", 7200 + i, {"cpu": 10, "temp": 40})
+    store.close()
+
+    store = MetricsStore(str(tmp_path))
+    for i in range(30, 60):
+        store.append("node", 7200 + i, {"cpu": 90, "temp": 40})
+    store.append("node", 7200 + 3600, {"cpu": 0, "temp": 0})  # closes the hour
+    store.flush()
+
+    hour = store.query("node", 7200, 7200, step=3600)
+    assert hour["points"] == [[7200, 50.0, 40.0]]
+    minute = store.query("node", 7200, 7200, step=60)
+    assert minute["points"] == [[7200, 50.0, 40.0]]
+
+
+def test_closed_state_is_taken_over_once(tmp_path):
+    store = MetricsStore(str(tmp_path))
+    store.append("node", 60, {"cpu": 10})
+    store.close()
+    MetricsStore(str(tmp_path))  # restores and forgets the saved buckets
+    store = MetricsStore(str(tmp_path))
+    assert store.query("node", 0, 3600, step=60)["points"] == []
+
+
+def test_backfill_buckets_span_replay_batches(tmp_path):
+    store = MetricsStore(str(tmp_path))
+    samples = [(7200 + i, {"cpu": 10 if i < 50 else 90, "temp": 40}) for i in range(100)]
+    store.backfill("node", samples[:50])
+    store.backfill("node", samples[50:])
+    store.close()
+
+    store = MetricsStore(str(tmp_path))
+    assert store.query("node", 7200, 7200, step=3600)["points"] == [[7200, 50.0, 40.0]]
+    minutes = store.query("node", 7200, 7260, step=60)["points"]
+    assert minutes == [[7200, round((50 * 10 + 10 * 90) / 60, 2), 40.0], [7260, 90.0, 40.0]]
+    assert len(store.query("node", 7200, 7299, step=1)["points"]) == 100
+
+
+def test_clock_going_back_after_restart_keeps_rows_sorted(tmp_path):
+    store = MetricsStore(str(tmp_path))
+    for ts in (100, 101, 102):
+        store.append("node", ts, {"cpu": ts})
+    store.flush()  # then a power cut, the open bucket is lost
+
+    store = MetricsStore(str(tmp_path))
+    for ts in (50, 51, 103, 104):  # a Pi without RTC boots with an old clock first
+        store.append("node", ts, {"cpu": ts})
+    store.flush()
+    assert [point[0] for point in store.query("node", 0, 200, step=1)["points"]] == [100, 101, 103, 104]
+
+
+def test_query_does_not_hold_the_store_lock_while_reading(tmp_path, monkeypatch):
+    import threading
+
+    from backend import metrics_store
+
+    store = MetricsStore(str(tmp_path))
+    for ts in range(100, 200):
+        store.append("node", ts, {"cpu": 1})
+    store.flush()
+    appended = threading.Event()
+    read = metrics_store.Partition.read
+
+    def slow_read(self, *args):
+        # An append from the ingest worker while the query is on disk
+        worker = threading.Thread(target=lambda: (store.append("node", 300, {"cpu": 1}), appended.set()))
+        worker.start()
+        worker.join(2)
+        return read(self, *args)
+
+    monkeypatch.setattr(metrics_store.Partition, "read", slow_read)
+    store.query("node", 100, 200, step=1)
+    assert appended.is_set()
@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+
+from common import LogLevel
+from node import PiNode
+from node.collector import MetricsCollector, Sampler
+from node.outbox import STATUS, Outbox
+
+
+class FlakyClient:
+    """Stands in for paho: the first loop() raises like a failing callback would."""
+
+    def __init__(self, node):
+        self.node = node
+        self.loops = 0
+
+    def connect_async(self, *args):
+        pass
+
+    def reconnect(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def publish(self, *args, **kwargs):
+        pass
+
+    def loop(self, timeout=1.0):
+        self.loops += 1
+        if self.loops == 1:
+            raise KeyError("timestamp")
+        self.node.running = False
+        return mqtt.MQTT_ERR_SUCCESS
+
+
+def test_callback_error_does_not_end_network_loop():
+    node = PiNode()
+    node.client = FlakyClient(node)
+    node.running = True
+    node._network_loop()
+    assert node.client.loops == 2
+
+
+class StubSampler(Sampler):
+    def __init__(self):
+        self.cpu = 10.0
+
+    def sample(self):
+        return {"cpu": self.cpu}
+
+
+class RecordingClient:
+    def __init__(self):
+        self.published = []
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload, *args, **kwargs):
+        self.published.append(json.loads(payload))
+
+
+def publish_when_due(node):
+    node._last_status = time.monotonic() - node.status_interval
+    assert node.publish_status()
+    return node.client.published[-1]
+
+
+def test_status_interval_backs_off_while_stable():
+    sampler = StubSampler()
+    node = PiNode(heartbeat_interval=2, max_heartbeat_interval=16,
+                  collector=MetricsCollector(samplers=[sampler], full_every=1000))
+    node.client = RecordingClient()
+    node.server_online = True
+    assert [publish_when_due(node)["interval"] for _ in range(4)] == [4, 8, 16, 16]
+    # Nothing changed and the keepalive is not due, so nothing is sent
+    assert not node.publish_status()
+
+    sampler.cpu = 50.0
+    status = publish_when_due(node)
+    assert (status["cpu"], status["interval"]) == (50.0, 2)
+
+    # A busy backend's recommendation is a floor for the rate
+    node.server_interval = 5
+    sampler.cpu = 90.0
+    assert publish_when_due(node)["interval"] == 5
+
+
+class CommandClient:
+    """Stands in for paho: each network thread gets the next command from inside loop(), like on_message would."""
+
+    def __init__(self, node, *actions):
+        self.node = node
+        self.actions = list(actions)
+        self.network_threads = set()
+        self.disconnects = 0
+
+    def connect_async(self, *args):
+        pass
+
+    def reconnect(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def disconnect(self):
+        self.disconnects += 1
+
+    def publish(self, *args, **kwargs):
+        pass
+
+    def loop(self, timeout=1.0):
+        thread = threading.current_thread()
+        if thread not in self.network_threads and self.actions:
+            self.node.actions[self.actions.pop(0)][0]()
+        self.network_threads.add(thread)
+        time.sleep(0.01)
+        return mqtt.MQTT_ERR_SUCCESS
+
+
+def run_node(node, timeout=10):
+    runner = threading.Thread(target=node.run, daemon=True)
+    runner.start()
+    runner.join(timeout)
+    assert not runner.is_alive()
+
+
+def test_restart_command_restarts_from_run_loop():
+    node = PiNode(heartbeat_interval=0.05)
+    node.client = CommandClient(node, "restart", "shutdown")
+    run_node(node)
+    assert len(node.client.network_threads) == 2
+    assert node.client.disconnects == 2
+    assert not node.running
+
+
+def test_shutdown_command_stops_run():
+    node = PiNode(heartbeat_interval=0.05)
+    node.client = CommandClient(node, "shutdown")
+    run_node(node)
+    assert node.client.disconnects == 1
+    assert not node._network_thread.is_alive()
+
+
+def test_outbox_drops_are_reported_once_the_backend_is_back(tmp_path):
+    node = PiNode()
+    node.client = RecordingClient()
+    node.registered = True
+    node.outbox = Outbox(str(tmp_path), max_bytes=2048, segment_bytes=512)
+    for i in range(100):
+        node.outbox.append(STATUS, {"uid": node.uid, "cpu": i})
+    warnings = []
+    node.log = lambda message, level=LogLevel.INFO: warnings.append(message) if level == LogLevel.WARNING else None
+
+    heartbeat = SimpleNamespace(payload=json.dumps({"timestamp": time.time()}).encode())
+    node.on_server_heartbeat(None, None, heartbeat)
+    assert len(warnings) == 1 and "Outbox was full" in warnings[0]
+    assert node.outbox.dropped_bytes == 0
+
+    # Reported once, not on every later heartbeat or reconnect
+    node.server_online = False
+    node.on_server_heartbeat(None, None, heartbeat)
+    assert len(warnings) == 1
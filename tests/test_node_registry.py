@@ -0,0 +1,54 @@
+from backend.node_registry import NodeRegistry
+
+
+def status(uid, **values):
+    return {"uid": uid, "last_seen": "2024-01-01T00:00:00", "last_seen_ts": 100.0, **values}
+
+
+def test_partial_statuses_keep_earlier_fields():
+    nodes = NodeRegistry()
+    nodes.update_many([status("a", name="Kitchen", cpu=10, temp=40)])
+    stored, = nodes.update_many([status("a", temp=55)])
+    assert (stored["name"], stored["cpu"], stored["temp"]) == ("Kitchen", 10, 55)
+    assert nodes.version == 2
+
+
+def test_changes_since_reports_changed_and_removed():
+    nodes = NodeRegistry()
+    nodes.update_many([status("a"), status("b"), status("c")])
+    cursor = nodes.version
+    nodes.update_many([status("b", cpu=5)])
+    assert nodes.remove("c")
+    version, changed, removed = nodes.changes_since(cursor)
+    assert version == 5
+    assert [node["uid"] for node in changed] == ["b"] and removed == ["c"]
+    assert nodes.changes_since(version) == (5, [], [])
+
+
+def test_stale_offline_and_remove_are_ignored():
+    nodes = NodeRegistry()
+    nodes.update_many([status("a", last_seen_ts=200.0)])
+    assert nodes.mark_offline("a", 150.0) is None  # seen again after the deadline was set
+    assert nodes.mark_offline("a", 200.0)["status"] == "offline"
+    assert nodes.mark_offline("a", 200.0) is None
+    assert not nodes.remove("a", 150.0)
+    assert nodes.remove("a", 200.0) and "a" not in nodes
+
+
+def test_old_tombstones_are_pruned_and_move_the_horizon():
+    nodes = NodeRegistry(tombstone_ttl=0)
+    nodes.update_many([status("a"), status("b")])
+    nodes.remove("a")
+    assert nodes.horizon == 3
+    assert nodes.changes_since(0)[2] == []
+    nodes.update_many([status("a")])  # back again, no tombstone left to clear
+    assert "a" in nodes
+
+
+def test_nodes_since_older_than_horizon_resets(client):
+    nodes = client.app.state.backend.nodes
+    nodes.tombstone_ttl = 0
+    nodes.update_many([status("a"), status("b")])
+    nodes.remove("a")
+    assert client.get("/api/nodes", params={"since": 2}).json()["reset"] is True
+    assert client.get("/api/nodes", params={"since": 3}).json()["reset"] is False
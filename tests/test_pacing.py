@@ -0,0 +1,31 @@
+from backend.pacing import IntervalAdvisor
+
+
+def test_interval_grows_under_load_up_to_max():
+    advisor = IntervalAdvisor(min_interval=2, max_interval=10, step=2)
+    assert advisor.update(busy_seconds=1.8, elapsed=2, queued=0) == 4
+    assert advisor.busy == 0.9
+    assert advisor.update(busy_seconds=1.8, elapsed=2, queued=0) == 8
+    assert advisor.update(busy_seconds=1.8, elapsed=2, queued=0) == 10
+
+
+def test_backlog_alone_slows_nodes_down():
+    advisor = IntervalAdvisor(min_interval=2, backlog=100, step=2)
+    assert advisor.update(busy_seconds=0, elapsed=2, queued=101) == 4
+
+
+def test_interval_shrinks_back_to_min_when_idle():
+    advisor = IntervalAdvisor(min_interval=2, max_interval=30, target_busy=0.5, step=2)
+    advisor.interval = 16
+    # Between half the target and the target the interval holds
+    assert advisor.update(busy_seconds=0.8, elapsed=2, queued=0) == 16
+    assert advisor.update(busy_seconds=0, elapsed=2, queued=0) == 8
+    for _ in range(5):
+        advisor.update(busy_seconds=0, elapsed=2, queued=0)
+    assert advisor.interval == 2
+
+
+def test_empty_period_keeps_the_interval():
+    advisor = IntervalAdvisor()
+    advisor.interval = 6
+    assert advisor.update(busy_seconds=1, elapsed=0, queued=5000) == 6
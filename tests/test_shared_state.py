@@ -0,0 +1,48 @@
+import os
+
+from backend.log_store import LogStore
+from backend.node_registry import NodeRegistry
+from backend.shared_state import SharedMacTable, SharedState, SharedWriter, StateMirror
+
+
+def test_writes_are_queued_and_committed_in_the_background(tmp_path):
+    path = os.path.join(str(tmp_path), "state.db")
+    shared = SharedState(path)
+    writer = SharedWriter(path)
+    table = SharedMacTable(shared, writer)
+    writer.start()
+    # The leader holds the write lock, queueing must not wait for it
+    shared._db.execute("BEGIN IMMEDIATE")
+    table["aa:bb"] = "Node-ABC"
+    writer.put_command("c1", 1.0, {"id": "c1"})
+    assert table["aa:bb"] == "Node-ABC"  # this worker sees its queued update right away
+    assert shared.mac_get("aa:bb") is None
+    shared._db.execute("COMMIT")
+
+    writer.close()
+    assert shared.mac_get("aa:bb") == "Node-ABC"
+    assert shared.get_command("c1") == {"id": "c1"}
+    assert writer.pending == 0
+    assert len(table) == 1
+    other = SharedMacTable(SharedState(path), SharedWriter(path))
+    assert other.get("aa:bb") == "Node-ABC"
+
+
+def test_removed_node_rows_are_deleted_once_the_tombstone_is_pruned(tmp_path):
+    shared = SharedState(os.path.join(str(tmp_path), "state.db"))
+    nodes = NodeRegistry()
+    mirror = StateMirror(shared, nodes, LogStore())
+
+    def removal_rows():
+        return shared._db.execute("SELECT uid FROM nodes WHERE data IS NULL ORDER BY uid").fetchall()
+
+    nodes.update_many([{"uid": uid, "last_seen_ts": 100.0} for uid in ("a", "b", "c")])
+    nodes.remove("a")
+    mirror.push()
+    assert removal_rows() == [("a",)]
+    # Followers still need the row to learn about the removal until the tombstone ages out
+    nodes._removed_at["a"] -= nodes.tombstone_ttl
+    nodes.remove("b")
+    mirror.push()
+    assert removal_rows() == [("b",)]
+    assert [(uid, data is None) for _, uid, data in shared.read_nodes(0)[1]] == [("c", False), ("b", True)]
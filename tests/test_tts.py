@@ -0,0 +1,145 @@
+import io
+import os
+import threading
+import time
+import wave
+from functools import partial
+
+import pytest
+
+from backend.tts import StubModel, TtsService, load_model, wav_header
+
+
+@pytest.fixture
+def voice(tmp_path):
+    path = os.path.join(str(tmp_path), "default.wav")
+    with open(path, "wb") as f:
+        f.write(wav_header(16000, 0))
+    return path
+
+
+def started(factory, **kwargs):
+    service = TtsService(factory, **kwargs)
+    service.start()
+    deadline = time.monotonic() + 5
+    while not service.ready and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert service.ready, service.error
+    return service
+
+
+def test_stub_audio_is_cached(voice):
+    service = started(partial(load_model, "stub"))
+    try:
+        first = b"".join(service.synthesize("hello  there", voice))
+        assert len(first) == 2 * 2 * StubModel.sample_rate // 10  # two words, 0.1 s of 16-bit samples each
+        again = b"".join(service.synthesize("hello there", voice))  # same text once whitespace is normalized
+        assert again == first
+        assert (service.hits, service.misses, service.cached_bytes) == (1, 1, len(first))
+        b"".join(service.synthesize("hello there", voice, language="de"))
+        assert (service.hits, service.misses) == (1, 2)
+    finally:
+        service.stop()
+
+
+def test_wav_header_describes_the_stream():
+    pcm = b"\x00\x01" * 800
+    with wave.open(io.BytesIO(wav_header(16000, len(pcm)) + pcm)) as audio:
+        assert (audio.getnchannels(), audio.getsampwidth(), audio.getframerate(), audio.getnframes()) == (1, 2, 16000, 800)
+    streaming = wav_header(24000)
+    assert len(streaming) == 44 and streaming[40:44] == b"\xff\xff\xff\xff"
+
+
+class GatedModel(StubModel):
+    """Produces one chunk per word, each only once the test lets it."""
+
+    def __init__(self):
+        self.gate = threading.Semaphore(0)
+        self.produced = 0
+
+    def stream(self, text, language, speaker):
+        for chunk in super().stream(text, language, speaker):
+            self.gate.acquire()
+            self.produced += 1
+            yield chunk
+
+
+def test_closing_the_stream_cancels_the_job(voice):
+    model = GatedModel()
+    service = started(lambda: model)
+    try:
+        stream = service.synthesize("one two three four", voice)
+        model.gate.release()
+        assert next(stream)
+        stream.close()
+        model.gate.release(2)  # the word in progress when the cancel is noticed, then "five"
+        assert len(b"".join(service.synthesize("five", voice))) == 2 * StubModel.sample_rate // 10
+        assert model.produced == 3
+        # Only "five" is cached, not the partial audio of the cancelled job
+        assert service.cached_bytes == 2 * StubModel.sample_rate // 10
+    finally:
+        service.stop()
+
+
+def test_stop_fails_queued_jobs(voice):
+    model = GatedModel()
+    service = started(lambda: model)
+    running = service.synthesize("one two", voice)
+    model.gate.release()
+    assert next(running)
+    errors = []
+
+    def speak():
+        try:
+            b"".join(service.synthesize("three", voice))
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    queued = threading.Thread(target=speak, daemon=True)
+    queued.start()
+    while not len(service):
+        time.sleep(0.01)
+
+    stopper = threading.Thread(target=service.stop)
+    stopper.start()
+    queued.join(5)
+    assert not queued.is_alive() and errors == ["Synthesis failed: TTS service stopped"]
+    model.gate.release()  # lets the running job finish
+    stopper.join(5)
+    assert not stopper.is_alive()
+    with pytest.raises(RuntimeError):
+        next(service.synthesize("four", voice))
+
+
+def test_recording_hashes_are_bounded(tmp_path):
+    service = started(partial(load_model, "stub"), speakers=2)
+    try:
+        for i in range(5):
+            path = os.path.join(str(tmp_path), f"voice{i}.wav")
+            with open(path, "wb") as f:
+                f.write(wav_header(16000, i))
+            b"".join(service.synthesize("hi", path))
+        assert len(service._digests) == 2 and len(service._speakers) == 2
+    finally:
+        service.stop()
+
+
+def test_api_streams_stub_audio(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from backend import dashboard_backend
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dashboard_backend, "TTS_MODEL", "stub")
+    os.makedirs("voices")
+    with open(os.path.join("voices", "default.wav"), "wb") as f:
+        f.write(wav_header(16000, 0))
+    with TestClient(dashboard_backend.create_app()) as client:
+        tts = client.app.state.backend.tts
+        deadline = time.monotonic() + 5
+        while not tts.ready and time.monotonic() < deadline:
+            time.sleep(0.01)
+        response = client.post("/api/tts", json={"text": "hi there"})
+        assert response.headers["content-type"] == "audio/wav"
+        assert response.content[:4] == b"RIFF" and len(response.content) == 44 + 2 * 2 * StubModel.sample_rate // 10
+        assert "error" in client.post("/api/tts", json={"text": "hi", "speaker": "../nobody"}).json()
@@ -0,0 +1,53 @@
+import msgpack
+import pytest
+
+from common import Log, LogLevel, wire
+
+
+def as_bytes(payload):
+    return payload.encode() if isinstance(payload, str) else payload
+
+
+@pytest.mark.parametrize("encoding", [wire.JSON, wire.MSGPACK])
+def test_status_and_history_round_trip(encoding):
+    status = {"uid": "a", "cpu": 12.5, "groups": "kitchen", "last_seen": "2024-01-01T00:00:00"}
+    assert wire.decode_status(as_bytes(wire.encode_status(status, encoding))) == status
+    assert wire.decode_history(as_bytes(wire.encode_history([status, status], encoding))) == [status, status]
+    assert wire.is_compact(as_bytes(wire.encode_status(status, encoding))) == (encoding == wire.MSGPACK)
+
+
+@pytest.mark.parametrize("encoding", [wire.JSON, wire.MSGPACK])
+def test_logs_round_trip(encoding):
+    logs = [Log("a", "first", LogLevel.WARNING), Log("b", "second", LogLevel.DEBUG)]
+    for batch in (logs[:1], logs):
+        decoded = wire.decode_logs(as_bytes(wire.encode_logs(batch, encoding)))
+        assert [(d["origin"], d["level"], d["message"], d["timestamp"]) for d in decoded] == \
+            [(log.origin, log.level.value, log.message, log.timestamp) for log in batch]
+
+
+@pytest.mark.parametrize("records", [
+    [[1e20, "I", "a", "m"]],       # localtime overflows
+    [[-1, "I", "a", "m"]],
+    [[float("nan"), "I", "a", "m"]],
+    [["now", "I", "a", "m"]],
+    [[1, "I", "a"]],               # short record
+    [[1, "I", None, "m"]],
+    [{"created": 1}],
+    {"not": "a list"},
+])
+def test_bad_compact_logs_raise_value_error(records):
+    with pytest.raises(ValueError):
+        wire.decode_logs(wire.COMPACT_PREFIX + msgpack.packb(records))
+
+
+@pytest.mark.parametrize("payload", [b"{", wire.COMPACT_PREFIX + b"\xc1", b"[1, 2"])
+def test_undecodable_payloads_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        wire.decode_logs(payload)
+    with pytest.raises(ValueError):
+        wire.decode_status(payload)
+
+
+def test_history_must_be_a_list():
+    with pytest.raises(ValueError):
+        wire.decode_history(b'{"uid": "a"}')